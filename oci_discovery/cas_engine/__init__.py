@@ -0,0 +1,99 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections as _collections
+import logging as _logging
+import threading as _threading
+
+from .. import fetch_json as _fetch_json
+from . import oci_cas_template as _oci_cas_template
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+# Registry for CAS engines, based on cas-engine-protocols.md.
+CONSTRUCTORS = {
+    'oci-cas-template-v1': _oci_cas_template.Engine,
+}
+
+
+def new(protocol, **kwargs):
+    """Construct a new CAS engine from a casEngines entry.
+
+    The returned CAS engine MUST provide 'get' and 'get_chunks'
+    methods, which take a blob's 'digest' and optional 'size'
+    arguments.  'get' returns the blob's content as bytes, and
+    'get_chunks' returns an iterable of bytes which streams the
+    content.  Both MUST check the content against the digest and
+    size, raising digest.Mismatch if they do not match.
+    """
+    try:
+        constructor = CONSTRUCTORS[protocol]
+    except KeyError:
+        raise ValueError(
+            'unsupported CAS-engine protocol {!r}'.format(protocol))
+    return constructor(**kwargs)
+
+
+def from_root(root):
+    """Construct CAS engines for a Merkle root from resolve().
+
+    Engines from the root descriptor's own casEngines (relative to the
+    root's 'uri') come first, followed by the engines resolve()
+    attached from ref-engine discovery.  Unsupported or invalid
+    entries are skipped with a warning.
+    """
+    entries = []
+    descriptor = root.get('root')
+    if isinstance(descriptor, dict):
+        for config in descriptor.get('casEngines', []):
+            entries.append((config, root.get('uri')))
+    for entry in root.get('casEngines', []):
+        entries.append((entry.get('config'), entry.get('uri')))
+    engines = []
+    for config, base in entries:
+        try:
+            engines.append(new(base=base, **config))
+        except (TypeError, ValueError) as error:
+            _LOGGER.warning('skipping CAS engine {!r} ({})'.format(
+                config, error))
+    return engines
+
+
+def get_many(engine, descriptors, max_workers=4):
+    """Fetch several blobs, yielding (descriptor, content) tuples.
+
+    descriptors is an iterable of OCI descriptors, each with a
+    'digest' and (usually) a 'size'.  Up to max_workers blobs are
+    fetched at once with engine.get, and the results are yielded in
+    the order of descriptors, so at most max_workers blobs are held
+    in memory.  A failed fetch raises its error when its turn comes.
+    That, or closing the generator early, cancels the fetches still
+    running: they give up at their next request or read.
+    """
+    cancelled = _threading.Event()
+    pending = _collections.deque()
+    try:
+        for descriptor in descriptors:
+            pending.append((descriptor, _fetch_json.start(
+                engine.get, cancelled=cancelled,
+                digest=descriptor['digest'], size=descriptor.get('size'))))
+            if len(pending) >= max_workers:
+                descriptor, future = pending.popleft()
+                yield descriptor, future.result()
+        while pending:
+            descriptor, future = pending.popleft()
+            yield descriptor, future.result()
+    finally:
+        cancelled.set()
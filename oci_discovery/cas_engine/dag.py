@@ -0,0 +1,242 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Walk the Merkle DAGs below resolved roots.
+
+Image indexes point at manifests, which point at their config and
+layers.  walk() follows those descriptors from the roots that
+ref_engine_discovery.resolve() yields.
+"""
+
+import collections as _collections
+import functools as _functools
+import json as _json
+import logging as _logging
+import threading as _threading
+
+from .. import fetch_json as _fetch_json
+from . import from_root as _from_root
+from . import multi as _multi
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+INDEX_MEDIA_TYPES = {
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+}
+
+MANIFEST_MEDIA_TYPES = {
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+}
+
+# Descriptors without a mediaType are fetched to see whether they are
+# indexes or manifests if they are at most this many bytes.  Larger
+# ones are assumed to be layers.
+MAX_UNTYPED_SIZE = 4 * 1024 * 1024
+
+# Platform properties which list values.  The wanted values must be
+# a subset of the descriptor's.
+_PLATFORM_LISTS = {'os.features', 'features'}
+
+
+def platform_matches(platform, wanted):
+    """Return True if a descriptor's platform matches wanted.
+
+    wanted is a platform object like {'os': 'linux', 'architecture':
+    'arm64', 'variant': 'v8'}, and every property it sets must match.
+    Descriptors without a platform match any wanted platform.
+    """
+    if platform is None:
+        return True
+    for key, value in wanted.items():
+        if key in _PLATFORM_LISTS:
+            if not set(value).issubset(platform.get(key, [])):
+                return False
+        elif platform.get(key) != value:
+            return False
+    return True
+
+
+def children(descriptor, content):
+    """Return the descriptors which a blob's content points at.
+
+    Indexes point at their manifests, and manifests point at their
+    config and layers.  Other blobs have no children.
+    """
+    media_type = descriptor.get('mediaType')
+    if (media_type is not None and
+            media_type not in INDEX_MEDIA_TYPES | MANIFEST_MEDIA_TYPES):
+        return []
+    try:
+        parsed = _json.loads(bytes(content).decode('UTF-8'))
+    except ValueError as error:
+        if media_type is None:
+            return []  # not JSON, so probably a layer
+        raise ValueError('invalid JSON in {} ({})'.format(
+            descriptor['digest'], error))
+    if not isinstance(parsed, dict):
+        return []
+    if media_type is None:
+        media_type = parsed.get('mediaType')
+    if media_type in INDEX_MEDIA_TYPES or 'manifests' in parsed:
+        found = parsed.get('manifests', [])
+    elif media_type in MANIFEST_MEDIA_TYPES or 'layers' in parsed:
+        found = parsed.get('layers', [])
+        if 'config' in parsed:
+            found = [parsed['config']] + found
+    else:
+        return []
+    descriptors = []
+    for child in found:
+        if isinstance(child, dict) and isinstance(child.get('digest'), str):
+            descriptors.append(child)
+        else:
+            _LOGGER.warning('skipping invalid descriptor {!r} in {}'.format(
+                child, descriptor['digest']))
+    return descriptors
+
+
+def _parents(descriptor):
+    """Return True if descriptor's blob may point at other blobs."""
+    media_type = descriptor.get('mediaType')
+    if media_type is None:
+        size = descriptor.get('size')
+        return size is not None and size <= MAX_UNTYPED_SIZE
+    return media_type in INDEX_MEDIA_TYPES | MANIFEST_MEDIA_TYPES
+
+
+def _next_root(roots, seen, engine):
+    """Return the next (root, engine, descriptor) to walk, or None."""
+    for root in roots:
+        descriptor = root['root']
+        if descriptor['digest'] in seen:
+            continue
+        root_engine = engine if engine is not None else _engine(root=root)
+        if root_engine is None:
+            _LOGGER.warning('skipping {} (no CAS engines)'.format(
+                descriptor['digest']))
+            continue
+        seen.add(descriptor['digest'])
+        return (root, root_engine, descriptor)
+    return None
+
+
+def _engine(root):
+    engines = _from_root(root=root)
+    if len(engines) > 1:
+        return _multi.MultiEngine(engines=engines)
+    if engines:
+        return engines[0]
+    return None
+
+
+def walk(roots, platform=None, media_types=None, engine=None,
+         max_workers=4):
+    """Walk the blobs below roots breadth-first, yielding dicts.
+
+    roots is an iterable of Merkle roots from
+    ref_engine_discovery.resolve().  Each root descriptor's blob is
+    fetched, then the blobs it points at, and so on.  Each yielded
+    dict has:
+
+    * root, the Merkle root the blob was found below.
+    * descriptor, the blob's descriptor.
+    * content, the blob's verified content for indexes and manifests,
+      or None for other blobs (config, layers, ...).
+    * get_chunks, a function returning an iterator over the blob's
+      verified content, like a CAS engine's get_chunks().
+
+    Only indexes and manifests (and untyped blobs of at most
+    MAX_UNTYPED_SIZE bytes, which might be either) are fetched by
+    walk(), because it needs their content to find their children.
+    Other blobs are only downloaded if the caller calls get_chunks(),
+    so layers are streamed instead of held in memory.
+
+    Blobs are fetched with engine, which defaults to each root's
+    engines from cas_engine.from_root() (a multi.MultiEngine when
+    there are several).  Roots without any CAS engines are skipped
+    with a warning.  Up to max_workers blobs are fetched at once,
+    but results are yielded in breadth-first order.  roots is only
+    read when there is nothing else to fetch, so walking starts as
+    soon as the first root resolves, and stopping early leaves the
+    rest unresolved.
+
+    Each digest is only yielded once, even if it appears below
+    several roots, so shared config and layers are only downloaded
+    once.  With platform (see platform_matches()), index entries for
+    other platforms are not followed.  With media_types, descriptors
+    with other media types are neither yielded nor followed, so
+    include INDEX_MEDIA_TYPES and MANIFEST_MEDIA_TYPES to walk
+    through indexes and manifests.  Root descriptors are always
+    yielded.  A failed fetch raises its error when its turn comes.
+    That, or closing the generator early, cancels the fetches still
+    running: they give up at their next request or read.
+    """
+    roots = iter(roots)
+    seen = set()
+    queue = _collections.deque()
+    cancelled = _threading.Event()
+    pending = _collections.deque()
+    try:
+        while True:
+            while len(pending) < max_workers:
+                if not queue:
+                    item = _next_root(roots=roots, seen=seen, engine=engine)
+                    if item is None:
+                        break
+                    queue.append(item)
+                root, root_engine, descriptor = queue.popleft()
+                future = None
+                if _parents(descriptor=descriptor):
+                    future = _fetch_json.start(
+                        root_engine.get, cancelled=cancelled,
+                        digest=descriptor['digest'],
+                        size=descriptor.get('size'))
+                pending.append((root, root_engine, descriptor, future))
+            if not pending:
+                break
+            root, root_engine, descriptor, future = pending.popleft()
+            if future is None:
+                yield {
+                    'root': root,
+                    'descriptor': descriptor,
+                    'content': None,
+                    'get_chunks': _functools.partial(
+                        root_engine.get_chunks,
+                        digest=descriptor['digest'],
+                        size=descriptor.get('size')),
+                }
+                continue
+            content = future.result()
+            for child in children(descriptor=descriptor, content=content):
+                if child['digest'] in seen:
+                    continue
+                if (platform is not None and not platform_matches(
+                        platform=child.get('platform'), wanted=platform)):
+                    continue
+                if (media_types is not None and
+                        child.get('mediaType') not in media_types):
+                    continue
+                seen.add(child['digest'])
+                queue.append((root, root_engine, child))
+            yield {
+                'root': root,
+                'descriptor': descriptor,
+                'content': content,
+                'get_chunks': _functools.partial(iter, (content,)),
+            }
+    finally:
+        cancelled.set()
@@ -0,0 +1,285 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fetch blobs from the fastest of several CAS engines.
+
+A root often lists several CAS engines (see cas_engine.from_root),
+which are usually mirrors of each other.  MultiEngine learns which
+are fastest and most reliable, and fails over between them.
+"""
+
+import concurrent.futures as _futures
+import logging as _logging
+import threading as _threading
+import time as _time
+
+from .. import digest as _digest
+from .. import fetch_json as _fetch_json
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+# Blobs up to this many bytes are raced (see MultiEngine).
+SMALL_SIZE = 1024 * 1024
+
+# Successful fetches of at least this many bytes update an engine's
+# throughput.  Smaller fetches are dominated by latency.
+_MIN_THROUGHPUT_SIZE = 64 * 1024
+
+
+def _close(iterator):
+    close = getattr(iterator, 'close', None)
+    if close is not None:
+        close()
+
+
+class Stats(object):
+    """Per-engine latency, throughput and error rates.
+
+    Each is an exponentially weighted moving average, where alpha is
+    the weight of the newest observation.  Engines are identified by
+    str(engine), so stats are shared by every engine with the same
+    configuration, e.g. across roots.
+    """
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self._lock = _threading.Lock()
+        self._engines = {}
+
+    def _average(self, entry, key, value):
+        old = entry.get(key)
+        if old is None:
+            entry[key] = value
+        else:
+            entry[key] = old + self.alpha * (value - old)
+
+    def success(self, engine, latency, size=0, duration=None):
+        """Record a fetch which started arriving after latency seconds.
+
+        duration is the time the whole fetch took.
+        """
+        with self._lock:
+            entry = self._engines.setdefault(str(engine), {})
+            self._average(entry=entry, key='latency', value=latency)
+            self._average(entry=entry, key='error_rate', value=0)
+            if duration and size >= _MIN_THROUGHPUT_SIZE:
+                transfer = max(duration - latency, 1e-6)
+                self._average(
+                    entry=entry, key='throughput', value=size / transfer)
+
+    def failure(self, engine):
+        with self._lock:
+            entry = self._engines.setdefault(str(engine), {})
+            self._average(entry=entry, key='error_rate', value=1)
+
+    def get(self, engine):
+        """Return a copy of the engine's averages, or None if unknown.
+
+        The keys are 'latency' (seconds), 'throughput' (bytes per
+        second) and 'error_rate' (from zero to one), each of which
+        may be missing.
+        """
+        with self._lock:
+            entry = self._engines.get(str(engine))
+            return dict(entry) if entry is not None else None
+
+    def expected(self, engine, size=None):
+        """Return an engine's expected seconds for a blob, or None.
+
+        Engines with a higher error rate look proportionally slower,
+        and engines which have only failed are infinitely slow.  None
+        means the engine has not been tried yet.
+        """
+        entry = self.get(engine=engine)
+        if entry is None:
+            return None
+        if 'latency' not in entry:
+            return float('inf')
+        seconds = entry['latency']
+        if size and entry.get('throughput'):
+            seconds += size / entry['throughput']
+        return seconds / max(1 - entry.get('error_rate', 0), 0.1)
+
+    def clear(self):
+        with self._lock:
+            self._engines.clear()
+
+
+# Shared by every MultiEngine without its own stats, so what is
+# learned about a mirror from one root applies to the next.
+STATS = Stats()
+
+
+class MultiEngine(object):
+    """A CAS engine which fetches each blob from one of engines.
+
+    Engines are ranked by their expected time for each blob (see
+    Stats.expected).  Engines without stats come first, in their
+    given order, so new mirrors are tried and measured.
+
+    Blobs of at most small_size bytes are requested from the best
+    'race' engines at once.  The first verified response is used
+    and the others are abandoned, which hides a slow or stalled
+    mirror behind a fast one.  Larger blobs, and blobs of unknown
+    size, are requested from one engine at a time to avoid
+    duplicate downloads.  Either way, errors and digest mismatches
+    fail over to the next engine, and the last error is raised if
+    every engine fails.
+    """
+    def __init__(self, engines, stats=None, small_size=SMALL_SIZE, race=2):
+        self.engines = list(engines)
+        if not self.engines:
+            raise ValueError('MultiEngine needs at least one engine')
+        if stats is None:
+            stats = STATS
+        self.stats = stats
+        self.small_size = small_size
+        self.race = race
+
+    def __str__(self):
+        return '<{}.{} engines=[{}]>'.format(
+            self.__class__.__module__, self.__class__.__name__,
+            ', '.join(str(engine) for engine in self.engines))
+
+    def ranked(self, size=None):
+        """Return engines, best first, for a blob of size bytes."""
+        unknown = []
+        known = []
+        for i, engine in enumerate(self.engines):
+            expected = self.stats.expected(engine=engine, size=size)
+            if expected is None:
+                unknown.append(engine)
+            else:
+                known.append((expected, i, engine))
+        return unknown + [engine for _, _, engine in sorted(known)]
+
+    def _small(self, size):
+        return size is not None and size <= self.small_size
+
+    def get(self, digest, size=None):
+        ranked = self.ranked(size=size)
+        errors = []
+        if self._small(size=size) and self.race > 1 and len(ranked) > 1:
+            content = self._race(
+                engines=ranked[:self.race], digest=digest, size=size,
+                errors=errors)
+            if content is not None:
+                return content
+            ranked = ranked[self.race:]
+        for engine in ranked:
+            try:
+                return self._fetch(engine=engine, digest=digest, size=size)
+            except Exception as error:
+                self._failed(engine=engine, digest=digest, error=error)
+                errors.append(error)
+        raise errors[-1]
+
+    def get_chunks(self, digest, size=None):
+        """Stream a blob, failing over between engines.
+
+        Small blobs are raced and then yielded in one piece.  Larger
+        blobs stream from the best engine, and if it fails part way
+        through, the next engine's response resumes after the bytes
+        which were already yielded.  Everything yielded is verified
+        against digest, but content cannot be taken back once it has
+        been yielded, so a digest mismatch after the first piece is
+        raised instead of failing over.
+        """
+        if self._small(size=size):
+            yield self.get(digest=digest, size=size)
+            return
+        verifier = _digest.Verifier(digest=digest, size=size)
+        errors = []
+        for engine in self.ranked(size=size):
+            start = _time.monotonic()
+            latency = None
+            received = 0
+            iterator = engine.get_chunks(digest=digest, size=size)
+            try:
+                for chunk in iterator:
+                    if latency is None:
+                        latency = _time.monotonic() - start
+                    received += len(chunk)
+                    skip = verifier.size - (received - len(chunk))
+                    if skip > 0:
+                        chunk = chunk[skip:]
+                    if chunk:
+                        verifier.update(data=chunk)
+                        yield chunk
+            except GeneratorExit:
+                _close(iterator=iterator)
+                raise
+            except Exception as error:
+                _close(iterator=iterator)
+                self._failed(engine=engine, digest=digest, error=error)
+                if isinstance(error, _digest.Mismatch) and verifier.size:
+                    raise
+                errors.append(error)
+                continue
+            self.stats.success(
+                engine=engine, latency=latency or 0, size=received,
+                duration=_time.monotonic() - start)
+            verifier.verify()
+            return
+        raise errors[-1]
+
+    def _race(self, engines, digest, size, errors):
+        """Return the first verified content from engines, or None.
+
+        The losers are cancelled, so they give up at their next
+        request or read.
+        """
+        cancelled = _threading.Event()
+        futures = {
+            _fetch_json.start(
+                self._fetch, cancelled=cancelled, engine=engine,
+                digest=digest, size=size): engine
+            for engine in engines
+        }
+        try:
+            for future in _futures.as_completed(futures):
+                try:
+                    return future.result()
+                except Exception as error:
+                    self._failed(
+                        engine=futures[future], digest=digest, error=error)
+                    errors.append(error)
+            return None
+        finally:
+            cancelled.set()
+
+    def _fetch(self, engine, digest, size):
+        start = _time.monotonic()
+        latency = None
+        chunks = []
+        received = 0
+        iterator = engine.get_chunks(digest=digest, size=size)
+        try:
+            for chunk in iterator:
+                if latency is None:
+                    latency = _time.monotonic() - start
+                _fetch_json.check_deadline()
+                chunks.append(chunk)
+                received += len(chunk)
+        finally:
+            _close(iterator=iterator)
+        self.stats.success(
+            engine=engine, latency=latency or 0, size=received,
+            duration=_time.monotonic() - start)
+        return b''.join(chunks)
+
+    def _failed(self, engine, digest, error):
+        self.stats.failure(engine=engine)
+        _LOGGER.warning('failed to fetch {} from {} ({})'.format(
+            digest, engine, error))
@@ -0,0 +1,85 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging as _logging
+
+from .. import digest as _digest
+from .. import fetch_json as _fetch_json
+from .. import uri_template as _uri_template
+from ..fetch_json import compression as _compression
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+
+class Engine(object):
+    """A CAS engine for cas-template.md.
+
+    Relative templates are resolved against base, so it is part of
+    str(engine) too.  multi.Stats identifies engines by that, and
+    mirrors which share a relative template are different servers.
+    """
+    def __str__(self):
+        if self.base is None:
+            return '<{}.{} uri={}>'.format(
+                self.__class__.__module__,
+                self.__class__.__name__,
+                self.uri_template)
+        return '<{}.{} uri={} base={}>'.format(
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.uri_template,
+            self.base)
+
+    def __init__(self, uri, base=None):
+        self.uri_template = _uri_template.compile(uri=uri, base=base)
+        self.base = base
+
+    def uri(self, digest):
+        """Return the URI for a blob."""
+        return self.uri_template.expand(**_digest.parse(digest=digest))
+
+    def get_chunks(self, digest, size=None):
+        """Yield a blob's content in pieces as it arrives.
+
+        The content is checked against digest (and size, if set) as
+        it streams, and digest.Mismatch is raised after the last
+        piece if they do not match, or as soon as the content is
+        larger than size (without decoding more than size bytes).
+        Callers must discard the content when that happens.  Without
+        a size, blobs larger than fetch_json.MAX_SIZE are rejected
+        with fetch_json.compression.TooLarge.
+        """
+        uri = self.uri(digest=digest)
+        verifier = _digest.Verifier(digest=digest, size=size, source=uri)
+        _LOGGER.debug('fetching {} from {}'.format(digest, uri))
+        fetched = _fetch_json.fetch_chunks(uri=uri, max_size=size)
+        chunks = fetched['chunks']
+        try:
+            for chunk in chunks:
+                verifier.update(data=chunk)
+                yield chunk
+        except _compression.TooLarge as error:
+            if size is None:
+                raise
+            raise _digest.Mismatch(
+                '{} is larger than the expected {} bytes'.format(uri, size),
+            ) from error
+        finally:
+            chunks.close()
+        verifier.verify()
+
+    def get(self, digest, size=None):
+        """Return a blob's verified content, as get_chunks() does."""
+        return b''.join(self.get_chunks(digest=digest, size=size))
@@ -0,0 +1,259 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local content-addressed blob store.
+
+Blobs are stored as <path>/<algorithm>/<encoded:2>/<encoded>, the
+layout of contrib/nginx/example.com/oci-cas, so a store directory
+can also be served to others with an oci-cas-template-v1 engine.
+"""
+
+import logging as _logging
+import mmap as _mmap
+import os as _os
+import threading as _threading
+import time as _time
+import uuid as _uuid
+
+from .. import digest as _digest
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+# Temporary files from interrupted writes are removed by gc() once
+# they are this many seconds old.
+TEMPORARY_MAX_AGE = 60 * 60
+
+# Bytes yielded at a time by CachedEngine.get_chunks().
+CHUNK_SIZE = 1024 * 1024
+
+
+def _map(f):
+    """Return an open file's content as a read-only mmap (or b'')."""
+    if _os.fstat(f.fileno()).st_size:
+        return _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+    return b''
+
+
+class BlobStore(object):
+    """Blobs on disk, keyed by digest.
+
+    Blobs are only added once their content matches their digest, and
+    files are renamed into place atomically, so several processes may
+    share a directory.  Content never changes for a given digest, so
+    stored blobs never go stale.  With max_size, the least-recently
+    used blobs are removed whenever the store grows past max_size
+    bytes.
+    """
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+        self._lock = _threading.Lock()
+        self._size = None  # total blob bytes, counted by the first gc()
+
+    def __str__(self):
+        return '<{}.{} path={}>'.format(
+            self.__class__.__module__, self.__class__.__name__, self.path)
+
+    def __contains__(self, digest):
+        return _os.path.exists(self.blob_path(digest=digest))
+
+    def blob_path(self, digest):
+        parsed = _digest.parse(digest=digest)
+        return _os.path.join(
+            self.path, parsed.algorithm, parsed.encoded[:2], parsed.encoded)
+
+    def get(self, digest):
+        """Return a stored blob's content, or None if it is missing.
+
+        Content is returned as a read-only mmap, which supports len(),
+        slicing and the buffer protocol like bytes does, without
+        reading the whole blob into memory.  Callers may close() it
+        when they are done.  Empty blobs are returned as b''.
+        Reading a blob marks it as recently used.
+        """
+        path = self.blob_path(digest=digest)
+        try:
+            with open(path, 'rb') as f:
+                content = _map(f=f)
+        except FileNotFoundError:
+            return None
+        try:
+            _os.utime(path)
+        except OSError:
+            pass  # removed by a concurrent gc(), but the mmap stays valid
+        return content
+
+    def put_chunks(self, digest, chunks, size=None):
+        """Store a blob from an iterable of bytes, returning its path.
+
+        The content is hashed as it is written to a temporary file,
+        which is only renamed into place if the content matches
+        digest (and size, if set).  Otherwise the temporary file is
+        removed and digest.Mismatch is raised.  The content is
+        flushed to disk before the rename, so a crash never leaves a
+        truncated blob in place.  Blobs get the mode open() would
+        give a new file, so other users may read a shared store.
+        """
+        path, _ = self._put_chunks(digest=digest, chunks=chunks, size=size)
+        return path
+
+    def put_mapped(self, digest, chunks, size=None):
+        """Store a blob as put_chunks() does, returning its content.
+
+        The content is returned as get() would return it, but it is
+        mapped before the blob is renamed into place, so a concurrent
+        gc() cannot remove it first.
+        """
+        _, content = self._put_chunks(
+            digest=digest, chunks=chunks, size=size, mapped=True)
+        return content
+
+    def _put_chunks(self, digest, chunks, size=None, mapped=False):
+        verifier = _digest.Verifier(digest=digest, size=size)
+        path = self.blob_path(digest=verifier.digest)
+        directory = _os.path.dirname(path)
+        _os.makedirs(directory, exist_ok=True)
+        temporary = _os.path.join(
+            directory, '.{}.tmp'.format(_uuid.uuid4().hex))
+        # unlike tempfile, this lets the umask decide the mode
+        fd = _os.open(
+            temporary, _os.O_CREAT | _os.O_EXCL | _os.O_RDWR, 0o666)
+        content = None
+        with open(fd, 'r+b') as f:
+            try:
+                for chunk in chunks:
+                    verifier.update(data=chunk)
+                    f.write(chunk)
+                verifier.verify()
+                f.flush()
+                _os.fsync(f.fileno())
+                if mapped:
+                    content = _map(f=f)
+            except BaseException:
+                _os.unlink(temporary)
+                raise
+        existed = _os.path.exists(path)
+        _os.replace(temporary, path)
+        _LOGGER.debug('stored {} in {}'.format(verifier.digest, path))
+        if not existed:
+            self._added(path=path, size=verifier.size)
+        return path, content
+
+    def put(self, digest, content, size=None):
+        """Store a blob from bytes, as put_chunks() does."""
+        return self.put_chunks(digest=digest, chunks=[content], size=size)
+
+    def _added(self, path, size):
+        if self.max_size is None:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+                if self._size <= self.max_size:
+                    return
+        self._collect(max_size=self.max_size, keep=path)
+
+    def gc(self, max_size=None):
+        """Remove the least-recently used blobs.
+
+        Blobs are removed until at most max_size bytes (which defaults
+        to the store's max_size) remain.  Temporary files left by
+        interrupted writes are also removed once they are older than
+        TEMPORARY_MAX_AGE.  Returns the number of bytes removed.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        return self._collect(max_size=max_size)
+
+    def _collect(self, max_size, keep=None):
+        with self._lock:
+            blobs = []
+            total = 0
+            now = _time.time()
+            for directory, _, filenames in _os.walk(self.path):
+                for filename in filenames:
+                    path = _os.path.join(directory, filename)
+                    try:
+                        stat = _os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if filename.startswith('.'):
+                        if (filename.endswith('.tmp') and
+                                now - stat.st_mtime > TEMPORARY_MAX_AGE):
+                            self._remove(path=path)
+                        continue
+                    blobs.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            removed = 0
+            if max_size is not None:
+                blobs.sort()
+                for _, size, path in blobs:
+                    if total <= max_size:
+                        break
+                    if path == keep:
+                        continue
+                    self._remove(path=path)
+                    total -= size
+                    removed += size
+            self._size = total
+        if removed:
+            _LOGGER.debug('removed {} bytes of blobs from {}'.format(
+                removed, self.path))
+        return removed
+
+    def _remove(self, path):
+        try:
+            _os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class CachedEngine(object):
+    """Serve a CAS engine's blobs from a BlobStore.
+
+    Blobs missing from store are fetched with engine (e.g. from
+    cas_engine.new()) and stored, so later requests for the same
+    digest never touch the network.  get() returns a read-only mmap
+    (see BlobStore.get()).
+    """
+    def __init__(self, engine, store):
+        self.engine = engine
+        self.store = store
+
+    def __str__(self):
+        return '<{}.{} engine={} store={}>'.format(
+            self.__class__.__module__, self.__class__.__name__,
+            self.engine, self.store)
+
+    def get(self, digest, size=None):
+        content = self.store.get(digest=digest)
+        if content is None:
+            content = self.store.put_mapped(
+                digest=digest,
+                chunks=self.engine.get_chunks(digest=digest, size=size),
+                size=size)
+        elif size is not None and len(content) != size:
+            raise _digest.Mismatch('{} is {} bytes, not the expected {}'.format(
+                digest, len(content), size))
+        return content
+
+    def get_chunks(self, digest, size=None):
+        content = self.get(digest=digest, size=size)
+        try:
+            for start in range(0, len(content), CHUNK_SIZE):
+                yield content[start:start + CHUNK_SIZE]
+        finally:
+            if hasattr(content, 'close'):
+                content.close()
@@ -0,0 +1,146 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+
+from .. import fetch_json
+from ..digest import Mismatch
+from . import from_root
+from . import get_many
+from . import new
+
+
+class TestNew(unittest.TestCase):
+    def test_good(self):
+        uri = 'https://example.com/cas/{algorithm}/{encoded:2}/{encoded}'
+        engine = new(protocol='oci-cas-template-v1', uri=uri)
+        self.assertEqual(
+            str(engine),
+            '<oci_discovery.cas_engine.oci_cas_template.Engine uri={}>'
+                .format(uri))
+
+    def test_bad(self):
+        self.assertRaisesRegex(
+            ValueError,
+            "unsupported CAS-engine protocol 'unregistered'",
+            new,
+            protocol='unregistered')
+
+
+class TestFromRoot(unittest.TestCase):
+    def test(self):
+        root = {
+            'mediaType': 'application/vnd.oci.descriptor.v1+json',
+            'root': {
+                'digest': 'sha256:' + 'a' * 64,
+                'casEngines': [
+                    {'protocol': 'oci-cas-template-v1', 'uri': 'cas/{digest}'},
+                    {'protocol': 'unregistered'},
+                ],
+            },
+            'uri': 'https://a.example.com/index',
+            'casEngines': [
+                {
+                    'config': {
+                        'protocol': 'oci-cas-template-v1',
+                        'uri': '/blobs/{encoded}',
+                    },
+                    'uri': 'https://b.example.com/.well-known/oci-host-ref-engines',
+                },
+                {
+                    'config': {'protocol': 'oci-cas-template-v1'},
+                    'uri': 'https://b.example.com/.well-known/oci-host-ref-engines',
+                },
+            ],
+        }
+        with self.assertLogs('oci_discovery.cas_engine', level='WARNING') as logs:
+            engines = from_root(root=root)
+        self.assertEqual(
+            [engine.uri(digest='sha256:' + 'a' * 64) for engine in engines],
+            [
+                'https://a.example.com/cas/sha256%3A' + 'a' * 64,
+                'https://b.example.com/blobs/' + 'a' * 64,
+            ])
+        self.assertEqual(len(logs.output), 2)
+
+
+class _Engine(object):
+    def __init__(self, delays=None, fail=()):
+        self.delays = delays or {}
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.active = self.max_active = 0
+        self.started = []
+
+    def get(self, digest, size=None):
+        with self.lock:
+            self.started.append(digest)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get(digest, 0.01))
+            if digest in self.fail:
+                raise Mismatch('{} is corrupt'.format(digest))
+            return digest.encode('UTF-8')
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class TestGetMany(unittest.TestCase):
+    def _descriptors(self, count):
+        return [{'digest': str(i), 'size': 1} for i in range(count)]
+
+    def test_order(self):
+        engine = _Engine(delays={'0': 0.1})
+        descriptors = self._descriptors(count=6)
+        self.assertEqual(
+            list(get_many(engine=engine, descriptors=descriptors, max_workers=3)),
+            [(descriptor, descriptor['digest'].encode('UTF-8'))
+             for descriptor in descriptors])
+        self.assertLessEqual(engine.max_active, 3)
+        self.assertGreater(engine.max_active, 1)
+
+    def test_error(self):
+        engine = _Engine(fail={'1'})
+        results = get_many(
+            engine=engine, descriptors=self._descriptors(count=20),
+            max_workers=2)
+        self.assertEqual(next(results)[1], b'0')
+        self.assertRaisesRegex(Mismatch, '1 is corrupt', next, results)
+        results.close()
+        self.assertLess(len(engine.started), 20)
+
+    def test_close(self):
+        cancelled = threading.Event()
+
+        class Engine(object):
+            def get(self, digest, size=None):
+                for _ in range(500):
+                    if digest == '0':
+                        break
+                    if fetch_json.remaining() == 0:
+                        cancelled.set()
+                        fetch_json.check_deadline()
+                    time.sleep(0.01)
+                return digest.encode('UTF-8')
+
+        results = get_many(
+            engine=Engine(), descriptors=self._descriptors(count=3),
+            max_workers=2)
+        self.assertEqual(next(results)[1], b'0')
+        results.close()
+        self.assertTrue(cancelled.wait(timeout=5))
@@ -0,0 +1,329 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import threading
+import time
+import unittest
+import unittest.mock
+
+from .. import fetch_json
+from . import dag
+from . import multi
+
+
+_INDEX = 'application/vnd.oci.image.index.v1+json'
+_MANIFEST = 'application/vnd.oci.image.manifest.v1+json'
+_CONFIG = 'application/vnd.oci.image.config.v1+json'
+_LAYER = 'application/vnd.oci.image.layer.v1.tar+gzip'
+
+
+class _Engine(object):
+    def __init__(self):
+        self.blobs = {}
+        self.fetched = []
+
+    def add(self, content, media_type, **kwargs):
+        if not isinstance(content, bytes):
+            content = json.dumps(content).encode('UTF-8')
+        digest = 'sha256:{}'.format(hashlib.sha256(content).hexdigest())
+        self.blobs[digest] = content
+        descriptor = {
+            'mediaType': media_type,
+            'digest': digest,
+            'size': len(content),
+        }
+        descriptor.update(kwargs)
+        return descriptor
+
+    def get(self, digest, size=None):
+        self.fetched.append(digest)
+        return self.blobs[digest]
+
+    def get_chunks(self, digest, size=None):
+        yield self.get(digest=digest, size=size)
+
+
+class TestPlatformMatches(unittest.TestCase):
+    def test(self):
+        wanted = {'os': 'linux', 'architecture': 'arm64', 'os.features': ['a']}
+        for label, platform, expected in [
+                    ('missing', None, True),
+                    ('match', {'os': 'linux', 'architecture': 'arm64', 'os.features': ['a', 'b']}, True),
+                    ('architecture', {'os': 'linux', 'architecture': 'amd64', 'os.features': ['a']}, False),
+                    ('features', {'os': 'linux', 'architecture': 'arm64'}, False),
+                ]:
+            with self.subTest(label=label):
+                self.assertEqual(
+                    dag.platform_matches(platform=platform, wanted=wanted),
+                    expected)
+
+
+class TestChildren(unittest.TestCase):
+    def test(self):
+        config = {'mediaType': _CONFIG, 'digest': 'sha256:c', 'size': 1}
+        layer = {'mediaType': _LAYER, 'digest': 'sha256:l', 'size': 1}
+        manifest = {'mediaType': _MANIFEST, 'digest': 'sha256:m', 'size': 1}
+        for label, media_type, content, expected in [
+                    ('index', _INDEX, {'manifests': [manifest]}, [manifest]),
+                    ('manifest', _MANIFEST, {'config': config, 'layers': [layer]}, [config, layer]),
+                    ('untyped index', None, {'mediaType': _INDEX, 'manifests': [manifest]}, [manifest]),
+                    ('layer', _LAYER, b'\x1f\x8b', []),
+                    ('untyped layer', None, b'\x1f\x8b', []),
+                ]:
+            with self.subTest(label=label):
+                if not isinstance(content, bytes):
+                    content = json.dumps(content).encode('UTF-8')
+                descriptor = {'digest': 'sha256:p'}
+                if media_type:
+                    descriptor['mediaType'] = media_type
+                self.assertEqual(
+                    dag.children(descriptor=descriptor, content=content),
+                    expected)
+
+    def test_invalid_descriptor(self):
+        manifest = {'mediaType': _MANIFEST, 'digest': 'sha256:m', 'size': 1}
+        content = json.dumps({'manifests': [manifest, {}]}).encode('UTF-8')
+        with self.assertLogs(dag._LOGGER, level='WARNING'):
+            self.assertEqual(
+                dag.children(
+                    descriptor={'mediaType': _INDEX, 'digest': 'sha256:p'},
+                    content=content),
+                [manifest])
+
+    def test_invalid_json(self):
+        self.assertRaisesRegex(
+            ValueError, 'invalid JSON in sha256:p', dag.children,
+            descriptor={'mediaType': _MANIFEST, 'digest': 'sha256:p'},
+            content=b'{')
+
+
+class TestWalk(unittest.TestCase):
+    def setUp(self):
+        self.engine = _Engine()
+        self.layer = self.engine.add(
+            content=b'shared layer', media_type=_LAYER)
+        self.manifests = {}
+        self.configs = {}
+        for architecture in ['amd64', 'arm64']:
+            self.configs[architecture] = self.engine.add(
+                content={'architecture': architecture}, media_type=_CONFIG)
+            self.manifests[architecture] = self.engine.add(
+                content={
+                    'schemaVersion': 2,
+                    'config': self.configs[architecture],
+                    'layers': [self.layer],
+                },
+                media_type=_MANIFEST,
+                platform={'os': 'linux', 'architecture': architecture})
+        self.index = self.engine.add(
+            content={
+                'schemaVersion': 2,
+                'manifests': [self.manifests['amd64'], self.manifests['arm64']],
+            },
+            media_type=_INDEX)
+        self.root = {'root': self.index, 'uri': 'https://example.com/index'}
+
+    def _walk(self, roots, **kwargs):
+        return [
+            (result['root'], result['descriptor']['digest'], result['content'])
+            for result in dag.walk(roots=roots, engine=self.engine, **kwargs)]
+
+    def _expected(self, root, descriptor):
+        content = None
+        if descriptor['mediaType'] in {_INDEX, _MANIFEST}:
+            content = self.engine.blobs[descriptor['digest']]
+        return (root, descriptor['digest'], content)
+
+    def test_walk(self):
+        everything = [
+            self.index,
+            self.manifests['amd64'],
+            self.manifests['arm64'],
+            self.configs['amd64'],
+            self.layer,
+            self.configs['arm64'],
+        ]
+        for label, kwargs, expected in [
+                    ('everything', {}, everything),
+                    ('one worker', {'max_workers': 1}, everything),
+                    (
+                        'platform',
+                        {'platform': {'architecture': 'arm64'}},
+                        [
+                            self.index,
+                            self.manifests['arm64'],
+                            self.configs['arm64'],
+                            self.layer,
+                        ],
+                    ),
+                    (
+                        'media types',
+                        {'media_types': dag.MANIFEST_MEDIA_TYPES | {_CONFIG}},
+                        [
+                            self.index,
+                            self.manifests['amd64'],
+                            self.manifests['arm64'],
+                            self.configs['amd64'],
+                            self.configs['arm64'],
+                        ],
+                    ),
+                ]:
+            with self.subTest(label=label):
+                self.engine.fetched = []
+                self.assertEqual(
+                    self._walk(roots=[self.root], **kwargs),
+                    [
+                        self._expected(root=self.root, descriptor=descriptor)
+                        for descriptor in expected
+                    ])
+                # config and layers are left for the caller
+                self.assertEqual(
+                    sorted(self.engine.fetched),
+                    sorted(
+                        descriptor['digest'] for descriptor in expected
+                        if descriptor['mediaType'] != _CONFIG and
+                        descriptor != self.layer))
+
+    def test_get_chunks(self):
+        results = list(dag.walk(roots=[self.root], engine=self.engine))
+        self.assertNotIn(self.layer['digest'], self.engine.fetched)
+        for result in results:
+            with self.subTest(digest=result['descriptor']['digest']):
+                self.assertEqual(
+                    b''.join(result['get_chunks']()),
+                    self.engine.blobs[result['descriptor']['digest']])
+        self.assertIn(self.layer['digest'], self.engine.fetched)
+
+    def test_untyped(self):
+        manifest = dict(self.manifests['amd64'])
+        del manifest['mediaType']
+        index = self.engine.add(
+            content={'schemaVersion': 2, 'manifests': [manifest]},
+            media_type=_INDEX)
+        root = {'root': index, 'uri': 'https://example.com/untyped'}
+        for label, max_size, expected, fetched in [
+                    (
+                        'small',
+                        dag.MAX_UNTYPED_SIZE,
+                        [index, manifest, self.configs['amd64'], self.layer],
+                        [True, True, False, False],
+                    ),
+                    (
+                        'large',
+                        manifest['size'] - 1,
+                        [index, manifest],
+                        [True, False],
+                    ),
+                ]:
+            with self.subTest(label=label):
+                with unittest.mock.patch(
+                        target='oci_discovery.cas_engine.dag.MAX_UNTYPED_SIZE',
+                        new=max_size):
+                    results = list(dag.walk(roots=[root], engine=self.engine))
+                self.assertEqual(
+                    [result['descriptor'] for result in results], expected)
+                self.assertEqual(
+                    [result['content'] is not None for result in results],
+                    fetched)
+
+    def test_lazy_roots(self):
+        pulled = []
+
+        def roots():
+            for uri in ['https://example.com/a', 'https://example.com/b']:
+                pulled.append(uri)
+                yield dict(self.root, uri=uri)
+
+        results = dag.walk(roots=roots(), engine=self.engine, max_workers=1)
+        self.assertEqual(next(results)['descriptor'], self.index)
+        self.assertEqual(pulled, ['https://example.com/a'])
+        results.close()
+
+    def test_dedup_across_roots(self):
+        manifest_root = {
+            'root': self.manifests['amd64'], 'uri': 'https://example.com/amd64'}
+        results = self._walk(roots=[manifest_root, self.root, self.root])
+        self.assertEqual(
+            [(root['uri'], digest) for root, digest, _ in results],
+            [
+                ('https://example.com/amd64', self.manifests['amd64']['digest']),
+                ('https://example.com/index', self.index['digest']),
+                ('https://example.com/amd64', self.configs['amd64']['digest']),
+                ('https://example.com/amd64', self.layer['digest']),
+                ('https://example.com/index', self.manifests['arm64']['digest']),
+                ('https://example.com/index', self.configs['arm64']['digest']),
+            ])
+        self.assertEqual(len(self.engine.fetched), len(set(self.engine.fetched)))
+
+    def test_error(self):
+        del self.engine.blobs[self.manifests['arm64']['digest']]
+        results = dag.walk(roots=[self.root], engine=self.engine)
+        self.assertEqual(
+            [next(results)['descriptor'] for _ in range(2)],
+            [self.index, self.manifests['amd64']])
+        self.assertRaises(KeyError, next, results)
+
+    def test_close(self):
+        stalled = self.manifests['arm64']['digest']
+        cancelled = threading.Event()
+        get = self.engine.get
+
+        def stall(digest, size=None):
+            for _ in range(500):
+                if digest != stalled:
+                    break
+                if fetch_json.remaining() == 0:
+                    cancelled.set()
+                    fetch_json.check_deadline()
+                time.sleep(0.01)
+            return get(digest=digest, size=size)
+
+        self.engine.get = stall
+        results = dag.walk(roots=[self.root], engine=self.engine, max_workers=2)
+        self.assertEqual(
+            [next(results)['descriptor'] for _ in range(2)],
+            [self.index, self.manifests['amd64']])
+        results.close()
+        self.assertTrue(cancelled.wait(timeout=5))
+
+    def test_root_engines(self):
+        other = _Engine()
+        for label, engines in [
+                    ('one', [self.engine]),
+                    ('several', [other, self.engine]),
+                ]:
+            with self.subTest(label=label):
+                with unittest.mock.patch(
+                        target='oci_discovery.cas_engine.dag._from_root',
+                        return_value=engines) as from_root:
+                    with unittest.mock.patch(
+                            target='oci_discovery.cas_engine.multi.STATS',
+                            new=multi.Stats()), unittest.mock.patch(
+                            target='oci_discovery.cas_engine.multi._LOGGER'):
+                        results = list(dag.walk(
+                            roots=[self.root],
+                            media_types=dag.MANIFEST_MEDIA_TYPES))
+                from_root.assert_called_once_with(root=self.root)
+                self.assertEqual(
+                    [result['descriptor'] for result in results],
+                    [self.index, self.manifests['amd64'], self.manifests['arm64']])
+
+    def test_no_engines(self):
+        with unittest.mock.patch(
+                target='oci_discovery.cas_engine.dag._from_root',
+                return_value=[]):
+            with self.assertLogs(dag._LOGGER, level='WARNING'):
+                self.assertEqual(list(dag.walk(roots=[self.root])), [])
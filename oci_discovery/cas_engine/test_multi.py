@@ -0,0 +1,198 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import threading
+import time
+import unittest
+import unittest.mock
+
+from .. import fetch_json
+from ..digest import Mismatch
+from . import multi
+from . import oci_cas_template
+
+
+_CONTENT = b'0123456789'
+_DIGEST = 'sha256:{}'.format(hashlib.sha256(_CONTENT).hexdigest())
+
+
+class _Engine(object):
+    """A fake mirror.  failure is None, 'error', 'mismatch' or 'partial'."""
+    def __init__(self, name, delay=0, failure=None):
+        self.name = name
+        self.delay = delay
+        self.failure = failure
+        self.calls = 0
+
+    def __str__(self):
+        return self.name
+
+    def get_chunks(self, digest, size=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.failure == 'error':
+            raise OSError('{} is down'.format(self.name))
+        for start in range(0, len(_CONTENT), 4):
+            if self.failure == 'partial' and start >= 4:
+                raise OSError('{} reset the connection'.format(self.name))
+            yield _CONTENT[start:start + 4]
+        if self.failure == 'mismatch':
+            raise Mismatch('{} returned the wrong content'.format(self.name))
+
+
+class TestStats(unittest.TestCase):
+    def test_expected(self):
+        stats = multi.Stats(alpha=0.5)
+        self.assertIsNone(stats.expected(engine='a'))
+        stats.success(engine='a', latency=1)
+        stats.success(engine='a', latency=2)
+        self.assertEqual(stats.expected(engine='a'), 1.5)
+        stats.success(engine='b', latency=0.1, size=10**6, duration=1.1)
+        self.assertEqual(stats.get(engine='b')['throughput'], 10**6)
+        self.assertAlmostEqual(stats.expected(engine='b', size=10**7), 10.1)
+        stats.failure(engine='b')
+        self.assertAlmostEqual(stats.expected(engine='b', size=10**7), 20.2)
+        stats.failure(engine='c')
+        self.assertEqual(stats.expected(engine='c'), float('inf'))
+        stats.clear()
+        self.assertIsNone(stats.get(engine='a'))
+
+    def test_relative_templates(self):
+        stats = multi.Stats()
+        a, b = [
+            oci_cas_template.Engine(
+                uri='../cas/{digest}',
+                base='https://{}.example.com/oci-index/app'.format(name))
+            for name in 'ab']
+        stats.success(engine=a, latency=1)
+        self.assertEqual(stats.expected(engine=a), 1)
+        self.assertIsNone(stats.expected(engine=b))
+
+
+class TestMultiEngine(unittest.TestCase):
+    def setUp(self):
+        # failures are logged, but which race loser gets that far varies
+        patcher = unittest.mock.patch(
+            target='oci_discovery.cas_engine.multi._LOGGER')
+        self.logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _engine(self, engines, **kwargs):
+        return multi.MultiEngine(
+            engines=engines, stats=multi.Stats(), **kwargs)
+
+    def test_ranked(self):
+        a, b, c, d = [_Engine(name=name) for name in 'abcd']
+        engine = self._engine(engines=[a, b, c, d])
+        engine.stats.success(engine=a, latency=2)
+        engine.stats.success(engine=b, latency=1)
+        engine.stats.failure(engine=c)
+        self.assertEqual(engine.ranked(), [d, b, a, c])
+
+    def test_race(self):
+        slow = _Engine(name='slow', delay=0.5)
+        fast = _Engine(name='fast', delay=0.01)
+        engine = self._engine(engines=[slow, fast])
+        start = time.monotonic()
+        self.assertEqual(
+            engine.get(digest=_DIGEST, size=len(_CONTENT)), _CONTENT)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual((slow.calls, fast.calls), (1, 1))
+        self.assertIsNotNone(engine.stats.expected(engine=fast))
+        # the next small blob races the fast engine and the slow one
+        self.assertEqual(engine.ranked(size=len(_CONTENT))[0], slow)
+
+    def test_race_cancels_loser(self):
+        fast = _Engine(name='fast')
+        stalled = threading.Event()
+        daemon = []
+
+        class Stalled(object):
+            def get_chunks(self, digest, size=None):
+                daemon.append(threading.current_thread().daemon)
+                for _ in range(500):
+                    if fetch_json.remaining() == 0:
+                        stalled.set()
+                        fetch_json.check_deadline()
+                    time.sleep(0.01)
+                yield _CONTENT
+
+        engine = self._engine(engines=[Stalled(), fast])
+        self.assertEqual(
+            engine.get(digest=_DIGEST, size=len(_CONTENT)), _CONTENT)
+        self.assertTrue(stalled.wait(timeout=5))
+        self.assertEqual(daemon, [True])
+
+    def test_failover(self):
+        for label, race, failures, calls in [
+                    ('race loser fails', 2, ['error', None, None], [1, 1, 0]),
+                    ('race mismatch', 2, ['mismatch', None, None], [1, 1, 0]),
+                    ('race fails', 2, ['error', 'mismatch', None], [1, 1, 1]),
+                    ('no race', 1, ['error', 'partial', None], [1, 1, 1]),
+                ]:
+            with self.subTest(label=label):
+                engines = [
+                    _Engine(name=str(i), failure=failure)
+                    for i, failure in enumerate(failures)]
+                engine = self._engine(engines=engines, race=race)
+                self.assertEqual(
+                    engine.get(digest=_DIGEST, size=len(_CONTENT)), _CONTENT)
+                self.assertEqual([e.calls for e in engines], calls)
+
+    def test_all_fail(self):
+        engines = [
+            _Engine(name='a', failure='error'),
+            _Engine(name='b', failure='error'),
+        ]
+        engine = self._engine(engines=engines)
+        self.assertRaisesRegex(
+            OSError, 'is down', engine.get, digest=_DIGEST, size=len(_CONTENT))
+        self.assertEqual(self.logger.warning.call_count, 2)
+        self.assertEqual(
+            engine.stats.expected(engine=engines[0]), float('inf'))
+
+    def test_large(self):
+        engines = [_Engine(name='a'), _Engine(name='b')]
+        engine = self._engine(engines=engines, small_size=4)
+        self.assertEqual(
+            engine.get(digest=_DIGEST, size=len(_CONTENT)), _CONTENT)
+        self.assertEqual([e.calls for e in engines], [1, 0])
+
+    def test_get_chunks(self):
+        for label, failures, calls in [
+                    ('first engine', [None, None], [1, 0]),
+                    ('failed before content', ['error', None], [1, 1]),
+                    ('resumed', ['partial', None], [1, 1]),
+                ]:
+            with self.subTest(label=label):
+                engines = [
+                    _Engine(name=str(i), failure=failure)
+                    for i, failure in enumerate(failures)]
+                engine = self._engine(engines=engines, small_size=4)
+                chunks = list(engine.get_chunks(
+                    digest=_DIGEST, size=len(_CONTENT)))
+                self.assertEqual(b''.join(chunks), _CONTENT)
+                self.assertEqual([e.calls for e in engines], calls)
+
+    def test_get_chunks_mismatch(self):
+        engines = [_Engine(name='a', failure='mismatch'), _Engine(name='b')]
+        engine = self._engine(engines=engines, small_size=4)
+        self.assertRaises(
+            Mismatch, list,
+            engine.get_chunks(digest=_DIGEST, size=len(_CONTENT)))
+        self.assertEqual([e.calls for e in engines], [1, 0])
+
+    def test_no_engines(self):
+        self.assertRaises(ValueError, multi.MultiEngine, engines=[])
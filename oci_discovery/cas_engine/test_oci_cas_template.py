@@ -0,0 +1,153 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import http.server
+import threading
+import unittest
+import unittest.mock
+import urllib.error
+
+from ..digest import Mismatch
+from ..fetch_json import compression
+from . import oci_cas_template
+
+
+def _digest(content):
+    return 'sha256:{}'.format(hashlib.sha256(content).hexdigest())
+
+
+_BLOB = b'{"schemaVersion": 2}' * 100
+_DIGEST = _digest(_BLOB)
+_CORRUPT = _digest(b'something else')
+_COMPRESSED = _digest(b'compressed')
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.peers.append(self.client_address)
+        encoding = None
+        if self.path.endswith(_DIGEST.split(':')[1]):
+            body = _BLOB
+        elif self.path.endswith(_CORRUPT.split(':')[1]):
+            body = _BLOB
+        elif self.path.endswith(_COMPRESSED.split(':')[1]):
+            body = gzip.compress(b'compressed')
+            encoding = 'gzip'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestEngine(unittest.TestCase):
+    def test_uri(self):
+        digest = (
+            'sha256:'
+            'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855')
+        for label, uri, base, expected in [
+                    (
+                        'cas-template.md example',
+                        'https://a.example.com/cas/{algorithm}/{encoded:2}/{encoded}',
+                        None,
+                        'https://a.example.com/cas/sha256/e3/'
+                        'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855',
+                    ),
+                    (
+                        'relative',
+                        '../cas/{digest}',
+                        'https://a.example.com/oci-index/app',
+                        'https://a.example.com/cas/sha256%3A'
+                        'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855',
+                    ),
+                ]:
+            with self.subTest(label=label):
+                engine = oci_cas_template.Engine(uri=uri, base=base)
+                self.assertEqual(engine.uri(digest=digest), expected)
+
+    def test_invalid_digest(self):
+        engine = oci_cas_template.Engine(uri='https://example.com/{digest}')
+        self.assertRaises(ValueError, engine.uri, digest='sha256:abc')
+
+
+class TestGet(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), _Handler)
+        self.server.peers = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.engine = oci_cas_template.Engine(
+            uri='http://127.0.0.1:{}/cas/{{algorithm}}/{{encoded:2}}/{{encoded}}'
+                .format(self.server.server_port))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_good(self):
+        for label, digest, size, expected in [
+                    ('sized', _DIGEST, len(_BLOB), _BLOB),
+                    ('unsized', _DIGEST, None, _BLOB),
+                    ('compressed', _COMPRESSED, len(b'compressed'), b'compressed'),
+                ]:
+            with self.subTest(label=label):
+                self.assertEqual(
+                    self.engine.get(digest=digest, size=size), expected)
+        # requests share a pooled connection
+        self.assertEqual(len(set(self.server.peers)), 1)
+
+    def test_streaming(self):
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.CHUNK_SIZE', new=100):
+            chunks = list(self.engine.get_chunks(digest=_DIGEST))
+        self.assertEqual(len(chunks), len(_BLOB) // 100)
+        self.assertEqual(b''.join(chunks), _BLOB)
+
+    def test_bad(self):
+        for label, digest, size, error, regex in [
+                    ('corrupt', _CORRUPT, None, Mismatch, 'has digest'),
+                    ('short', _DIGEST, len(_BLOB) + 1, Mismatch, 'not the expected'),
+                    ('long', _DIGEST, 10, Mismatch, 'larger than the expected 10 bytes'),
+                    (
+                        'missing',
+                        _digest(b'missing'),
+                        None,
+                        urllib.error.HTTPError,
+                        'Not Found',
+                    ),
+                ]:
+            with self.subTest(label=label):
+                self.assertRaisesRegex(
+                    error, regex, self.engine.get, digest=digest, size=size)
+
+    def test_unsized_too_large(self):
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.MAX_SIZE', new=10):
+            self.assertRaisesRegex(
+                compression.TooLarge, 'more than 10 bytes',
+                self.engine.get, digest=_DIGEST)
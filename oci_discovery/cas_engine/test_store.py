@@ -0,0 +1,197 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+from ..digest import Mismatch
+from . import store
+
+
+def _digest(content):
+    return 'sha256:{}'.format(hashlib.sha256(content).hexdigest())
+
+
+def _files(path):
+    return sorted(
+        os.path.relpath(os.path.join(directory, filename), path)
+        for directory, _, filenames in os.walk(path)
+        for filename in filenames)
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.store = store.BlobStore(path=self.path)
+
+    def _age(self, digest, seconds):
+        path = self.store.blob_path(digest=digest)
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_round_trip(self):
+        content = b'hello'
+        digest = _digest(content)
+        self.assertIsNone(self.store.get(digest=digest))
+        self.assertNotIn(digest, self.store)
+        path = self.store.put_chunks(
+            digest=digest, chunks=[b'he', b'llo'], size=len(content))
+        encoded = digest.split(':')[1]
+        self.assertEqual(
+            path, os.path.join(self.path, 'sha256', encoded[:2], encoded))
+        self.assertEqual(_files(self.path), [os.path.relpath(path, self.path)])
+        self.assertIn(digest, self.store)
+        stored = self.store.get(digest=digest)
+        self.assertEqual(stored[:], content)
+        self.assertEqual(len(stored), len(content))
+        stored.close()
+
+    def test_mode(self):
+        for umask, mode in [(0o022, 0o644), (0o027, 0o640)]:
+            with self.subTest(umask=oct(umask)):
+                content = oct(umask).encode('UTF-8')
+                previous = os.umask(umask)
+                try:
+                    path = self.store.put(
+                        digest=_digest(content), content=content)
+                finally:
+                    os.umask(previous)
+                self.assertEqual(os.stat(path).st_mode & 0o777, mode)
+
+    def test_empty(self):
+        digest = _digest(b'')
+        self.store.put(digest=digest, content=b'')
+        self.assertEqual(self.store.get(digest=digest), b'')
+
+    def test_mismatch(self):
+        for label, chunks, size in [
+                    ('content', [b'goodbye'], None),
+                    ('size', [b'hello'], 4),
+                ]:
+            with self.subTest(label=label):
+                self.assertRaises(
+                    Mismatch, self.store.put_chunks, digest=_digest(b'hello'),
+                    chunks=chunks, size=size)
+                self.assertEqual(_files(self.path), [])
+
+    def test_interrupted(self):
+        def chunks():
+            yield b'hel'
+            raise OSError('connection reset')
+
+        self.assertRaises(
+            OSError, self.store.put_chunks, digest=_digest(b'hello'),
+            chunks=chunks())
+        self.assertEqual(_files(self.path), [])
+
+    def test_gc(self):
+        digests = []
+        for i, content in enumerate([b'a' * 10, b'b' * 10, b'c' * 10]):
+            digest = _digest(content)
+            self.store.put(digest=digest, content=content)
+            self._age(digest=digest, seconds=100 - i)
+            digests.append(digest)
+        # reading the oldest blob makes it the most recently used
+        self.store.get(digest=digests[0]).close()
+        self.assertEqual(self.store.gc(max_size=15), 20)
+        self.assertEqual(
+            [digest in self.store for digest in digests], [True, False, False])
+        self.assertEqual(self.store.gc(), 0)
+
+    def test_max_size(self):
+        self.store.max_size = 25
+        digests = []
+        for i, content in enumerate([b'a' * 10, b'b' * 10, b'c' * 10]):
+            digest = _digest(content)
+            self.store.put(digest=digest, content=content)
+            self._age(digest=digest, seconds=100 - i)
+            digests.append(digest)
+        self.assertEqual(
+            [digest in self.store for digest in digests], [False, True, True])
+
+    def test_max_size_keeps_new_blob(self):
+        self.store.max_size = 5
+        digest = _digest(b'a' * 10)
+        self.store.put(digest=digest, content=b'a' * 10)
+        self.assertIn(digest, self.store)
+
+    def test_stale_temporary_files(self):
+        directory = os.path.join(self.path, 'sha256', 'aa')
+        os.makedirs(directory)
+        for name, age in [('.old.tmp', store.TEMPORARY_MAX_AGE + 1), ('.new.tmp', 0)]:
+            path = os.path.join(directory, name)
+            with open(path, 'wb'):
+                pass
+            then = time.time() - age
+            os.utime(path, (then, then))
+        self.store.gc()
+        self.assertEqual(_files(self.path), [os.path.join('sha256', 'aa', '.new.tmp')])
+
+
+class _Engine(object):
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.fetched = []
+
+    def get_chunks(self, digest, size=None):
+        self.fetched.append(digest)
+        content = self.blobs[digest]
+        yield content[:1]
+        yield content[1:]
+
+
+class TestCachedEngine(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.content = b'{"schemaVersion": 2}'
+        self.digest = _digest(self.content)
+        self.engine = _Engine(blobs={self.digest: self.content})
+        self.cached = store.CachedEngine(
+            engine=self.engine, store=store.BlobStore(path=directory.name))
+
+    def test_get(self):
+        for _ in range(2):
+            self.assertEqual(
+                self.cached.get(digest=self.digest, size=len(self.content))[:],
+                self.content)
+        self.assertEqual(self.engine.fetched, [self.digest])
+
+    def test_get_chunks(self):
+        with unittest.mock.patch(
+                target='oci_discovery.cas_engine.store.CHUNK_SIZE', new=8):
+            chunks = list(self.cached.get_chunks(digest=self.digest))
+        self.assertEqual([len(chunk) for chunk in chunks], [8, 8, 4])
+        self.assertEqual(b''.join(chunks), self.content)
+
+    def test_removed_after_put(self):
+        # a concurrent gc() removes the blob as soon as it is renamed
+        with unittest.mock.patch.object(
+                self.cached.store, '_added',
+                side_effect=lambda path, size: os.unlink(path)):
+            content = self.cached.get(
+                digest=self.digest, size=len(self.content))
+        self.assertEqual(content[:], self.content)
+        self.assertNotIn(self.digest, self.cached.store)
+
+    def test_size_mismatch(self):
+        self.cached.get(digest=self.digest)
+        self.assertRaises(
+            Mismatch, self.cached.get, digest=self.digest, size=1)
@@ -0,0 +1,155 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Content digests.
+
+https://github.com/opencontainers/image-spec/blob/v1.0.0/descriptor.md#digests
+"""
+
+import collections.abc as _collections_abc
+import hashlib as _hashlib
+import re as _re
+
+
+_DIGEST_REGEX = _re.compile(
+    '(?P<algorithm>[a-z0-9]+(?:[+._-][a-z0-9]+)*)'
+    ':'
+    '(?P<encoded>[a-zA-Z0-9=_-]+)')
+
+# Registered algorithms, mapped to the pattern for their encoded
+# portion.  The algorithm names are also hashlib names.
+ALGORITHMS = {
+    'sha256': _re.compile('[a-f0-9]{64}'),
+    'sha512': _re.compile('[a-f0-9]{128}'),
+}
+
+
+class Mismatch(ValueError):
+    """Content did not match its expected digest or size."""
+
+
+class Digest(_collections_abc.Mapping):
+    """An immutable, hashable parsed digest.
+
+    The digest, algorithm and encoded values are available as
+    attributes, and also as a read-only mapping, so a Digest can be
+    used for the URI Template variables in cas-template.md.
+    """
+    __slots__ = ('_values',)
+
+    _KEYS = ('digest', 'algorithm', 'encoded')
+    _INDEXES = {key: i for i, key in enumerate(_KEYS)}
+
+    @property
+    def digest(self):
+        return self._values[0]
+
+    @property
+    def algorithm(self):
+        return self._values[1]
+
+    @property
+    def encoded(self):
+        return self._values[2]
+
+    def __init__(self, algorithm, encoded):
+        object.__setattr__(self, '_values', (
+            '{}:{}'.format(algorithm, encoded), algorithm, encoded))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def __delattr__(self, key):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def __getitem__(self, key):
+        return self._values[self._INDEXES[key]]
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __eq__(self, other):
+        if isinstance(other, Digest):
+            return self._values == other._values
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash(self._values)
+
+    def __str__(self):
+        return self.digest
+
+    def __repr__(self):
+        return '{}(algorithm={!r}, encoded={!r})'.format(
+            type(self).__name__, self.algorithm, self.encoded)
+
+
+def parse(digest):
+    """Parse a digest string into a Digest.
+
+    Digests using registered algorithms must also match that
+    algorithm's encoding.  A Digest is returned unchanged.
+    """
+    if isinstance(digest, Digest):
+        return digest
+    match = _DIGEST_REGEX.fullmatch(digest)
+    if match is None:
+        raise ValueError('{!r} does not match the digest pattern'.format(
+            digest))
+    algorithm, encoded = match.group('algorithm', 'encoded')
+    pattern = ALGORITHMS.get(algorithm)
+    if pattern is not None and not pattern.fullmatch(encoded):
+        raise ValueError('{!r} is not a valid {} digest'.format(
+            digest, algorithm))
+    return Digest(algorithm, encoded)
+
+
+class Verifier(object):
+    """Check content against a digest (and size) as it streams.
+
+    Call update() with each chunk and verify() once the content is
+    complete.  Both raise Mismatch, update() as soon as the content
+    grows past size.  source (e.g. a URI) is only used in error
+    messages.  ValueError is raised for algorithms which are not in
+    ALGORITHMS.
+    """
+    def __init__(self, digest, size=None, source=None):
+        self.digest = parse(digest=digest)
+        if self.digest.algorithm not in ALGORITHMS:
+            raise ValueError('unsupported digest algorithm {!r}'.format(
+                self.digest.algorithm))
+        self.expected_size = size
+        self.size = 0
+        self.source = source or self.digest.digest
+        self._hash = _hashlib.new(self.digest.algorithm)
+
+    def update(self, data):
+        self.size += len(data)
+        if self.expected_size is not None and self.size > self.expected_size:
+            raise Mismatch('{} is larger than the expected {} bytes'.format(
+                self.source, self.expected_size))
+        self._hash.update(data)
+
+    def verify(self):
+        if self.expected_size is not None and self.size != self.expected_size:
+            raise Mismatch('{} is {} bytes, not the expected {}'.format(
+                self.source, self.size, self.expected_size))
+        actual = self._hash.hexdigest()
+        if actual != self.digest.encoded:
+            raise Mismatch('{} has digest {}:{}, not the expected {}'.format(
+                self.source, self.digest.algorithm, actual,
+                self.digest.digest))
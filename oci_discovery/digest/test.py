@@ -0,0 +1,105 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import unittest
+
+from . import Digest
+from . import Mismatch
+from . import Verifier
+from . import parse
+
+
+_EMPTY = (
+    'sha256:e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855')
+
+
+class TestParse(unittest.TestCase):
+    def test_good(self):
+        for digest, expected in [
+                    (
+                        _EMPTY,
+                        {
+                            'digest': _EMPTY,
+                            'algorithm': 'sha256',
+                            'encoded': _EMPTY.split(':')[1],
+                        },
+                    ),
+                    (
+                        'multihash+base58:QmRZxt2b1FVZPNqd8hsiykDL3TdBDeTSPX9Kv46HmX4Gx8',
+                        {
+                            'digest': 'multihash+base58:QmRZxt2b1FVZPNqd8hsiykDL3TdBDeTSPX9Kv46HmX4Gx8',
+                            'algorithm': 'multihash+base58',
+                            'encoded': 'QmRZxt2b1FVZPNqd8hsiykDL3TdBDeTSPX9Kv46HmX4Gx8',
+                        },
+                    ),
+                ]:
+            with self.subTest(digest=digest):
+                parsed = parse(digest=digest)
+                self.assertEqual(parsed, expected)
+                self.assertEqual(str(parsed), digest)
+                self.assertEqual(parsed.algorithm, expected['algorithm'])
+                self.assertIs(parse(digest=parsed), parsed)
+
+    def test_bad(self):
+        for digest, regex in [
+                    ('', 'does not match the digest pattern'),
+                    ('sha256', 'does not match the digest pattern'),
+                    ('SHA256:abc', 'does not match the digest pattern'),
+                    ('sha256:abc', 'is not a valid sha256 digest'),
+                    (_EMPTY.upper().replace('SHA', 'sha'), 'is not a valid sha256 digest'),
+                ]:
+            with self.subTest(digest=digest):
+                self.assertRaisesRegex(ValueError, regex, parse, digest=digest)
+
+    def test_immutable(self):
+        parsed = parse(digest=_EMPTY)
+        self.assertRaises(AttributeError, setattr, parsed, 'algorithm', 'x')
+        self.assertEqual(
+            {parsed, Digest('sha256', _EMPTY.split(':')[1])}, {parsed})
+
+
+class TestVerifier(unittest.TestCase):
+    def _verify(self, digest, chunks, size=None):
+        verifier = Verifier(digest=digest, size=size, source='blob')
+        for chunk in chunks:
+            verifier.update(chunk)
+        verifier.verify()
+
+    def test_good(self):
+        data = b'hello, world'
+        for algorithm in ['sha256', 'sha512']:
+            digest = '{}:{}'.format(
+                algorithm, hashlib.new(algorithm, data).hexdigest())
+            with self.subTest(algorithm=algorithm):
+                self._verify(
+                    digest=digest, chunks=[data[:5], data[5:]],
+                    size=len(data))
+        self._verify(digest=_EMPTY, chunks=[])
+
+    def test_bad(self):
+        for label, chunks, size, regex in [
+                    ('content', [b'x'], None, 'blob has digest sha256:[0-9a-f]+, not the expected sha256:e3b0'),
+                    ('too long', [b'x'], 0, 'blob is larger than the expected 0 bytes'),
+                    ('too short', [], 1, 'blob is 0 bytes, not the expected 1'),
+                ]:
+            with self.subTest(label=label):
+                self.assertRaisesRegex(
+                    Mismatch, regex, self._verify, digest=_EMPTY,
+                    chunks=chunks, size=size)
+
+    def test_unsupported(self):
+        self.assertRaisesRegex(
+            ValueError, "unsupported digest algorithm 'md5'",
+            Verifier, digest='md5:d41d8cd98f00b204e9800998ecf8427e')
@@ -12,27 +12,638 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio as _asyncio
+import codecs as _codecs
+import concurrent.futures as _futures
+import contextlib as _contextlib
+import contextvars as _contextvars
+import copy as _copy
 import json as _json
 import logging as _logging
-import urllib.request as _urllib_request
+import sys as _sys
+import threading as _threading
+import time as _time
+
+from . import async_http as _async_http
+from . import compression as _compression
+from . import pool as _pool
+from . import stream as _stream
+from . import transport as _transport
 
 
 _LOGGER = _logging.getLogger(__name__)
 
+# Shared by every fetch() call, so discovery and ref engines reuse
+# warm connections to the same hosts.
+POOL = _pool.ConnectionPool()
+
+# Makes every fetch() request; see transport.py for the interface
+# and an HTTP/2 alternative.
+TRANSPORT = _transport.UrllibTransport(pool=POOL)
+
+# Makes every fetch_async() request; see transport.py.
+CLIENT = _async_http.Client()
+
+# Default fetch() cache.  None disables caching; set it to a
+# cache.Cache instance to enable caching for every caller.
+CACHE = None
+
+# Bytes read from the response at a time.
+CHUNK_SIZE = 64 * 1024
+
+# Accept-Encoding for every request.  None asks for unencoded
+# responses.
+ACCEPT_ENCODING = _compression.ACCEPT_ENCODING
+
+# Largest response body to read, in bytes after decompression, so a
+# small compressed response cannot exhaust memory.  None for no
+# limit.
+MAX_SIZE = 64 * 1024 * 1024
+
+# Seconds to wait while connecting, and for each read from the
+# connection.  None waits forever.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+
+_BATCH = _contextvars.ContextVar(
+    'oci_discovery.fetch_json.batch', default=None)
+_DEADLINE = _contextvars.ContextVar(
+    'oci_discovery.fetch_json.deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The current deadline() expired before a fetch could finish."""
+
+
+class _Deadline(object):
+    """When a deadline() block expires.
+
+    parent is the enclosing block's _Deadline, if any, which still
+    applies.  isolated() postpones expires by the time its caller
+    spends between items.  The deadline also expires once cancelled
+    (a threading.Event, if set) is set.
+    """
+    def __init__(self, expires, parent=None, cancelled=None):
+        self.expires = expires
+        self.parent = parent
+        self.cancelled = cancelled
+
+    def remaining(self):
+        if self.cancelled is not None and self.cancelled.is_set():
+            return 0
+        left = self.expires - _time.monotonic()
+        if self.parent is not None:
+            left = min(left, self.parent.remaining())
+        return left
+
+
+class _Batch(object):
+    """Results (or exceptions) of the fetches made within batch()."""
+    def __init__(self):
+        self._lock = _threading.Lock()
+        self._futures = {}
+
+    def fetch(self, key, fetch, copy=True):
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = _futures.Future()
+        if owner:
+            try:
+                future.set_result(fetch())
+            except Exception as error:
+                if isinstance(error, DeadlineExceeded):
+                    # the next caller may have more time
+                    with self._lock:
+                        del self._futures[key]
+                future.set_exception(error)
+        if copy:
+            return _copy.deepcopy(future.result())
+        return future.result()
+
+
+@_contextlib.contextmanager
+def batch():
+    """Make each distinct fetch() at most once within the block.
+
+    Later (or concurrent) fetch() calls for the same URI and media
+    type share the first call's result or exception, regardless of
+    HTTP caching headers.  This applies to the current context, so
+    it also covers threads started with a copy of the context.
+    Generators which yield within the block should be iterated with
+    isolated().
+    """
+    token = _BATCH.set(_Batch())
+    try:
+        yield
+    finally:
+        _BATCH.reset(token)
+
+
+@_contextlib.contextmanager
+def deadline(timeout=None, cancelled=None):
+    """Give up on fetches within the block after timeout seconds.
+
+    Fetches started after the deadline raise DeadlineExceeded, and
+    CONNECT_TIMEOUT and READ_TIMEOUT are capped at the time left, so
+    fetches which the deadline interrupts raise DeadlineExceeded too.
+    An enclosing deadline which expires sooner still applies, and
+    timeout=None leaves the current deadline unchanged.  Like
+    batch(), this applies to the current context.
+
+    cancelled is an optional threading.Event which expires the
+    deadline early when it is set, e.g. by another thread which no
+    longer needs the block's results.  Fetches then stop at their
+    next request or read.
+    """
+    if timeout is None and cancelled is None:
+        yield
+        return
+    expires = float('inf')
+    if timeout is not None:
+        expires = _time.monotonic() + timeout
+    token = _DEADLINE.set(_Deadline(
+        expires=expires, parent=_DEADLINE.get(), cancelled=cancelled))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining():
+    """Return the seconds left before the current deadline, or None."""
+    current = _DEADLINE.get()
+    if current is None:
+        return None
+    return current.remaining()
+
+
+def _postpone(context, outer, seconds):
+    """Postpone the deadlines set in context since outer by seconds."""
+    current = context.get(_DEADLINE)
+    while current is not None and current is not outer:
+        current.expires += seconds
+        current = current.parent
+
+
+def isolated(iterator):
+    """Iterate over iterator in its own copy of the current context.
+
+    Generators which yield from within batch() or deadline() would
+    otherwise leave those set in their caller's context between
+    items, so the caller's own fetches would be batched and limited
+    too.  Here they only cover iterator's own work, and the time the
+    caller spends between items does not count against iterator's
+    deadlines (enclosing deadlines still apply).  Threads which
+    iterator starts with a copy of its context are covered as well.
+    """
+    context = _contextvars.copy_context()
+    outer = context.get(_DEADLINE)
+    try:
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            suspended = _time.monotonic()
+            yield item
+            _postpone(
+                context=context, outer=outer,
+                seconds=_time.monotonic() - suspended)
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            context.run(close)
+
+
+async def isolated_async(iterator):
+    """The asyncio counterpart of isolated(), for async iterators.
+
+    Each step runs as a task in iterator's context, which needs
+    Python 3.11 or later.  Older versions step iterator in the
+    caller's context instead, as if it were not isolated.
+    """
+    context = _contextvars.copy_context()
+    outer = context.get(_DEADLINE)
+
+    async def step(awaitable):
+        if _sys.version_info < (3, 11):
+            return await awaitable
+        return await _asyncio.get_running_loop().create_task(
+            awaitable, context=context)
+
+    try:
+        while True:
+            try:
+                item = await step(awaitable=iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            suspended = _time.monotonic()
+            yield item
+            _postpone(
+                context=context, outer=outer,
+                seconds=_time.monotonic() - suspended)
+    finally:
+        aclose = getattr(iterator, 'aclose', None)
+        if aclose is not None:
+            await step(awaitable=aclose())
+
+
+def start(function, cancelled=None, **kwargs):
+    """Call function(**kwargs) in a daemon thread, returning a Future.
+
+    The call runs in a copy of the current context, within
+    deadline(cancelled=cancelled), so setting cancelled stops its
+    fetches at their next request or read.  Unlike ThreadPoolExecutor
+    workers, daemon threads are not joined at exit, so calls which
+    the caller abandons never delay it.  Cancelling the Future before
+    the thread runs skips the call.
+    """
+    future = _futures.Future()
+    context = _contextvars.copy_context()
+
+    def call():
+        with deadline(cancelled=cancelled):
+            return function(**kwargs)
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = context.run(call)
+        except BaseException as error:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    _threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has expired."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded('deadline exceeded')
+
+
+def _timeouts(uri):
+    """Return (connect, read) timeouts for fetching uri now."""
+    connect, read = CONNECT_TIMEOUT, READ_TIMEOUT
+    left = remaining()
+    if left is None:
+        return connect, read
+    if left <= 0:
+        raise DeadlineExceeded('deadline exceeded before fetching {}'.format(
+            uri))
+    if connect is None or connect > left:
+        connect = left
+    if read is None or read > left:
+        read = left
+    return connect, read
+
+
+@_contextlib.contextmanager
+def _deadline_errors(uri):
+    """Report errors after the deadline has expired as DeadlineExceeded."""
+    try:
+        yield
+    except OSError as error:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(
+                'deadline exceeded while fetching {}'.format(uri)) from error
+        raise
+
+
+def _request_headers(headers):
+    request_headers = {}
+    if ACCEPT_ENCODING:
+        request_headers['Accept-Encoding'] = ACCEPT_ENCODING
+    request_headers.update(headers or {})
+    return request_headers
+
 
-def fetch(uri, media_type='application/json'):
-    """Fetch a JSON resource."""
-    with _urllib_request.urlopen(uri) as response:
-        content_type = response.headers.get_content_type()
-        if content_type != media_type:
-            raise ValueError(
-                '{} returned {}, not {}'.format(uri, content_type, media_type))
-        body_bytes = response.read()
+def _open(uri, headers=None):
+    connect, read = _timeouts(uri=uri)
+    return TRANSPORT.open(
+        uri=uri, headers=_request_headers(headers=headers),
+        connect_timeout=connect, read_timeout=read)
+
+
+def _decoder(uri, headers):
+    return _compression.Decoder(
+        uri=uri, content_encoding=headers.get('Content-Encoding'),
+        max_size=MAX_SIZE)
+
+
+def _read(uri, response):
+    """Read and decode a whole response body."""
+    decoder = _decoder(uri=uri, headers=response.headers)
+    chunks = []
+    while True:
+        body_bytes = response.read(CHUNK_SIZE)
+        chunks.append(decoder.decode(body_bytes, final=not body_bytes))
+        if not body_bytes:
+            return b''.join(chunks)
+
+
+def use_transport(name='urllib'):
+    """Set TRANSPORT and CLIENT, returning the name of the transport used.
+
+    'urllib' uses the standard library (the default), and 'http2'
+    uses httpx (raising ImportError if httpx[http2] is not installed).
+    'auto' uses 'http2' if it is available, and 'urllib' otherwise, so
+    installing httpx only changes the transport for callers who opt in.
+    """
+    global TRANSPORT, CLIENT
+    if name == 'auto':
+        name = 'http2' if _transport.HTTP2 else 'urllib'
+    if name == 'http2':
+        TRANSPORT = _transport.HTTP2Transport()
+        CLIENT = _transport.AsyncHTTP2Client()
+    elif name == 'urllib':
+        TRANSPORT = _transport.UrllibTransport(pool=POOL)
+        CLIENT = _async_http.Client()
+    else:
+        raise ValueError('unknown transport {!r}'.format(name))
+    return name
+
+
+def caching(cache=None):
+    """Return True if fetches are memoized by a cache or batch().
+
+    cache defaults to CACHE, as for fetch().
+    """
+    if cache is None:
+        cache = CACHE
+    return cache is not None or _BATCH.get() is not None
+
+
+def fetch(uri, media_type='application/json', cache=None):
+    """Fetch a JSON resource.
+
+    If cache (which defaults to CACHE) is set, responses are cached
+    according to their HTTP caching headers.
+    """
+    current_batch = _BATCH.get()
+    if current_batch is not None:
+        return current_batch.fetch(
+            key=(uri, media_type),
+            fetch=lambda: _fetch_through_cache(
+                uri=uri, media_type=media_type, cache=cache))
+    return _fetch_through_cache(uri=uri, media_type=media_type, cache=cache)
+
+
+def _fetch_through_cache(uri, media_type, cache):
+    if cache is None:
+        cache = CACHE
+    if cache is None:
+        fetched, _ = _fetch(uri=uri, media_type=media_type)
+        return fetched
+    return cache.fetch(uri=uri, media_type=media_type, fetch=_fetch)
+
+
+def fetch_view(uri, view, media_type='application/json', cache=None):
+    """Fetch a JSON resource and return view(fetched).
+
+    Unlike fetch() results, the view is memoized for as long as the
+    document itself: on the cache entry (see cache.Entry.view) and
+    for the rest of a batch(), so view can build lookup tables which
+    later calls reuse.  The result is shared, so callers must not
+    modify it.
+    """
+    current_batch = _BATCH.get()
+    if current_batch is not None:
+        return current_batch.fetch(
+            key=(uri, media_type, view),
+            fetch=lambda: _view_through_cache(
+                uri=uri, view=view, media_type=media_type, cache=cache),
+            copy=False)
+    return _view_through_cache(
+        uri=uri, view=view, media_type=media_type, cache=cache)
+
+
+def _view_through_cache(uri, view, media_type, cache):
+    if cache is None:
+        cache = CACHE
+    if cache is None:
+        fetched, _ = _fetch(uri=uri, media_type=media_type)
+        return view(fetched)
+    entry = cache.fetch_entry(uri=uri, media_type=media_type, fetch=_fetch)
+    return entry.view(function=view)
+
+
+class _Closing(object):
+    """Iterate over a streamed response, closing it with the iterator.
+
+    close() closes the response even if iteration never started,
+    which closing a generator which has not started would not.
+    """
+    def __init__(self, iterator, response):
+        self._iterator = iterator
+        self._response = response
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            self._iterator.close()
+        finally:
+            self._response.close()
+
+
+def fetch_items(uri, key, media_type='application/json', cache=None):
+    """Fetch a JSON object and iterate over the items of its key array.
+
+    Returns {'uri': final_uri, 'items': iterator}.  Without a cache
+    (which defaults to CACHE) or a batch(), the items are parsed
+    from the response as it arrives, so callers see the first items
+    early, and closing the iterator (even before iterating) abandons
+    the rest of the response.  Otherwise the whole document is
+    fetched with fetch() so it can be stored or shared.  Either way,
+    stream.StructureError is raised while iterating if the document
+    is not an object or key is not an array.
+    """
+    if caching(cache=cache):
+        fetched = fetch(uri=uri, media_type=media_type, cache=cache)
+        return {
+            'uri': fetched['uri'],
+            'items': _stream.document_items(document=fetched['json'], key=key),
+        }
+    with _deadline_errors(uri=uri):
+        response = _open(uri=uri)
+    try:
+        _check_media_type(
+            uri=uri, headers=response.headers, media_type=media_type)
+        final_uri = response.geturl()
+        if final_uri != uri:
+            _LOGGER.debug('redirects lead from {} to {}'.format(
+                uri, final_uri))
         charset = response.headers.get_content_charset()
-        finalURI = response.geturl()
-    if finalURI != uri:
-        _LOGGER.debug('redirects lead from {} to {}'.format(uri, finalURI))
-        uri = finalURI
+        if charset is None:
+            raise ValueError('{} does not declare a charset'.format(final_uri))
+        decoder = _codecs.getincrementaldecoder(charset)()
+        content_decoder = _decoder(uri=final_uri, headers=response.headers)
+    except BaseException:
+        response.close()
+        raise
+    return {
+        'uri': final_uri,
+        'items': _Closing(
+            iterator=_iter_items(
+                uri=final_uri, response=response, charset=charset,
+                decoder=decoder, content_decoder=content_decoder, key=key),
+            response=response),
+    }
+
+
+def _iter_items(uri, response, charset, decoder, content_decoder, key):
+    def chunks():
+        while True:
+            check_deadline()
+            with _deadline_errors(uri=uri):
+                body_bytes = response.read(CHUNK_SIZE)
+            decoded = content_decoder.decode(body_bytes, final=not body_bytes)
+            try:
+                body = decoder.decode(decoded, final=not body_bytes)
+            except ValueError as error:
+                raise ValueError(
+                    '{} returned content which did not match the declared '
+                    '{} charset'.format(uri, charset)) from error
+            yield body
+            if not body_bytes:
+                return
+
+    with response:
+        try:
+            yield from _stream.iter_items(chunks=chunks(), key=key)
+        except _stream.InvalidJSON as error:
+            raise ValueError('{} returned invalid JSON'.format(uri)) from error
+
+
+def fetch_chunks(uri, max_size=None):
+    """Fetch a resource of any media type, streaming its body.
+
+    Returns {'uri': final_uri, 'headers': headers, 'chunks': iterator},
+    where the iterator yields the body (with any Content-Encoding
+    undone) in pieces as it arrives.  It raises compression.TooLarge
+    if the body grows past max_size bytes, which defaults to
+    MAX_SIZE.  Closing the iterator early (even before iterating)
+    abandons the rest of the response.  Bodies are never cached or
+    shared with a batch().
+    """
+    if max_size is None:
+        max_size = MAX_SIZE
+    with _deadline_errors(uri=uri):
+        response = _open(uri=uri)
+    try:
+        final_uri = response.geturl()
+        if final_uri != uri:
+            _LOGGER.debug('redirects lead from {} to {}'.format(
+                uri, final_uri))
+        decoder = _compression.Decoder(
+            uri=final_uri,
+            content_encoding=response.headers.get('Content-Encoding'),
+            max_size=max_size)
+    except BaseException:
+        response.close()
+        raise
+    return {
+        'uri': final_uri,
+        'headers': response.headers,
+        'chunks': _Closing(
+            iterator=_iter_chunks(
+                uri=final_uri, response=response, decoder=decoder),
+            response=response),
+    }
+
+
+def _iter_chunks(uri, response, decoder):
+    with response:
+        while True:
+            check_deadline()
+            with _deadline_errors(uri=uri):
+                body_bytes = response.read(CHUNK_SIZE)
+            data = decoder.decode(body_bytes, final=not body_bytes)
+            if data:
+                yield data
+            if not body_bytes:
+                return
+
+
+async def fetch_async(uri, media_type='application/json', cache=None):
+    """Fetch a JSON resource without blocking the event loop.
+
+    The asyncio counterpart of fetch(), using CLIENT.
+    """
+    if cache is None:
+        cache = CACHE
+    if cache is None:
+        fetched, _ = await _fetch_async(uri=uri, media_type=media_type)
+        return fetched
+    return await cache.fetch_async(
+        uri=uri, media_type=media_type, fetch=_fetch_async)
+
+
+async def fetch_view_async(uri, view, media_type='application/json',
+                           cache=None):
+    """The asyncio counterpart of fetch_view()."""
+    if cache is None:
+        cache = CACHE
+    if cache is None:
+        fetched, _ = await _fetch_async(uri=uri, media_type=media_type)
+        return view(fetched)
+    entry = await cache.fetch_entry_async(
+        uri=uri, media_type=media_type, fetch=_fetch_async)
+    return entry.view(function=view)
+
+
+def _fetch(uri, media_type, headers=None):
+    """Fetch a JSON resource, also returning the response headers."""
+    with _deadline_errors(uri=uri), _open(
+            uri=uri, headers=headers) as response:
+        _check_media_type(
+            uri=uri, headers=response.headers, media_type=media_type)
+        final_uri = response.geturl()
+        body_bytes = _read(uri=final_uri, response=response)
+        response_headers = response.headers
+    return _decode(
+        uri=uri, final_uri=final_uri, headers=response_headers,
+        body_bytes=body_bytes), response_headers
+
+
+async def _fetch_async(uri, media_type, headers=None):
+    connect, read = _timeouts(uri=uri)
+    with _deadline_errors(uri=uri):
+        response = await CLIENT.get(
+            uri=uri, headers=_request_headers(headers=headers),
+            connect_timeout=connect, read_timeout=read, max_size=MAX_SIZE)
+    _check_media_type(uri=uri, headers=response.headers, media_type=media_type)
+    body_bytes = _decoder(uri=response.url, headers=response.headers).decode(
+        response.body, final=True)
+    return _decode(
+        uri=uri, final_uri=response.url, headers=response.headers,
+        body_bytes=body_bytes), response.headers
+
+
+def _check_media_type(uri, headers, media_type):
+    content_type = headers.get_content_type()
+    if content_type != media_type:
+        raise ValueError(
+            '{} returned {}, not {}'.format(uri, content_type, media_type))
+
+
+def _decode(uri, final_uri, headers, body_bytes):
+    charset = headers.get_content_charset()
+    if final_uri != uri:
+        _LOGGER.debug('redirects lead from {} to {}'.format(uri, final_uri))
+        uri = final_uri
     if charset is None:
         raise ValueError('{} does not declare a charset'.format(uri))
     try:
@@ -42,9 +653,7 @@ def fetch(uri, media_type='application/json'):
             '{} returned content which did not match the declared {} charset'
             .format(uri, charset)) from error
     try:
-        return {
-            'uri': uri,
-            'json': _json.loads(body),
-        }
+        json = _json.loads(body)
     except ValueError as error:
         raise ValueError('{} returned invalid JSON'.format(uri)) from error
+    return {'uri': uri, 'json': json}
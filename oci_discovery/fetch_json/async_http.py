@@ -0,0 +1,310 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio as _asyncio
+import email.parser as _email_parser
+import http.client as _http_client
+import io as _io
+import logging as _logging
+import socket as _socket
+import ssl as _ssl
+import time as _time
+import urllib.error as _urllib_error
+import urllib.parse as _urllib_parse
+import weakref as _weakref
+
+from . import compression as _compression
+from . import happy_eyeballs as _happy_eyeballs
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {
+    'http': _http_client.HTTP_PORT,
+    'https': _http_client.HTTPS_PORT,
+}
+
+_REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+# Bytes read at a time from bodies without a Content-Length.
+_CHUNK_SIZE = 64 * 1024
+
+
+class Response(object):
+    """A fully-read HTTP response."""
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class _Connection(object):
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class Client(object):
+    """Minimal asyncio HTTP/1.1 client for GET requests.
+
+    Redirects are followed, and failures are reported with the same
+    urllib.error exceptions urllib.request raises, so callers can
+    handle both paths alike.  Idle keep-alive connections are pooled
+    per event loop and (scheme, host, port), like pool.ConnectionPool.
+    Call aclose() before the event loop closes to close them.  IPv6
+    and IPv4 addresses are raced as in happy_eyeballs.
+    """
+    def __init__(self, max_idle=4, idle_timeout=30, ssl_context=None,
+                 max_redirects=10):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context
+        self.max_redirects = max_redirects
+        self._idle = _weakref.WeakKeyDictionary()
+
+    def _acquire(self, key):
+        idle = self._idle.get(_asyncio.get_running_loop(), {}).get(key, [])
+        now = _time.monotonic()
+        while idle:
+            connection, released = idle.pop()
+            if (now - released <= self.idle_timeout and
+                    not connection.writer.is_closing() and
+                    not connection.reader.at_eof()):
+                return connection
+            connection.close()
+        return None
+
+    def _release(self, key, connection):
+        loop = _asyncio.get_running_loop()
+        idle = self._idle.setdefault(loop, {}).setdefault(key, [])
+        if len(idle) < self.max_idle:
+            idle.append((connection, _time.monotonic()))
+        else:
+            connection.close()
+
+    async def aclose(self):
+        """Close the running event loop's idle connections."""
+        idle = self._idle.pop(_asyncio.get_running_loop(), {})
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+                try:
+                    await connection.writer.wait_closed()
+                except OSError:
+                    pass  # already reset by the server
+
+    async def get(self, uri, headers=None, connect_timeout=None,
+                  read_timeout=None, max_size=None):
+        """GET uri, returning a Response for a 2xx status.
+
+        connect_timeout limits the time spent connecting, and
+        read_timeout the time spent sending the request and reading
+        the response.  Timeouts raise a URLError whose reason is a
+        socket.timeout, as urllib.request does.  Bodies longer than
+        max_size bytes (as sent, before any Content-Encoding is
+        undone) raise compression.TooLarge without being read.
+        """
+        for _ in range(self.max_redirects + 1):
+            response = await self._get(
+                uri=uri, headers=headers or {},
+                connect_timeout=connect_timeout, read_timeout=read_timeout,
+                max_size=max_size)
+            location = response.headers.get('Location')
+            if response.status in _REDIRECT_CODES and location:
+                redirect = _urllib_parse.urljoin(uri, location)
+                _LOGGER.debug('{} redirected to {}'.format(uri, redirect))
+                uri = redirect
+                continue
+            break
+        else:
+            raise _urllib_error.HTTPError(
+                uri, response.status, 'too many redirects',
+                response.headers, _io.BytesIO(response.body))
+        if not 200 <= response.status < 300:
+            raise _urllib_error.HTTPError(
+                uri, response.status, response.reason, response.headers,
+                _io.BytesIO(response.body))
+        return response
+
+    async def _get(self, uri, headers, connect_timeout=None,
+                   read_timeout=None, max_size=None):
+        split = _urllib_parse.urlsplit(uri)
+        if split.scheme not in _DEFAULT_PORTS:
+            raise _urllib_error.URLError(
+                'unknown url type: {}'.format(split.scheme))
+        if not split.hostname:
+            raise _urllib_error.URLError('no host given')
+        port = split.port or _DEFAULT_PORTS[split.scheme]
+        key = (split.scheme, split.hostname, port)
+        selector = split.path or '/'
+        if split.query:
+            selector += '?' + split.query
+        request_headers = {
+            'Host': split.netloc.rpartition('@')[2],
+            'Accept-Encoding': 'identity',
+        }
+        request_headers.update(
+            {name.title(): value for name, value in headers.items()})
+        request = ''.join(
+            ['GET {} HTTP/1.1\r\n'.format(selector)] +
+            ['{}: {}\r\n'.format(name, value)
+             for name, value in request_headers.items()] +
+            ['\r\n']).encode('ISO-8859-1')
+
+        connection = self._acquire(key=key)
+        reused = connection is not None
+        while True:
+            try:
+                if connection is None:
+                    ssl = None
+                    if split.scheme == 'https':
+                        ssl = self.ssl_context or _ssl.create_default_context()
+                    reader, writer = await _asyncio.wait_for(
+                        _asyncio.open_connection(
+                            split.hostname, port, ssl=ssl,
+                            happy_eyeballs_delay=_happy_eyeballs.DELAY,
+                            interleave=1),
+                        timeout=connect_timeout)
+                    connection = _Connection(reader=reader, writer=writer)
+                status_line = await _asyncio.wait_for(
+                    self._send(connection=connection, request=request),
+                    timeout=read_timeout)
+                if not status_line:
+                    raise ConnectionResetError('remote end closed connection')
+            except _asyncio.TimeoutError:
+                if connection is not None:
+                    connection.close()
+                raise _urllib_error.URLError(_socket.timeout('timed out'))
+            except ConnectionError as error:
+                if connection is not None:
+                    connection.close()
+                if not reused:
+                    raise _urllib_error.URLError(error)
+                # the server closed the idle connection, try again
+                # with a fresh one.
+                _LOGGER.debug('stale connection to {}'.format(key))
+                connection = None
+                reused = False
+                continue
+            except OSError as error:
+                if connection is not None:
+                    connection.close()
+                raise _urllib_error.URLError(error)
+            break
+
+        try:
+            response, reusable = await _asyncio.wait_for(
+                self._read_response(
+                    uri=uri, connection=connection, status_line=status_line,
+                    max_size=max_size),
+                timeout=read_timeout)
+        except _compression.TooLarge:
+            connection.close()
+            raise
+        except _asyncio.TimeoutError:
+            connection.close()
+            raise _urllib_error.URLError(_socket.timeout('timed out'))
+        except (OSError, EOFError, ValueError) as error:
+            connection.close()
+            raise _urllib_error.URLError(error)
+        if reusable:
+            self._release(key=key, connection=connection)
+        else:
+            connection.close()
+        return response
+
+    async def _send(self, connection, request):
+        """Send request, returning the response's status line."""
+        connection.writer.write(request)
+        await connection.writer.drain()
+        return await connection.reader.readline()
+
+    async def _read_response(self, uri, connection, status_line,
+                             max_size=None):
+        reader = connection.reader
+        version, status, reason = (
+            status_line.decode('ISO-8859-1').rstrip('\r\n') + ' '
+        ).split(' ', 2)
+        if not version.startswith('HTTP/'):
+            raise ValueError('bad status line {!r}'.format(status_line))
+        status = int(status)
+        header_lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line)
+        headers = _email_parser.Parser(
+            _class=_http_client.HTTPMessage).parsestr(
+                b''.join(header_lines).decode('ISO-8859-1'))
+        will_close = (
+            version == 'HTTP/1.0' or
+            'close' in headers.get('Connection', '').lower())
+        if status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif 'chunked' in headers.get('Transfer-Encoding', '').lower():
+            body = await self._read_chunked(
+                uri=uri, reader=reader, max_size=max_size)
+        elif headers.get('Content-Length') is not None:
+            length = int(headers['Content-Length'])
+            _check_size(uri=uri, size=length, max_size=max_size)
+            body = await reader.readexactly(length)
+        else:
+            body = await self._read_until_eof(
+                uri=uri, reader=reader, max_size=max_size)
+            will_close = True
+        response = Response(
+            url=uri, status=status, reason=reason.strip(), headers=headers,
+            body=body)
+        return response, not will_close
+
+    async def _read_until_eof(self, uri, reader, max_size=None):
+        chunks = []
+        length = 0
+        while True:
+            chunk = await reader.read(_CHUNK_SIZE)
+            if not chunk:
+                return b''.join(chunks)
+            length += len(chunk)
+            _check_size(uri=uri, size=length, max_size=max_size)
+            chunks.append(chunk)
+
+    async def _read_chunked(self, uri, reader, max_size=None):
+        chunks = []
+        length = 0
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                break
+            length += size
+            _check_size(uri=uri, size=length, max_size=max_size)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)  # CRLF after the chunk
+        while True:  # discard trailers
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+        return b''.join(chunks)
+
+
+def _check_size(uri, size, max_size):
+    if max_size is not None and size > max_size:
+        raise _compression.TooLarge('{} returned more than {} bytes'.format(
+            uri, max_size))
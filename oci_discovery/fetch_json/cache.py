@@ -0,0 +1,392 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections as _collections
+import copy as _copy
+import email.utils as _email_utils
+import hashlib as _hashlib
+import json as _json
+import logging as _logging
+import os as _os
+import tempfile as _tempfile
+import threading as _threading
+import time as _time
+import urllib.error as _urllib_error
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+
+def _cache_control(headers):
+    directives = {}
+    for value in headers.get_all('Cache-Control') or []:
+        for directive in value.split(','):
+            key, _, argument = directive.strip().partition('=')
+            if key:
+                directives[key.lower()] = argument.strip('"')
+    return directives
+
+
+def _http_date(value):
+    if value is None:
+        return None
+    try:
+        return _email_utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def expires(headers, now=None):
+    """Return the time (seconds since the epoch) a response goes stale.
+
+    Returns None if the response must not be stored at all.  Follows
+    the Cache-Control and Expires rules from RFC 7234, without
+    heuristic freshness, so responses without explicit freshness
+    information are stale immediately (but may still be revalidated).
+    """
+    if now is None:
+        now = _time.time()
+    directives = _cache_control(headers=headers)
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return now
+    try:
+        age = max(int(headers.get('Age', 0)), 0)
+    except ValueError:
+        age = 0
+    if 'max-age' in directives:
+        try:
+            return now + int(directives['max-age']) - age
+        except ValueError:
+            return now
+    expires = headers.get('Expires')
+    if expires is not None:
+        expires = _http_date(value=expires)
+        if expires is None:
+            return now  # invalid dates like '0' mean 'already expired'
+        date = _http_date(value=headers.get('Date'))
+        if date is None:
+            return expires
+        return now + expires - date - age
+    return now
+
+
+class Entry(object):
+    """A cached fetch_json.fetch result and its HTTP validators."""
+    def __init__(self, uri, json, etag=None, last_modified=None,
+                 expires=0):
+        self.uri = uri
+        self.json = json
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self._views = {}
+
+    def fresh(self, now=None):
+        if now is None:
+            now = _time.time()
+        return now < self.expires
+
+    def validators(self):
+        """Return conditional-request headers for revalidation."""
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def fetched(self):
+        """Return a fetch_json.fetch result the caller may modify."""
+        return {
+            'uri': self.uri,
+            'json': _copy.deepcopy(self.json),
+        }
+
+    def view(self, function):
+        """Return function(fetched), computed at most once per entry.
+
+        fetched is {'uri': ..., 'json': ...} sharing this entry's
+        JSON, and the result is shared by every caller, so neither
+        may be modified.  Views are keyed by function, so use a
+        module-level function rather than a new lambda for each call.
+        """
+        try:
+            return self._views[function]
+        except KeyError:
+            pass
+        value = self._views[function] = function(
+            {'uri': self.uri, 'json': self.json})
+        return value
+
+    def dict(self):
+        return {
+            'uri': self.uri,
+            'json': self.json,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'expires': self.expires,
+        }
+
+
+class DirectoryStore(object):
+    """Persistent Cache backing store with one JSON file per entry.
+
+    Files are replaced atomically, so several processes may share a
+    directory: readers see either the old or the new entry, and
+    concurrent writers simply race to leave the latest one.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _path(self, uri, media_type):
+        key = '{}\n{}'.format(uri, media_type).encode('UTF-8')
+        digest = _hashlib.sha256(key).hexdigest()
+        return _os.path.join(self.path, digest[:2], digest + '.json')
+
+    def load(self, uri, media_type):
+        path = self._path(uri=uri, media_type=media_type)
+        try:
+            with open(path, encoding='UTF-8') as f:
+                data = _json.load(f)
+            if data['uri'] != uri or data['mediaType'] != media_type:
+                return None
+            return Entry(**data['entry'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            _LOGGER.debug('ignoring unreadable cache file {} ({})'.format(
+                path, error))
+            return None
+
+    def save(self, uri, media_type, entry):
+        path = self._path(uri=uri, media_type=media_type)
+        directory = _os.path.dirname(path)
+        data = {'uri': uri, 'mediaType': media_type, 'entry': entry.dict()}
+        try:
+            _os.makedirs(directory, exist_ok=True)
+            with _tempfile.NamedTemporaryFile(
+                    mode='w', encoding='UTF-8', dir=directory,
+                    prefix='.', suffix='.tmp', delete=False) as f:
+                try:
+                    _json.dump(data, f)
+                except:
+                    _os.unlink(f.name)
+                    raise
+            _os.replace(f.name, path)
+        except OSError as error:
+            _LOGGER.warning('failed to write cache file {} ({})'.format(
+                path, error))
+
+
+class Cache(object):
+    """In-memory, size-bounded LRU cache for fetch_json.fetch.
+
+    Fresh entries are served without touching the network.  Stale
+    entries with an ETag or Last-Modified validator are revalidated
+    with a conditional request, and a 304 response serves the
+    already-parsed JSON.  'hits' counts responses served from the
+    cache (including after a 304) and 'misses' counts full
+    downloads.
+
+    If store is set (e.g. to a DirectoryStore), entries are written
+    through to it and memory misses are loaded from it.
+    """
+    def __init__(self, max_entries=256, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._lock = _threading.Lock()
+        self._entries = _collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, uri, media_type):
+        key = (uri, media_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if self.store is not None and (entry is None or not entry.fresh()):
+            # another process may have refreshed the stored entry
+            stored = self.store.load(uri=uri, media_type=media_type)
+            if stored is not None and (
+                    entry is None or stored.expires > entry.expires):
+                entry = stored
+                self._remember(key=key, entry=entry)
+        return entry
+
+    def put(self, uri, media_type, entry):
+        self._remember(key=(uri, media_type), entry=entry)
+        if self.store is not None:
+            self.store.save(uri=uri, media_type=media_type, entry=entry)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _lookup(self, uri, media_type):
+        """Return (entry, request_headers), counting fresh hits.
+
+        The entry is None on a miss.  request_headers is None when the
+        entry is fresh and can be served without a request.
+        """
+        entry = self.get(uri=uri, media_type=media_type)
+        if entry is None:
+            return None, {}
+        if entry.fresh():
+            _LOGGER.debug('cached response for {} is fresh'.format(uri))
+            self._count(hit=True)
+            return entry, None
+        return entry, entry.validators()
+
+    def _not_modified(self, uri, media_type, entry, error):
+        error.close()
+        _LOGGER.debug('revalidated cached response for {}'.format(uri))
+        expiry = expires(headers=error.headers)
+        if expiry is not None:
+            views = entry._views
+            entry = Entry(
+                uri=entry.uri,
+                json=entry.json,
+                etag=error.headers.get('ETag', entry.etag),
+                last_modified=error.headers.get(
+                    'Last-Modified', entry.last_modified),
+                expires=expiry)
+            entry._views = views  # the JSON has not changed
+            self.put(uri=uri, media_type=media_type, entry=entry)
+        self._count(hit=True)
+        return entry
+
+    def _downloaded(self, uri, media_type, fetched, headers):
+        """Return (entry, stored) for a full download."""
+        self._count(hit=False)
+        expiry = expires(headers=headers)
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        entry = Entry(
+            uri=fetched['uri'],
+            json=fetched['json'],
+            etag=etag,
+            last_modified=last_modified,
+            expires=0 if expiry is None else expiry)
+        stored = expiry is not None and (
+            etag is not None or
+            last_modified is not None or
+            expiry > _time.time())
+        if stored:
+            self.put(uri=uri, media_type=media_type, entry=entry)
+        return entry, stored
+
+    def fetch_entry(self, uri, media_type, fetch):
+        """Fetch through the cache, returning an Entry.
+
+        The entry is shared with the cache (unless the response could
+        not be stored), so its JSON must not be modified.  Use fetch
+        for a copy, or Entry.view for memoized derived data.  fetch is
+        called as for Cache.fetch.
+        """
+        entry, headers = self._lookup(uri=uri, media_type=media_type)
+        if headers is None:
+            return entry
+        try:
+            fetched, response_headers = fetch(
+                uri=uri, media_type=media_type, headers=headers)
+        except _urllib_error.HTTPError as error:
+            if error.code != 304 or entry is None:
+                raise
+            return self._not_modified(
+                uri=uri, media_type=media_type, entry=entry, error=error)
+        entry, _ = self._downloaded(
+            uri=uri, media_type=media_type, fetched=fetched,
+            headers=response_headers)
+        return entry
+
+    async def fetch_entry_async(self, uri, media_type, fetch):
+        """Like fetch_entry, but awaiting a coroutine function fetch."""
+        entry, headers = self._lookup(uri=uri, media_type=media_type)
+        if headers is None:
+            return entry
+        try:
+            fetched, response_headers = await fetch(
+                uri=uri, media_type=media_type, headers=headers)
+        except _urllib_error.HTTPError as error:
+            if error.code != 304 or entry is None:
+                raise
+            return self._not_modified(
+                uri=uri, media_type=media_type, entry=entry, error=error)
+        entry, _ = self._downloaded(
+            uri=uri, media_type=media_type, fetched=fetched,
+            headers=response_headers)
+        return entry
+
+    def fetch(self, uri, media_type, fetch):
+        """Fetch through the cache.
+
+        fetch is called as fetch(uri=..., media_type=..., headers=...)
+        and must return a (fetched, response_headers) tuple.
+        """
+        entry, headers = self._lookup(uri=uri, media_type=media_type)
+        if headers is None:
+            return entry.fetched()
+        try:
+            fetched, response_headers = fetch(
+                uri=uri, media_type=media_type, headers=headers)
+        except _urllib_error.HTTPError as error:
+            if error.code != 304 or entry is None:
+                raise
+            return self._not_modified(
+                uri=uri, media_type=media_type, entry=entry,
+                error=error).fetched()
+        return self._fetched(
+            uri=uri, media_type=media_type, fetched=fetched,
+            headers=response_headers)
+
+    async def fetch_async(self, uri, media_type, fetch):
+        """Like fetch, but awaiting a coroutine function fetch."""
+        entry, headers = self._lookup(uri=uri, media_type=media_type)
+        if headers is None:
+            return entry.fetched()
+        try:
+            fetched, response_headers = await fetch(
+                uri=uri, media_type=media_type, headers=headers)
+        except _urllib_error.HTTPError as error:
+            if error.code != 304 or entry is None:
+                raise
+            return self._not_modified(
+                uri=uri, media_type=media_type, entry=entry,
+                error=error).fetched()
+        return self._fetched(
+            uri=uri, media_type=media_type, fetched=fetched,
+            headers=response_headers)
+
+    def _fetched(self, uri, media_type, fetched, headers):
+        entry, stored = self._downloaded(
+            uri=uri, media_type=media_type, fetched=fetched, headers=headers)
+        if stored:
+            return entry.fetched()
+        return fetched  # not shared, so no copy is needed
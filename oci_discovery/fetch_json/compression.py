@@ -0,0 +1,188 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""HTTP content codings.
+
+gzip and deflate use the standard library's zlib.  br and zstd are
+also offered when the brotli and zstandard packages are installed.
+"""
+
+import zlib as _zlib
+
+try:
+    import brotli as _brotli
+except ImportError:
+    _brotli = None
+
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
+
+
+# Compressed bytes handed to br and zstd decompressors at a time.
+# Unlike zlib, they cannot cap their output, so small slices keep
+# each step's output small enough to check against the size limit.
+_SLICE = 1024
+
+
+class TooLarge(ValueError):
+    """A decoded response body exceeded its size limit."""
+
+
+class _Zlib(object):
+    def __init__(self, wbits):
+        self._decompressor = _zlib.decompressobj(wbits)
+
+    def decompress(self, data, max_length):
+        # The output is only capped to detect oversized bodies, so any
+        # unconsumed input is abandoned along with the body.
+        return self._decompressor.decompress(data, max_length)
+
+    def finished(self):
+        return self._decompressor.eof
+
+
+class _Deflate(_Zlib):
+    """Both zlib-wrapped (RFC 1950) and raw (RFC 1951) deflate data.
+
+    RFC 7230 section 4.2.2 asks for the former, but some servers send
+    the latter.
+    """
+    def __init__(self):
+        self._decompressor = None
+        self._head = b''
+
+    def decompress(self, data, max_length):
+        if self._decompressor is None:
+            self._head += data
+            if len(self._head) < 2:
+                return b''
+            data, self._head = self._head, None
+            wrapped = (data[0] & 0x0f == 8 and
+                       (data[0] << 8 | data[1]) % 31 == 0)
+            self._decompressor = _zlib.decompressobj(
+                _zlib.MAX_WBITS if wrapped else -_zlib.MAX_WBITS)
+        return super().decompress(data=data, max_length=max_length)
+
+    def finished(self):
+        return self._decompressor is not None and self._decompressor.eof
+
+
+class _Sliced(object):
+    def decompress(self, data, max_length):
+        output = []
+        size = 0
+        for start in range(0, len(data), _SLICE):
+            chunk = self._process(data[start:start + _SLICE])
+            output.append(chunk)
+            size += len(chunk)
+            if max_length and size >= max_length:
+                break
+        return b''.join(output)
+
+
+class _Brotli(_Sliced):
+    def __init__(self):
+        self._decompressor = _brotli.Decompressor()
+
+    def _process(self, data):
+        return self._decompressor.process(data)
+
+    def finished(self):
+        return self._decompressor.is_finished()
+
+
+class _Zstd(_Sliced):
+    def __init__(self):
+        self._decompressor = _zstandard.ZstdDecompressor().decompressobj()
+
+    def _process(self, data):
+        return self._decompressor.decompress(data)
+
+    def finished(self):
+        return getattr(self._decompressor, 'eof', True)
+
+
+_DECOMPRESSORS = {
+    'gzip': lambda: _Zlib(wbits=16 + _zlib.MAX_WBITS),
+    'x-gzip': lambda: _Zlib(wbits=16 + _zlib.MAX_WBITS),
+    'deflate': _Deflate,
+}
+if _brotli is not None:
+    _DECOMPRESSORS['br'] = _Brotli
+if _zstandard is not None:
+    _DECOMPRESSORS['zstd'] = _Zstd
+
+# Accept-Encoding value listing every supported coding, most
+# compact first.
+ACCEPT_ENCODING = ', '.join(
+    coding for coding in ['zstd', 'br', 'gzip', 'deflate']
+    if coding in _DECOMPRESSORS)
+
+
+class Decoder(object):
+    """Incrementally undo a response's Content-Encoding.
+
+    content_encoding is the response's Content-Encoding header (None
+    for an unencoded body).  decode() raises TooLarge once the decoded
+    body grows past max_size bytes (None for no limit), and ValueError
+    for unsupported codings, corrupt data or truncated bodies.  uri is
+    only used in error messages.
+    """
+    def __init__(self, uri, content_encoding=None, max_size=None):
+        self.uri = uri
+        self.max_size = max_size
+        self.size = 0
+        codings = [
+            coding.strip().lower()
+            for coding in (content_encoding or '').split(',')]
+        codings = [
+            coding for coding in codings if coding not in ('', 'identity')]
+        for coding in codings:
+            if coding not in _DECOMPRESSORS:
+                raise ValueError('{} returned an unsupported {!r} content coding'
+                                 .format(uri, coding))
+        # codings lists the codings in the order they were applied
+        self._stages = [
+            (coding, _DECOMPRESSORS[coding]())
+            for coding in reversed(codings)]
+
+    def decode(self, data, final=False):
+        """Decode the next chunk of the body.
+
+        Set final once the body is complete, which checks that no
+        compressed stream was truncated.
+        """
+        for coding, decompressor in self._stages:
+            max_length = 0
+            if self.max_size is not None:
+                max_length = self.max_size - self.size + 1
+            try:
+                data = decompressor.decompress(data=data, max_length=max_length)
+            except Exception as error:
+                raise ValueError('{} returned invalid {} data ({})'.format(
+                    self.uri, coding, error)) from error
+            self._check_size(size=len(data))
+            if final and not decompressor.finished():
+                raise ValueError('{} returned truncated {} data'.format(
+                    self.uri, coding))
+        self.size += len(data)
+        self._check_size(size=0)
+        return data
+
+    def _check_size(self, size):
+        if self.max_size is not None and self.size + size > self.max_size:
+            raise TooLarge('{} returned more than {} bytes'.format(
+                self.uri, self.max_size))
@@ -0,0 +1,135 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Happy Eyeballs connection setup.
+
+https://tools.ietf.org/html/rfc8305
+"""
+
+import collections as _collections
+import errno as _errno
+import os as _os
+import selectors as _selectors
+import socket as _socket
+import time as _time
+
+
+# Seconds to wait for a connection attempt before starting the next
+# one in parallel, as recommended by RFC 8305 section 5.
+DELAY = 0.25
+
+_IN_PROGRESS = {0, _errno.EINPROGRESS, _errno.EWOULDBLOCK, _errno.EALREADY}
+
+
+def interleave(addresses):
+    """Alternate getaddrinfo results between address families.
+
+    The first family is the one getaddrinfo returned first, and the
+    order within each family is preserved (RFC 8305 section 4).
+    """
+    families = _collections.OrderedDict()
+    for address in addresses:
+        families.setdefault(address[0], _collections.deque()).append(address)
+    queues = list(families.values())
+    interleaved = []
+    while queues:
+        for queue in queues:
+            interleaved.append(queue.popleft())
+        queues = [queue for queue in queues if queue]
+    return interleaved
+
+
+def create_connection(address, timeout=_socket._GLOBAL_DEFAULT_TIMEOUT,
+                      source_address=None, delay=None):
+    """A drop-in replacement for socket.create_connection.
+
+    Instead of trying each address in turn, a new attempt starts
+    every delay seconds (DELAY by default) while earlier attempts are
+    still pending, or as soon as an attempt fails, and the first
+    attempt to connect wins.  timeout covers the whole connection
+    setup, and is then set on the returned socket.
+    """
+    if delay is None:
+        delay = DELAY
+    if timeout is _socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = _socket.getdefaulttimeout()
+    host, port = address[:2]
+    addresses = interleave(_socket.getaddrinfo(
+        host, port, 0, _socket.SOCK_STREAM))
+    if not addresses:
+        raise OSError('getaddrinfo returns an empty list')
+    start = _time.monotonic()
+    expires = None if timeout is None else start + timeout
+    next_attempt = start
+    pending = {}
+    errors = []
+    selector = _selectors.DefaultSelector()
+    try:
+        while addresses or pending:
+            now = _time.monotonic()
+            if expires is not None and now >= expires:
+                raise _socket.timeout('timed out')
+            if addresses and (not pending or now >= next_attempt):
+                sock = _attempt(
+                    address=addresses.pop(0), source_address=source_address,
+                    errors=errors)
+                if sock is not None:
+                    pending[sock] = True
+                    selector.register(sock, _selectors.EVENT_WRITE)
+                    next_attempt = now + delay
+                continue
+            wait = None
+            if addresses:
+                wait = max(next_attempt - now, 0)
+            if expires is not None:
+                left = expires - now
+                wait = left if wait is None else min(wait, left)
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                selector.unregister(sock)
+                del pending[sock]
+                error = sock.getsockopt(_socket.SOL_SOCKET, _socket.SO_ERROR)
+                if error:
+                    errors.append(OSError(error, _os.strerror(error)))
+                    sock.close()
+                    next_attempt = now  # start the next attempt now
+                    continue
+                sock.setblocking(True)
+                sock.settimeout(timeout)
+                return sock
+        raise errors[-1]
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+
+
+def _attempt(address, source_address, errors):
+    """Start a non-blocking connection, returning None on failure."""
+    family, type_, proto, _, sockaddr = address
+    sock = None
+    try:
+        sock = _socket.socket(family, type_, proto)
+        sock.setblocking(False)
+        if source_address:
+            sock.bind(source_address)
+        error = sock.connect_ex(sockaddr)
+        if error not in _IN_PROGRESS:
+            raise OSError(error, _os.strerror(error))
+    except OSError as error:
+        errors.append(error)
+        if sock is not None:
+            sock.close()
+        return None
+    return sock
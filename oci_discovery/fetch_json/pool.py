@@ -0,0 +1,214 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.client as _http_client
+import logging as _logging
+import socket as _socket
+import threading as _threading
+import time as _time
+import urllib.error as _urllib_error
+import urllib.parse as _urllib_parse
+import urllib.request as _urllib_request
+
+from . import happy_eyeballs as _happy_eyeballs
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+_DEFAULT_PORTS = {
+    'http': _http_client.HTTP_PORT,
+    'https': _http_client.HTTPS_PORT,
+}
+
+
+class ConnectionPool(object):
+    """Idle keep-alive connections keyed by (scheme, host, port).
+
+    At most max_idle idle connections are kept for each key, and
+    connections which have been idle for more than idle_timeout
+    seconds are closed instead of being reused.
+    """
+    def __init__(self, max_idle=4, idle_timeout=30):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._lock = _threading.Lock()
+        self._idle = {}
+
+    def acquire(self, key):
+        """Return an idle connection for key, or None if there are none."""
+        stale = []
+        connection = None
+        now = _time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, released = idle.pop()
+                if now - released <= self.idle_timeout:
+                    connection = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            candidate.close()
+        return connection
+
+    def release(self, key, connection):
+        """Return a connection to the pool for later reuse."""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((connection, _time.monotonic()))
+                return
+        connection.close()
+
+    def clear(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+
+class _PooledResponse(_http_client.HTTPResponse):
+    """HTTPResponse which releases its connection when exhausted."""
+    _release = None
+    _reusable = True
+
+    def close(self):
+        if self.fp is not None and self.length != 0:
+            # closed before the body was consumed, so unread data may
+            # still be waiting on the socket.
+            self._reusable = False
+        super().close()
+
+    def _close_conn(self):
+        super()._close_conn()
+        release, self._release = self._release, None
+        if release is not None:
+            release(self._reusable and not self.will_close and
+                    self.length in (None, 0))
+
+
+def _timeout(timeout):
+    if timeout is _socket._GLOBAL_DEFAULT_TIMEOUT:
+        return _socket.getdefaulttimeout()
+    return timeout
+
+
+def _key(scheme, host):
+    split = _urllib_parse.urlsplit('//{}'.format(host))
+    return (scheme, split.hostname, split.port or _DEFAULT_PORTS.get(scheme))
+
+
+class _PooledHandlerMixin(object):
+    """Replacement for AbstractHTTPHandler.do_open using a pool.
+
+    Unlike the stock handlers, this does not send 'Connection: close'.
+    Connections are returned to the pool once the response body has
+    been read.  If the request has a read_timeout attribute, the
+    request's timeout only applies while connecting, and reads
+    (including the response) use read_timeout.
+    """
+    def do_open(self, http_class, req, **http_conn_args):
+        host = req.host
+        if not host:
+            raise _urllib_error.URLError('no host given')
+        key = _key(scheme=req.type, host=req._tunnel_host or host)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items()
+                        if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+        tunnel_headers = {}
+        if 'Proxy-Authorization' in headers:
+            tunnel_headers['Proxy-Authorization'] = headers.pop(
+                'Proxy-Authorization')
+
+        read_timeout = _timeout(
+            getattr(req, 'read_timeout', req.timeout))
+        connection = self.pool.acquire(key=key)
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = http_class(
+                    host, timeout=req.timeout, **http_conn_args)
+                # race IPv6 and IPv4 addresses instead of trying
+                # them one after another.
+                connection._create_connection = (
+                    _happy_eyeballs.create_connection)
+                connection.set_debuglevel(self._debuglevel)
+                if req._tunnel_host:
+                    connection.set_tunnel(
+                        req._tunnel_host, headers=tunnel_headers)
+            else:
+                connection.timeout = _timeout(req.timeout)
+                if connection.sock is not None:
+                    connection.sock.settimeout(read_timeout)
+            connection.response_class = _PooledResponse
+            try:
+                try:
+                    connection.request(
+                        req.get_method(), req.selector, req.data, headers,
+                        encode_chunked=req.has_header('Transfer-encoding'))
+                    if connection.sock is not None:
+                        connection.sock.settimeout(read_timeout)
+                    response = connection.getresponse()
+                except (ConnectionError, _http_client.BadStatusLine):
+                    if not reused:
+                        raise
+                    # the server closed the idle connection, try again
+                    # with a fresh one.
+                    _LOGGER.debug('stale connection to {}'.format(key))
+                    connection.close()
+                    connection = None
+                    reused = False
+                    continue
+                except OSError as error:
+                    raise _urllib_error.URLError(error)
+            except:
+                connection.close()
+                raise
+            break
+
+        def release(reusable, connection=connection):
+            if reusable:
+                self.pool.release(key=key, connection=connection)
+            else:
+                connection.close()
+
+        if response.isclosed():
+            release(reusable=not response.will_close)
+        else:
+            response._release = release
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+
+class HTTPHandler(_PooledHandlerMixin, _urllib_request.HTTPHandler):
+    def __init__(self, pool, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool
+
+
+class HTTPSHandler(_PooledHandlerMixin, _urllib_request.HTTPSHandler):
+    def __init__(self, pool, **kwargs):
+        super().__init__(**kwargs)
+        self.pool = pool
+
+
+def build_opener(pool, *handlers):
+    """Build a urllib opener whose HTTP(S) handlers share pool."""
+    return _urllib_request.build_opener(
+        HTTPHandler(pool=pool), HTTPSHandler(pool=pool), *handlers)
@@ -0,0 +1,150 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json as _json
+import re as _re
+
+
+_DECODER = _json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+# Matches when a number may continue past the end of the buffer.
+_NUMBER_TAIL = _re.compile(r'[0-9.eE+-]*\Z')
+
+
+class InvalidJSON(ValueError):
+    """The stream is not valid JSON."""
+
+
+class StructureError(ValueError):
+    """The stream is valid JSON, but not the expected structure."""
+
+
+class _Reader(object):
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+    def _refill(self):
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                self._buffer = self._buffer[self._position:] + chunk
+                self._position = 0
+                return True
+        self._eof = True
+        return False
+
+    def peek(self):
+        """Return the next non-whitespace character, or None at EOF."""
+        while True:
+            buffer = self._buffer
+            position = self._position
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            self._position = position
+            if position < len(buffer):
+                return buffer[position]
+            if not self._refill():
+                return None
+
+    def expect(self, characters):
+        character = self.peek()
+        if character is None or character not in characters:
+            raise InvalidJSON('expected {!r} but found {!r}'.format(
+                characters, character))
+        self._position += 1
+        return character
+
+    def value(self):
+        """Parse and return the next JSON value."""
+        if self.peek() is None:
+            raise InvalidJSON('expected a value but found EOF')
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._position)
+            except ValueError as error:
+                if self._refill():
+                    continue
+                raise InvalidJSON(str(error)) from error
+            if (_NUMBER_TAIL.match(self._buffer, end) and
+                    self._refill()):
+                continue  # a number may continue in the next chunk
+            self._position = end
+            return value
+
+
+def iter_items(chunks, key):
+    """Iterate over the items of a top-level object's key array.
+
+    chunks is an iterable of str fragments of a JSON document, which
+    is parsed incrementally, so each item is yielded as soon as it
+    has been read, and only one item (plus the unparsed tail of the
+    current chunk) is held in memory at a time.  The rest of the
+    document is still checked for syntax once all items have been
+    yielded.  A missing key yields no items, like
+    document_items(json.loads(...), key).
+    """
+    reader = _Reader(chunks=chunks)
+    if reader.peek() != '{':
+        value = reader.value()
+        raise StructureError(
+            'the top-level value is not a JSON object: {!r}'.format(value))
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.expect('}')
+    else:
+        while True:
+            member = reader.value()
+            if not isinstance(member, str):
+                raise InvalidJSON(
+                    'expected an object key but found {!r}'.format(member))
+            reader.expect(':')
+            if member != key:
+                reader.value()
+            elif reader.peek() != '[':
+                raise StructureError('{} is not a JSON array: {!r}'.format(
+                    key, reader.value()))
+            else:
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.expect(']')
+                else:
+                    while True:
+                        yield reader.value()
+                        if reader.expect(',]') == ']':
+                            break
+            if reader.expect(',}') == '}':
+                break
+    if reader.peek() is not None:
+        raise InvalidJSON('extra data after the top-level value')
+
+
+def document_items(document, key):
+    """Iterate over the items of a parsed document's key array.
+
+    The already-parsed counterpart of iter_items, raising the same
+    StructureErrors.
+    """
+    if not isinstance(document, dict):
+        raise StructureError(
+            'the top-level value is not a JSON object: {!r}'.format(document))
+    items = document.get(key, [])
+    if not isinstance(items, list):
+        raise StructureError(
+            '{} is not a JSON array: {!r}'.format(key, items))
+    yield from items
@@ -12,11 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import email.message
+import gzip
+import socket
+import threading
+import time
 import unittest
 import unittest.mock
+import urllib.error
 
+from . import async_http
+from . import DeadlineExceeded
+from . import batch
+from . import cache
+from . import compression
+from . import deadline
 from . import fetch
+from . import fetch_async
+from . import fetch_chunks
+from . import fetch_items
+from . import fetch_view
+from . import isolated
+from . import isolated_async
+from . import remaining
+from . import start
+from . import stream
 
 
 class ContextManager(object):
@@ -42,6 +63,8 @@ class HTTPResponse(object):
         self._redirect = redirect
         self.code = code
         self._body = body
+        self._offset = 0
+        self.closed = False
         self.headers = email.message.Message()
         for key, value in headers.items():
             self.headers[key] = value
@@ -51,8 +74,22 @@ class HTTPResponse(object):
             return self._redirect
         return self._url
 
-    def read(self):
-        return self._body or ''
+    def read(self, amt=None):
+        body = self._body or ''
+        if amt is None:
+            return body
+        data = body[self._offset:self._offset + amt]
+        self._offset += len(data)
+        return data
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 class TestFetchJSON(unittest.TestCase):
@@ -84,7 +121,7 @@ class TestFetchJSON(unittest.TestCase):
                 ]:
             with self.subTest(name=name):
                 with ContextManager(
-                        target='oci_discovery.fetch_json._urllib_request.urlopen',
+                        target='oci_discovery.fetch_json.TRANSPORT.opener.open',
                         return_value=response):
                     fetched = fetch(uri=uri)
                 self.assertEqual(fetched, {'uri': uri, 'json': expected})
@@ -143,7 +180,7 @@ class TestFetchJSON(unittest.TestCase):
                 ]:
             with self.subTest(name=name):
                 with ContextManager(
-                        target='oci_discovery.fetch_json._urllib_request.urlopen',
+                        target='oci_discovery.fetch_json.TRANSPORT.opener.open',
                         return_value=response):
                     self.assertRaisesRegex(
                         error, regex, fetch, 'https://example.com')
@@ -160,7 +197,559 @@ class TestFetchJSON(unittest.TestCase):
             },
         )
         with ContextManager(
-                target='oci_discovery.fetch_json._urllib_request.urlopen',
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
                 return_value=response):
             fetched = fetch(uri=initial_uri)
         self.assertEqual(fetched, {'uri': final_uri, 'json': {}})
+
+    def test_cache(self):
+        uri = 'https://example.com'
+        response = HTTPResponse(
+            url=uri,
+            body=b'{}',
+            headers={
+                'Cache-Control': 'max-age=60',
+                'Content-Type': 'application/json; charset=UTF-8',
+            },
+        )
+        c = cache.Cache()
+        with ContextManager(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                return_value=response) as mock:
+            for _ in range(2):
+                fetched = fetch(uri=uri, cache=c)
+                self.assertEqual(fetched, {'uri': uri, 'json': {}})
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual((c.hits, c.misses), (1, 1))
+
+    def test_async(self):
+        initial_uri = 'https://example.com'
+        final_uri = 'https://example.com/redirect'
+        headers = HTTPResponse(
+            url=final_uri,
+            headers={
+                'Content-Type': 'application/json; charset=UTF-8',
+            },
+        ).headers
+
+        async def get(uri, headers=None, connect_timeout=None,
+                      read_timeout=None, max_size=None):
+            return async_http.Response(
+                url=final_uri, status=200, reason='OK', headers=response_headers,
+                body=b'{"a": 1}')
+
+        response_headers = headers
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.CLIENT.get', new=get):
+            fetched = asyncio.run(fetch_async(uri=initial_uri))
+        self.assertEqual(fetched, {'uri': final_uri, 'json': {'a': 1}})
+
+    def test_batch(self):
+        bodies = {
+            'https://example.com/good': b'{"a": 1}',
+            'https://example.com/bad': b'{',
+        }
+
+        def open(request, timeout=None):
+            context = unittest.mock.MagicMock()
+            context.__enter__.return_value = HTTPResponse(
+                url=request.full_url,
+                body=bodies[request.full_url],
+                headers={
+                    'Content-Type': 'application/json; charset=UTF-8',
+                },
+            )
+            return context
+
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                side_effect=open) as mock:
+            with batch():
+                for _ in range(2):
+                    fetched = fetch(uri='https://example.com/good')
+                    fetched['json']['a'] = 2  # callers may modify results
+                    self.assertRaises(
+                        ValueError, fetch, 'https://example.com/bad')
+                self.assertEqual(
+                    fetch(uri='https://example.com/good')['json'], {'a': 1})
+            self.assertEqual(mock.call_count, 2)
+            fetch(uri='https://example.com/good')
+            self.assertEqual(mock.call_count, 3)
+
+
+class TestFetchItems(unittest.TestCase):
+    def _response(self, body, content_type='application/json; charset=UTF-8',
+                  redirect=None):
+        return HTTPResponse(
+            url='https://example.com', redirect=redirect, body=body,
+            headers={'Content-Type': content_type})
+
+    def _items(self, response, key='manifests'):
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                return_value=response):
+            with unittest.mock.patch(
+                    target='oci_discovery.fetch_json.CHUNK_SIZE', new=2):
+                fetched = fetch_items(uri='https://example.com', key=key)
+                return fetched['uri'], list(fetched['items'])
+
+    def test_good(self):
+        response = self._response(
+            body='{"a": [1], "manifests": [{"b": "\u00e9"}, 2, []], "c": 3}'
+                 .encode('UTF-8'),
+            redirect='https://example.com/redirect')
+        self.assertEqual(
+            self._items(response=response),
+            ('https://example.com/redirect', [{'b': '\u00e9'}, 2, []]))
+        self.assertTrue(response.closed)
+
+    def test_bad(self):
+        for name, response, error, regex in [
+                    (
+                        'no charset',
+                        self._response(
+                            body=b'{}', content_type='application/json'),
+                        ValueError,
+                        'https://example.com does not declare a charset',
+                    ),
+                    (
+                        'declared charset does not match body',
+                        self._response(body=b'{"manifests": [1, \xff]}'),
+                        ValueError,
+                        'https://example.com returned content which did not match the declared utf-8 charset',
+                    ),
+                    (
+                        'invalid JSON',
+                        self._response(body=b'{"manifests": [1, 2}'),
+                        ValueError,
+                        'https://example.com returned invalid JSON',
+                    ),
+                    (
+                        'unexpected media type',
+                        self._response(
+                            body=b'{}', content_type='text/plain; charset=UTF-8'),
+                        ValueError,
+                        'https://example.com returned text/plain, not application/json',
+                    ),
+                    (
+                        'not an array',
+                        self._response(body=b'{"manifests": {}}'),
+                        stream.StructureError,
+                        'manifests is not a JSON array: \\{}',
+                    ),
+                ]:
+            with self.subTest(name=name):
+                self.assertRaisesRegex(
+                    error, regex, self._items, response)
+                self.assertTrue(response.closed)
+
+    def test_early_close(self):
+        response = self._response(body=b'{"manifests": [1, 2, 3]}')
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                return_value=response):
+            with unittest.mock.patch(
+                    target='oci_discovery.fetch_json.CHUNK_SIZE', new=2):
+                items = fetch_items(
+                    uri='https://example.com', key='manifests')['items']
+                self.assertEqual(next(items), 1)
+                items.close()
+        self.assertTrue(response.closed)
+        self.assertLess(response._offset, len(response._body))
+
+    def test_close_before_iterating(self):
+        for label, start in [
+                    ('items', lambda: fetch_items(
+                        uri='https://example.com', key='manifests')['items']),
+                    ('chunks', lambda: fetch_chunks(
+                        uri='https://example.com')['chunks']),
+                ]:
+            with self.subTest(label=label):
+                response = self._response(body=b'{"manifests": [1, 2, 3]}')
+                with unittest.mock.patch(
+                        target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                        return_value=response):
+                    start().close()
+                self.assertTrue(response.closed)
+
+    def test_whole_document(self):
+        for name, context, kwargs in [
+                    ('cache', unittest.mock.MagicMock(), {'cache': cache.Cache()}),
+                    ('batch', batch(), {}),
+                ]:
+            with self.subTest(name=name):
+                with unittest.mock.patch(
+                        target='oci_discovery.fetch_json.fetch',
+                        return_value={
+                            'uri': 'https://example.com/redirect',
+                            'json': {'manifests': [1, 2]},
+                        }) as mock:
+                    with context:
+                        fetched = fetch_items(
+                            uri='https://example.com', key='manifests',
+                            **kwargs)
+                        self.assertEqual(list(fetched['items']), [1, 2])
+                self.assertEqual(fetched['uri'], 'https://example.com/redirect')
+                self.assertEqual(mock.call_count, 1)
+
+
+class TestFetchView(unittest.TestCase):
+    def test(self):
+        for name, context, kwargs, calls in [
+                    ('no caching', unittest.mock.MagicMock(), {}, 2),
+                    ('cache', unittest.mock.MagicMock(), {'cache': cache.Cache()}, 1),
+                    ('batch', batch(), {}, 1),
+                ]:
+            with self.subTest(name=name):
+                views = []
+
+                def view(fetched):
+                    views.append(fetched)
+                    return set(fetched['json'])
+
+                headers = email.message.Message()
+                headers['Cache-Control'] = 'max-age=60'
+                with unittest.mock.patch(
+                        target='oci_discovery.fetch_json._fetch',
+                        return_value=(
+                            {'uri': 'https://example.com/r', 'json': ['a']},
+                            headers)):
+                    with context:
+                        for _ in range(2):
+                            self.assertEqual(
+                                fetch_view(
+                                    uri='https://example.com', view=view,
+                                    **kwargs),
+                                {'a'})
+                self.assertEqual(len(views), calls)
+                self.assertEqual(views[0]['uri'], 'https://example.com/r')
+
+
+class TestDeadline(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+
+    def _open(self, request, timeout=None):
+        self.opened.append((timeout, request.read_timeout))
+        return HTTPResponse(
+            url='https://example.com',
+            body=b'{}',
+            headers={
+                'Content-Type': 'application/json; charset=UTF-8',
+            },
+        )
+
+    def test_nesting(self):
+        self.assertIsNone(remaining())
+        with deadline(timeout=10):
+            self.assertLessEqual(remaining(), 10)
+            with deadline(timeout=100):
+                self.assertLessEqual(remaining(), 10)
+            with deadline(timeout=1):
+                self.assertLessEqual(remaining(), 1)
+            with deadline():
+                self.assertGreater(remaining(), 1)
+        self.assertIsNone(remaining())
+
+    def test_timeouts(self):
+        for label, timeout, expected in [
+                    ('no deadline', None, (10, 30)),
+                    ('capped', 20, (10, 20)),
+                ]:
+            with self.subTest(label=label):
+                self.opened = []
+                with unittest.mock.patch(
+                        target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                        new=self._open):
+                    with deadline(timeout=timeout):
+                        fetch(uri='https://example.com')
+                (connect, read), = self.opened
+                self.assertAlmostEqual(connect, expected[0], places=0)
+                self.assertAlmostEqual(read, expected[1], places=0)
+
+    def test_expired(self):
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                new=self._open):
+            with batch():
+                with deadline(timeout=0):
+                    self.assertRaisesRegex(
+                        DeadlineExceeded, 'before fetching https://example.com',
+                        fetch, 'https://example.com')
+                # the failure is not shared with later fetches
+                self.assertEqual(
+                    fetch(uri='https://example.com')['json'], {})
+        self.assertEqual(len(self.opened), 1)
+
+    def test_cancelled(self):
+        cancelled = threading.Event()
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                new=self._open):
+            with deadline(timeout=10, cancelled=cancelled):
+                self.assertLessEqual(remaining(), 10)
+                self.assertEqual(fetch(uri='https://example.com')['json'], {})
+                cancelled.set()
+                self.assertEqual(remaining(), 0)
+                self.assertRaisesRegex(
+                    DeadlineExceeded, 'before fetching https://example.com',
+                    fetch, 'https://example.com')
+            with deadline(cancelled=cancelled):
+                self.assertRaises(
+                    DeadlineExceeded, fetch, 'https://example.com')
+        self.assertEqual(len(self.opened), 1)
+
+    def test_start(self):
+        cancelled = threading.Event()
+
+        def run(value):
+            self.assertTrue(threading.current_thread().daemon)
+            self.assertEqual(remaining(), 2)
+            cancelled.set()
+            self.assertEqual(remaining(), 0)
+            return value
+
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json._time.monotonic',
+                return_value=0):
+            with deadline(timeout=2):
+                future = start(run, cancelled=cancelled, value='a')
+                self.assertEqual(future.result(timeout=5), 'a')
+                # the caller's deadline is not cancelled
+                self.assertEqual(remaining(), 2)
+
+    def test_interrupted(self):
+        def open(request, timeout=None):
+            time.sleep(0.1)
+            raise urllib.error.URLError(socket.timeout('timed out'))
+
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open', new=open):
+            self.assertRaises(
+                urllib.error.URLError, fetch, 'https://example.com')
+            with deadline(timeout=0.05):
+                self.assertRaisesRegex(
+                    DeadlineExceeded, 'while fetching https://example.com',
+                    fetch, 'https://example.com')
+
+
+class TestIsolated(unittest.TestCase):
+    def _open(self, request, timeout=None):
+        self.opened.append(request.full_url)
+        return HTTPResponse(
+            url=request.full_url,
+            body=b'{}',
+            headers={
+                'Content-Type': 'application/json; charset=UTF-8',
+            },
+        )
+
+    def test_batch(self):
+        def fetches():
+            with batch():
+                for _ in range(3):
+                    yield fetch(uri='https://example.com/a')
+
+        self.opened = []
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+                new=self._open):
+            for _ in isolated(iterator=fetches()):
+                # the caller's fetches are not batched
+                fetch(uri='https://example.com/a')
+        self.assertEqual(len(self.opened), 4)
+
+    def test_close_elsewhere(self):
+        def iterator():
+            with batch(), deadline(timeout=10):
+                yield 1
+                yield 2
+
+        items = isolated(iterator=iterator())
+        self.assertEqual(next(items), 1)
+        self.assertIsNone(remaining())
+        errors = []
+
+        def close():
+            try:
+                items.close()
+            except Exception as error:
+                errors.append(error)
+
+        thread = threading.Thread(target=close)
+        thread.start()
+        thread.join()
+        self.assertEqual(errors, [])
+
+    def test_deadline(self):
+        def iterator():
+            with deadline(timeout=0.1):
+                yield remaining()
+                yield remaining()
+
+        for label, outer, expired in [
+                    ('own deadline', None, False),
+                    ('enclosing deadline', 0.1, True),
+                ]:
+            with self.subTest(label=label):
+                with deadline(timeout=outer):
+                    items = isolated(iterator=iterator())
+                    self.assertGreater(next(items), 0)
+                    self.assertEqual(remaining() is None, outer is None)
+                    time.sleep(0.15)  # does not count against iterator
+                    self.assertEqual(next(items) <= 0, expired)
+
+    def test_async(self):
+        async def iterator():
+            with deadline(timeout=0.1):
+                yield remaining()
+                yield remaining()
+
+        async def collect():
+            left = []
+            async for item in isolated_async(iterator=iterator()):
+                left.append(item)
+                self.assertIsNone(remaining())
+                await asyncio.sleep(0.15)
+            return left
+
+        self.assertTrue(all(left > 0 for left in asyncio.run(collect())))
+
+
+class TestFetchChunks(unittest.TestCase):
+    def _open(self, body, headers=None):
+        response = HTTPResponse(
+            url='https://example.com', redirect='https://example.com/redirect',
+            body=body, headers=headers or {})
+        return response, unittest.mock.patch(
+            target='oci_discovery.fetch_json.TRANSPORT.opener.open',
+            return_value=response)
+
+    def test_good(self):
+        for label, body, headers in [
+                    ('plain', b'abcdefg', {}),
+                    (
+                        'gzip',
+                        gzip.compress(b'abcdefg'),
+                        {'Content-Encoding': 'gzip'},
+                    ),
+                ]:
+            with self.subTest(label=label):
+                response, patch = self._open(body=body, headers=headers)
+                with patch, unittest.mock.patch(
+                        target='oci_discovery.fetch_json.CHUNK_SIZE', new=3):
+                    fetched = fetch_chunks(uri='https://example.com')
+                    self.assertEqual(
+                        fetched['uri'], 'https://example.com/redirect')
+                    self.assertEqual(b''.join(fetched['chunks']), b'abcdefg')
+                self.assertTrue(response.closed)
+
+    def test_max_size(self):
+        response, patch = self._open(body=b'abcdefg')
+        with patch:
+            fetched = fetch_chunks(uri='https://example.com', max_size=5)
+            self.assertRaises(
+                compression.TooLarge, b''.join, fetched['chunks'])
+        self.assertTrue(response.closed)
+
+    def test_close_early(self):
+        response, patch = self._open(body=b'abcdefg')
+        with patch, unittest.mock.patch(
+                target='oci_discovery.fetch_json.CHUNK_SIZE', new=3):
+            chunks = fetch_chunks(uri='https://example.com')['chunks']
+            self.assertEqual(next(chunks), b'abc')
+            chunks.close()
+        self.assertTrue(response.closed)
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+
+    def _open(self, body, content_encoding='gzip'):
+        def open(request, timeout=None):
+            self.requests.append(request)
+            return HTTPResponse(
+                url=request.full_url,
+                body=body,
+                headers={
+                    'Content-Type': 'application/json; charset=UTF-8',
+                    'Content-Encoding': content_encoding,
+                },
+            )
+
+        return unittest.mock.patch(
+            target='oci_discovery.fetch_json.TRANSPORT.opener.open', new=open)
+
+    def test_fetch(self):
+        with self._open(body=gzip.compress(b'{"a": 1}')):
+            self.assertEqual(
+                fetch(uri='https://example.com')['json'], {'a': 1})
+        request, = self.requests
+        self.assertEqual(
+            request.get_header('Accept-encoding'),
+            compression.ACCEPT_ENCODING)
+
+    def test_disabled(self):
+        with self._open(body=b'{"a": 1}', content_encoding='identity'):
+            with unittest.mock.patch(
+                    target='oci_discovery.fetch_json.ACCEPT_ENCODING',
+                    new=None):
+                fetch(uri='https://example.com')
+        request, = self.requests
+        self.assertIsNone(request.get_header('Accept-encoding'))
+
+    def test_fetch_items(self):
+        body = gzip.compress(b'{"manifests": [1, {"a": 2}, 3]}')
+        with self._open(body=body):
+            with unittest.mock.patch(
+                    target='oci_discovery.fetch_json.CHUNK_SIZE', new=3):
+                fetched = fetch_items(uri='https://example.com', key='manifests')
+                self.assertEqual(list(fetched['items']), [1, {'a': 2}, 3])
+
+    def test_max_size(self):
+        body = gzip.compress(b'{"manifests": [' + b' ' * 1024 + b']}')
+        for label, function in [
+                    ('fetch', lambda: fetch(uri='https://example.com')),
+                    (
+                        'fetch_items',
+                        lambda: list(fetch_items(
+                            uri='https://example.com', key='manifests')[
+                                'items']),
+                    ),
+                ]:
+            with self.subTest(label=label):
+                with self._open(body=body):
+                    with unittest.mock.patch(
+                            target='oci_discovery.fetch_json.MAX_SIZE',
+                            new=100):
+                        self.assertRaisesRegex(
+                            compression.TooLarge,
+                            'https://example.com returned more than 100 bytes',
+                            function)
+
+    def test_async(self):
+        requested = []
+        headers = HTTPResponse(
+            url='https://example.com',
+            headers={
+                'Content-Type': 'application/json; charset=UTF-8',
+                'Content-Encoding': 'gzip',
+            },
+        ).headers
+
+        async def get(uri, headers=None, connect_timeout=None,
+                      read_timeout=None, max_size=None):
+            requested.append(headers)
+            return async_http.Response(
+                url=uri, status=200, reason='OK', headers=response_headers,
+                body=gzip.compress(b'{"a": 1}'))
+
+        response_headers = headers
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.CLIENT.get', new=get):
+            fetched = asyncio.run(fetch_async(uri='https://example.com'))
+        self.assertEqual(fetched['json'], {'a': 1})
+        self.assertEqual(
+            requested,
+            [{'Accept-Encoding': compression.ACCEPT_ENCODING}])
@@ -0,0 +1,208 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import http.server
+import socket
+import threading
+import time
+import unittest
+import urllib.error
+
+from . import async_http
+from . import compression
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # the client gave up, e.g. on /slow
+
+    def do_GET(self):
+        self.server.peers.append(self.client_address)
+        self.server.requests.append(dict(self.headers))
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/content-length?redirected')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/slow':
+            time.sleep(0.5)
+        if self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('X-Path', self.path)
+        if self.path == '/chunked':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'2\r\n{}\r\n1;a=b\r\n \r\n0\r\n\r\n')
+            return
+        if self.path == '/large-chunked':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for _ in range(100):
+                self.wfile.write(b'400\r\n' + b' ' * 1024 + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        if self.path == '/endless':
+            # no Content-Length, so the body only ends when we stop
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            while True:
+                self.wfile.write(b' ' * 1024)
+        if self.path == '/large':
+            body = b' ' * 1024 * 100
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = b'{}'
+        if self.path == '/close':
+            self.send_header('Connection', 'close')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), _Handler)
+        self.server.peers = []
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.uri = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _run(self, client, awaitable):
+        """Run awaitable, closing client's connections afterwards."""
+        async def run():
+            try:
+                return await awaitable
+            finally:
+                await client.aclose()
+
+        return asyncio.run(run())
+
+    def _get(self, paths, headers=None):
+        client = async_http.Client()
+
+        async def get():
+            return [
+                await client.get(uri=self.uri + path, headers=headers)
+                for path in paths
+            ]
+
+        return self._run(client=client, awaitable=get())
+
+    def test_good(self):
+        for path, body in [
+                    ('/content-length', b'{}'),
+                    ('/chunked', b'{} '),
+                ]:
+            with self.subTest(path=path):
+                self.server.peers = []
+                responses = self._get(paths=[path] * 3)
+                self.assertEqual(
+                    [response.body for response in responses], [body] * 3)
+                self.assertEqual(responses[0].status, 200)
+                self.assertEqual(responses[0].headers['X-Path'], path)
+                self.assertEqual(len(set(self.server.peers)), 1)
+
+    def test_aclose(self):
+        client = async_http.Client()
+
+        async def get():
+            await client.get(uri=self.uri + '/')
+            connection, _ = client._idle[asyncio.get_running_loop()][
+                ('http', '127.0.0.1', self.server.server_port)][0]
+            await client.aclose()
+            return connection
+
+        connection = asyncio.run(get())
+        self.assertTrue(connection.writer.is_closing())
+        self.assertEqual(len(client._idle), 0)
+
+    def test_too_large(self):
+        for path in ['/large', '/large-chunked', '/endless']:
+            with self.subTest(path=path):
+                client = async_http.Client()
+                self.assertRaisesRegex(
+                    compression.TooLarge, 'more than 4096 bytes',
+                    self._run, client=client,
+                    awaitable=client.get(uri=self.uri + path, max_size=4096))
+
+    def test_connection_close(self):
+        self._get(paths=['/close'] * 2)
+        self.assertEqual(len(set(self.server.peers)), 2)
+
+    def test_headers(self):
+        self._get(paths=['/'], headers={'if-none-match': '"x"'})
+        self.assertEqual(self.server.requests[0]['If-None-Match'], '"x"')
+
+    def test_redirect(self):
+        response, = self._get(paths=['/redirect'])
+        self.assertEqual(response.url, self.uri + '/content-length?redirected')
+        self.assertEqual(response.body, b'{}')
+
+    def test_http_error(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._get(paths=['/missing'])
+        self.assertEqual(context.exception.code, 404)
+
+    def test_url_error(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        client = async_http.Client()
+        self.assertRaises(
+            urllib.error.URLError, self._run, client=client,
+            awaitable=client.get(uri='http://127.0.0.1:{}/'.format(port)))
+
+    def test_timeouts(self):
+        for label, kwargs, error in [
+                    ('read timeout', {'read_timeout': 0.1}, True),
+                    (
+                        'connect timeout does not apply to reads',
+                        {'connect_timeout': 0.1, 'read_timeout': 5},
+                        False,
+                    ),
+                ]:
+            with self.subTest(label=label):
+                client = async_http.Client()
+                get = client.get(uri=self.uri + '/slow', **kwargs)
+                if error:
+                    with self.assertRaises(urllib.error.URLError) as context:
+                        self._run(client=client, awaitable=get)
+                    self.assertIsInstance(
+                        context.exception.reason, socket.timeout)
+                else:
+                    self.assertEqual(
+                        self._run(client=client, awaitable=get).body, b'{}')
@@ -0,0 +1,222 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import email.message
+import os
+import tempfile
+import unittest
+import urllib.error
+
+from . import cache
+
+
+def _headers(**kwargs):
+    headers = email.message.Message()
+    for key, value in kwargs.items():
+        headers[key.replace('_', '-')] = value
+    return headers
+
+
+class TestExpires(unittest.TestCase):
+    def test(self):
+        now = 1000000000  # Sun, 09 Sep 2001 01:46:40 GMT
+        for label, headers, expected in [
+                    ('no headers', {}, now),
+                    ('no-store', {'Cache_Control': 'no-store, max-age=60'}, None),
+                    ('no-cache', {'Cache_Control': 'no-cache, max-age=60'}, now),
+                    ('max-age', {'Cache_Control': 'public, max-age=60'}, now + 60),
+                    ('max-age with Age', {'Cache_Control': 'max-age=60', 'Age': '10'}, now + 50),
+                    ('invalid max-age', {'Cache_Control': 'max-age=a'}, now),
+                    ('Expires', {'Expires': 'Sun, 09 Sep 2001 01:47:40 GMT'}, now + 60),
+                    (
+                        'Expires with Date',
+                        {
+                            'Date': 'Mon, 01 Jan 2001 00:00:00 GMT',
+                            'Expires': 'Mon, 01 Jan 2001 00:01:00 GMT',
+                        },
+                        now + 60,
+                    ),
+                    ('invalid Expires', {'Expires': '0'}, now),
+                    (
+                        'max-age beats Expires',
+                        {
+                            'Cache_Control': 'max-age=10',
+                            'Expires': 'Sun, 09 Sep 2001 01:47:40 GMT',
+                        },
+                        now + 10,
+                    ),
+                ]:
+            with self.subTest(label=label):
+                self.assertEqual(
+                    cache.expires(headers=_headers(**headers), now=now),
+                    expected)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.requests = []
+        self.responses = []
+
+    def _fetch(self, uri, media_type, headers):
+        self.requests.append(headers)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def _response(self, json, **headers):
+        return ({'uri': 'https://example.com/final', 'json': json},
+                _headers(**headers))
+
+    def _not_modified(self, **headers):
+        return urllib.error.HTTPError(
+            url='https://example.com', code=304, msg='Not Modified',
+            hdrs=_headers(**headers), fp=None)
+
+    def _get(self, c):
+        return c.fetch(
+            uri='https://example.com', media_type='application/json',
+            fetch=self._fetch)
+
+    def test_fresh(self):
+        c = cache.Cache()
+        self.responses = [self._response({'a': 1}, Cache_Control='max-age=60')]
+        first = self._get(c)
+        first['json']['a'] = 2  # callers may modify their results
+        second = self._get(c)
+        self.assertEqual(
+            second, {'uri': 'https://example.com/final', 'json': {'a': 1}})
+        self.assertEqual(self.requests, [{}])
+        self.assertEqual((c.hits, c.misses), (1, 1))
+
+    def test_revalidate(self):
+        c = cache.Cache()
+        self.responses = [
+            self._response(
+                {'a': 1}, ETag='"x"',
+                Last_Modified='Mon, 01 Jan 2001 00:00:00 GMT'),
+            self._not_modified(Cache_Control='max-age=60'),
+        ]
+        self._get(c)
+        self.assertEqual(self._get(c)['json'], {'a': 1})
+        self.assertEqual(self._get(c)['json'], {'a': 1})
+        self.assertEqual(self.requests, [
+            {},
+            {
+                'If-None-Match': '"x"',
+                'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT',
+            },
+        ])
+        self.assertEqual((c.hits, c.misses), (2, 1))
+
+    def test_changed(self):
+        c = cache.Cache()
+        self.responses = [
+            self._response({'a': 1}, ETag='"x"'),
+            self._response({'a': 2}, ETag='"y"'),
+            self._not_modified(),
+        ]
+        self._get(c)
+        self.assertEqual(self._get(c)['json'], {'a': 2})
+        self.assertEqual(self._get(c)['json'], {'a': 2})
+        self.assertEqual(self.requests[2], {'If-None-Match': '"y"'})
+
+    def test_not_stored(self):
+        for label, headers in [
+                    ('no-store', {'Cache_Control': 'no-store', 'ETag': '"x"'}),
+                    ('no validators or freshness', {}),
+                ]:
+            with self.subTest(label=label):
+                c = cache.Cache()
+                self.responses = [self._response({}, **headers)]
+                self._get(c)
+                self.assertEqual(len(c), 0)
+
+    def test_other_errors(self):
+        c = cache.Cache()
+        error = urllib.error.HTTPError(
+            url='https://example.com', code=404, msg='Not Found',
+            hdrs=_headers(), fp=None)
+        self.responses = [self._response({}, ETag='"x"'), error]
+        self._get(c)
+        self.assertRaises(urllib.error.HTTPError, self._get, c)
+
+    def test_view(self):
+        c = cache.Cache()
+        views = []
+
+        def view(fetched):
+            views.append(fetched['json'])
+            return len(fetched['json'])
+
+        self.responses = [
+            self._response({'a': 1}, ETag='"x"'),
+            self._not_modified(),
+            self._response({'a': 1, 'b': 2}, ETag='"y"'),
+        ]
+        for expected in [1, 1, 2]:
+            entry = c.fetch_entry(
+                uri='https://example.com', media_type='application/json',
+                fetch=self._fetch)
+            self.assertEqual(entry.view(function=view), expected)
+            self.assertEqual(entry.view(function=view), expected)
+        self.assertEqual(views, [{'a': 1}, {'a': 1, 'b': 2}])
+
+    def test_lru(self):
+        c = cache.Cache(max_entries=2)
+        for uri in ['a', 'b', 'a', 'c']:
+            c.put(uri=uri, media_type='m', entry=cache.Entry(uri=uri, json={}))
+        self.assertIsNone(c.get(uri='b', media_type='m'))
+        self.assertIsNotNone(c.get(uri='a', media_type='m'))
+        self.assertIsNotNone(c.get(uri='c', media_type='m'))
+
+
+class TestDirectoryStore(unittest.TestCase):
+    def test(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = cache.DirectoryStore(path=directory)
+            self.assertIsNone(store.load(uri='a', media_type='m'))
+            entry = cache.Entry(
+                uri='b', json={'c': [1]}, etag='"d"', expires=10)
+            store.save(uri='a', media_type='m', entry=entry)
+            self.assertEqual(
+                store.load(uri='a', media_type='m').dict(), entry.dict())
+            self.assertIsNone(store.load(uri='a', media_type='n'))
+            files = [
+                name
+                for _, _, names in os.walk(directory)
+                for name in names
+            ]
+            self.assertEqual(len(files), 1)
+            self.assertFalse(files[0].endswith('.tmp'))
+
+    def test_corrupt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = cache.DirectoryStore(path=directory)
+            path = store._path(uri='a', media_type='m')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write('{')
+            self.assertIsNone(store.load(uri='a', media_type='m'))
+
+    def test_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            first = cache.Cache(store=cache.DirectoryStore(path=directory))
+            second = cache.Cache(store=cache.DirectoryStore(path=directory))
+            first.put(
+                uri='a', media_type='m',
+                entry=cache.Entry(uri='a', json={}, expires=float('inf')))
+            entry = second.get(uri='a', media_type='m')
+            self.assertEqual(entry.json, {})
+            self.assertTrue(entry.fresh())
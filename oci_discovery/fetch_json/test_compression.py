@@ -0,0 +1,137 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import unittest
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import compression
+
+
+_BODY = b'{"manifests": [' + b', '.join([b'{"a": 1}'] * 100) + b']}'
+
+
+def _raw_deflate(data):
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decode(data, content_encoding, max_size=None, chunk_size=7):
+    decoder = compression.Decoder(
+        uri='https://example.com', content_encoding=content_encoding,
+        max_size=max_size)
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    decoded = [decoder.decode(chunk) for chunk in chunks]
+    decoded.append(decoder.decode(b'', final=True))
+    return b''.join(decoded)
+
+
+class TestDecoder(unittest.TestCase):
+    def test_good(self):
+        for label, content_encoding, data in [
+                    ('no coding', None, _BODY),
+                    ('identity', 'identity', _BODY),
+                    ('gzip', 'gzip', gzip.compress(_BODY)),
+                    ('x-gzip', 'X-GZip', gzip.compress(_BODY)),
+                    ('zlib deflate', 'deflate', zlib.compress(_BODY)),
+                    ('raw deflate', 'deflate', _raw_deflate(_BODY)),
+                    (
+                        'several codings',
+                        'deflate, gzip',
+                        gzip.compress(zlib.compress(_BODY)),
+                    ),
+                ]:
+            with self.subTest(label=label):
+                self.assertEqual(
+                    _decode(data=data, content_encoding=content_encoding),
+                    _BODY)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        self.assertIn('br', compression.ACCEPT_ENCODING)
+        self.assertEqual(
+            _decode(data=brotli.compress(_BODY), content_encoding='br'),
+            _BODY)
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        self.assertIn('zstd', compression.ACCEPT_ENCODING)
+        self.assertEqual(
+            _decode(
+                data=zstandard.ZstdCompressor().compress(_BODY),
+                content_encoding='zstd'),
+            _BODY)
+
+    def test_accept_encoding(self):
+        codings = compression.ACCEPT_ENCODING.split(', ')
+        self.assertIn('gzip', codings)
+        self.assertIn('deflate', codings)
+
+    def test_unsupported(self):
+        self.assertRaisesRegex(
+            ValueError,
+            "https://example.com returned an unsupported 'compress' content coding",
+            compression.Decoder, uri='https://example.com',
+            content_encoding='compress')
+
+    def test_bad(self):
+        for label, data, regex in [
+                    (
+                        'corrupt',
+                        b'\x1f\x8b' + b'\x00' * 20,
+                        'https://example.com returned invalid gzip data',
+                    ),
+                    (
+                        'truncated',
+                        gzip.compress(_BODY)[:-10],
+                        'https://example.com returned truncated gzip data',
+                    ),
+                ]:
+            with self.subTest(label=label):
+                self.assertRaisesRegex(
+                    ValueError, regex, _decode, data=data,
+                    content_encoding='gzip')
+
+    def test_max_size(self):
+        bomb = gzip.compress(b' ' * 10 * 1024 * 1024)
+        self.assertLess(len(bomb), 20 * 1024)
+        for label, data, content_encoding, max_size, chunk_size in [
+                    ('identity', _BODY, None, len(_BODY) - 1, 7),
+                    ('gzip', gzip.compress(_BODY), 'gzip', len(_BODY) - 1, 7),
+                    ('bomb', bomb, 'gzip', 1024 * 1024, len(bomb)),
+                ]:
+            with self.subTest(label=label):
+                self.assertRaisesRegex(
+                    compression.TooLarge,
+                    'https://example.com returned more than {} bytes'.format(
+                        max_size),
+                    _decode, data=data, content_encoding=content_encoding,
+                    max_size=max_size, chunk_size=chunk_size)
+
+    def test_exact_size(self):
+        self.assertEqual(
+            _decode(
+                data=gzip.compress(_BODY), content_encoding='gzip',
+                max_size=len(_BODY)),
+            _BODY)
@@ -0,0 +1,91 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+import unittest
+import unittest.mock
+
+from . import happy_eyeballs
+
+
+def _address(family, host, port):
+    return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (host, port))
+
+
+class TestInterleave(unittest.TestCase):
+    def test(self):
+        v4 = [_address(socket.AF_INET, '192.0.2.{}'.format(i), 80) for i in range(3)]
+        v6 = [_address(socket.AF_INET6, '2001:db8::{}'.format(i), 80) for i in range(2)]
+        for label, addresses, expected in [
+                    ('empty', [], []),
+                    ('one family', v4, v4),
+                    ('IPv6 first', v6 + v4, [v6[0], v4[0], v6[1], v4[1], v4[2]]),
+                    ('IPv4 first', v4[:1] + v6 + v4[1:], [v4[0], v6[0], v4[1], v6[1], v4[2]]),
+                ]:
+            with self.subTest(label=label):
+                self.assertEqual(happy_eyeballs.interleave(addresses), expected)
+
+
+class TestCreateConnection(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(4)
+        self.addCleanup(self.server.close)
+        self.port = self.server.getsockname()[1]
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.closed_port = sock.getsockname()[1]
+
+    def _create_connection(self, ports, **kwargs):
+        addresses = [
+            _address(socket.AF_INET, '127.0.0.1', port) for port in ports]
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.happy_eyeballs._socket.getaddrinfo',
+                return_value=addresses):
+            return happy_eyeballs.create_connection(
+                address=('example.com', 80), **kwargs)
+
+    def test_good(self):
+        for label, ports in [
+                    ('one address', [self.port]),
+                    ('refused first', [self.closed_port, self.port]),
+                ]:
+            with self.subTest(label=label):
+                with self._create_connection(ports=ports, timeout=5) as sock:
+                    self.assertEqual(sock.getpeername(), ('127.0.0.1', self.port))
+                    self.assertEqual(sock.gettimeout(), 5)
+
+    def test_unresponsive(self):
+        # 192.0.2.0/24 is reserved for documentation, so connecting to
+        # it either hangs or fails, depending on the network.
+        addresses = [
+            _address(socket.AF_INET, '192.0.2.1', self.port),
+            _address(socket.AF_INET, '127.0.0.1', self.port),
+        ]
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.happy_eyeballs._socket.getaddrinfo',
+                return_value=addresses):
+            with happy_eyeballs.create_connection(
+                    address=('example.com', 80), timeout=5,
+                    delay=0.05) as sock:
+                self.assertEqual(sock.getpeername(), ('127.0.0.1', self.port))
+
+    def test_refused(self):
+        self.assertRaises(
+            ConnectionRefusedError, self._create_connection,
+            ports=[self.closed_port, self.closed_port])
+
+    def test_no_addresses(self):
+        self.assertRaises(OSError, self._create_connection, ports=[])
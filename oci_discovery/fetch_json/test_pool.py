@@ -0,0 +1,139 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import socket
+import threading
+import time
+import unittest
+import unittest.mock
+import urllib.error
+import urllib.request
+
+from . import pool
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # the client gave up, e.g. on /slow
+
+    def do_GET(self):
+        self.server.peers.append(self.client_address)
+        body = b'{}'
+        if self.path == '/slow':
+            time.sleep(0.5)
+        self.send_response(200)
+        if self.path == '/chunked':
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'2\r\n{}\r\n0\r\n\r\n')
+            return
+        if self.path == '/close':
+            self.send_header('Connection', 'close')
+        elif self.path == '/hang-up':
+            # close without announcing it, like an idle-timeout
+            self.close_connection = True
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), _Handler)
+        self.server.peers = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        # cleanups run last-in, first-out
+        self.addCleanup(self.thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.uri = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.pool = pool.ConnectionPool()
+        self.addCleanup(self.pool.clear)
+        self.opener = pool.build_opener(pool=self.pool)
+
+    def _get(self, path):
+        with self.opener.open(self.uri + path) as response:
+            return response.read()
+
+    def test_reuse(self):
+        for path in ['/content-length', '/chunked']:
+            with self.subTest(path=path):
+                self.server.peers = []
+                for _ in range(3):
+                    self.assertEqual(self._get(path=path), b'{}')
+                self.assertEqual(len(self.server.peers), 3)
+                self.assertEqual(len(set(self.server.peers)), 1)
+
+    def test_connection_close(self):
+        for _ in range(2):
+            self.assertEqual(self._get(path='/close'), b'{}')
+        self.assertEqual(len(set(self.server.peers)), 2)
+
+    def test_unread_body(self):
+        for _ in range(2):
+            with self.opener.open(self.uri + '/unread'):
+                pass
+        self.assertEqual(len(set(self.server.peers)), 2)
+
+    def test_idle_timeout(self):
+        self._get(path='/')
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.pool._time.monotonic',
+                return_value=float('inf')):
+            self._get(path='/')
+        self.assertEqual(len(set(self.server.peers)), 2)
+
+    def test_max_idle(self):
+        self.pool.max_idle = 1
+        first = self.opener.open(self.uri + '/')
+        second = self.opener.open(self.uri + '/')
+        first.read()
+        second.read()
+        key = ('http', '127.0.0.1', self.server.server_port)
+        self.assertEqual(len(self.pool._idle[key]), 1)
+
+    def test_stale(self):
+        self._get(path='/hang-up')
+        self.assertEqual(self._get(path='/'), b'{}')
+        self.assertEqual(len(set(self.server.peers)), 2)
+
+    def test_timeouts(self):
+        for label, timeout, read_timeout, error in [
+                    ('read timeout', 5, 0.1, True),
+                    ('connect timeout does not apply to reads', 0.1, 5, False),
+                    ('timeout for both', 0.1, None, True),
+                ]:
+            with self.subTest(label=label):
+                request = urllib.request.Request(self.uri + '/slow')
+                if read_timeout is not None:
+                    request.read_timeout = read_timeout
+                if error:
+                    with self.assertRaises(urllib.error.URLError) as context:
+                        self.opener.open(request, timeout=timeout)
+                    self.assertIsInstance(
+                        context.exception.reason, socket.timeout)
+                else:
+                    with self.opener.open(request, timeout=timeout) as response:
+                        self.assertEqual(response.read(), b'{}')
@@ -0,0 +1,82 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from . import stream
+
+
+def _chunks(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class TestIterItems(unittest.TestCase):
+    def test_good(self):
+        for label, body, expected in [
+                    ('empty object', '{}', []),
+                    ('missing key', '{"a": [1]}', []),
+                    ('empty array', ' { "m" : [ ] } ', []),
+                    (
+                        'items',
+                        '{"a": {"m": [0]}, "m": [1, -2.5e3, "x", null, true, {"b": [{}]}], "c": 123}',
+                        [1, -2.5e3, 'x', None, True, {'b': [{}]}],
+                    ),
+                    ('number at the end', '{"m": [12345]}', [12345]),
+                    ('whitespace', '\n{\n\t"m":\r\n[\n1\n,\n2\n]\n}\n', [1, 2]),
+                ]:
+            for size in [1, 2, 3, 7, len(body)]:
+                with self.subTest(label=label, size=size):
+                    self.assertEqual(
+                        list(stream.iter_items(
+                            chunks=_chunks(body=body, size=size), key='m')),
+                        expected)
+                    self.assertEqual(
+                        list(stream.document_items(
+                            document=json.loads(body), key='m')),
+                        expected)
+
+    def test_bad(self):
+        for label, body, error, regex in [
+                    (
+                        'not an object',
+                        '[1]',
+                        stream.StructureError,
+                        r'the top-level value is not a JSON object: \[1]',
+                    ),
+                    (
+                        'not an array',
+                        '{"m": {"a": 1}}',
+                        stream.StructureError,
+                        r"m is not a JSON array: \{'a': 1}",
+                    ),
+                    ('empty', '', stream.InvalidJSON, 'found EOF'),
+                    ('truncated', '{"m": [1, 2', stream.InvalidJSON, ''),
+                    ('bad item', '{"m": [1, x]}', stream.InvalidJSON, ''),
+                    ('trailing comma', '{"m": [1,]}', stream.InvalidJSON, ''),
+                    ('non-string key', '{1: []}', stream.InvalidJSON, ''),
+                    ('extra data', '{"m": [1]} {}', stream.InvalidJSON, 'extra data'),
+                ]:
+            with self.subTest(label=label):
+                self.assertRaisesRegex(
+                    error, regex, list,
+                    stream.iter_items(chunks=_chunks(body=body, size=2), key='m'))
+
+    def test_incremental(self):
+        def chunks():
+            yield '{"m": [1,'
+            raise AssertionError('read past the first item')
+
+        items = stream.iter_items(chunks=chunks(), key='m')
+        self.assertEqual(next(items), 1)
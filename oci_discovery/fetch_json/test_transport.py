@@ -0,0 +1,270 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import http.server
+import json
+import socket
+import threading
+import unittest
+import unittest.mock
+import urllib.error
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import httpx
+except ImportError:
+    h2 = httpx = None
+
+from . import async_http
+from . import transport
+from .. import fetch_json
+
+
+def _response(path):
+    if path == '/missing':
+        return 404, b'{}'
+    return 200, json.dumps({'path': path}).encode('UTF-8')
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.peers.append(self.client_address)
+        status, body = _response(path=self.path)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _H2Server(object):
+    """A minimal HTTP/2 server, using prior knowledge over cleartext."""
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(4)
+        self.uri = 'http://127.0.0.1:{}'.format(self.sock.getsockname()[1])
+        self.connections = 0
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.thread.join()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(
+                target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        connection = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(
+                client_side=False, header_encoding='utf-8'))
+        connection.initiate_connection()
+        with conn:
+            conn.sendall(connection.data_to_send())
+            while True:
+                try:
+                    data = conn.recv(65535)
+                except OSError:
+                    return
+                if not data:
+                    return
+                for event in connection.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        self._respond(connection=connection, event=event)
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        conn.sendall(connection.data_to_send())
+                        return
+                conn.sendall(connection.data_to_send())
+
+    def _respond(self, connection, event):
+        status, body = _response(path=dict(event.headers)[':path'])
+        connection.send_headers(event.stream_id, [
+            (':status', str(status)),
+            ('content-type', 'application/json; charset=UTF-8'),
+            ('content-length', str(len(body))),
+        ])
+        connection.send_data(event.stream_id, body, end_stream=True)
+
+
+class TestUrllibTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), _Handler)
+        self.server.peers = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.uri = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.transport = transport.UrllibTransport()
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_open(self):
+        with self.transport.open(
+                uri=self.uri + '/a', connect_timeout=5,
+                read_timeout=5) as response:
+            self.assertEqual(response.geturl(), self.uri + '/a')
+            self.assertEqual(
+                response.headers.get_content_type(), 'application/json')
+            self.assertEqual(json.loads(response.read()), {'path': '/a'})
+
+    def test_http_error(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.transport.open(uri=self.uri + '/missing')
+        self.assertEqual(context.exception.code, 404)
+
+    def test_fetch(self):
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT',
+                new=self.transport):
+            for path in ['/a', '/b']:
+                self.assertEqual(
+                    fetch_json.fetch(uri=self.uri + path)['json'],
+                    {'path': path})
+        self.assertEqual(len(set(self.server.peers)), 1)
+
+
+class TestUseTransport(unittest.TestCase):
+    def _use_transport(self, http2, **kwargs):
+        with unittest.mock.patch.multiple(
+                'oci_discovery.fetch_json',
+                TRANSPORT=fetch_json.TRANSPORT, CLIENT=fetch_json.CLIENT):
+            with unittest.mock.patch(
+                    target='oci_discovery.fetch_json.transport.HTTP2',
+                    new=http2):
+                used = fetch_json.use_transport(**kwargs)
+            return used, fetch_json.TRANSPORT, fetch_json.CLIENT
+
+    def test_fallback(self):
+        for name in ['auto', 'urllib']:
+            with self.subTest(name=name):
+                used, blocking, asynchronous = self._use_transport(
+                    name=name, http2=False)
+                self.assertEqual(used, 'urllib')
+                self.assertIsInstance(blocking, transport.UrllibTransport)
+                self.assertIs(blocking.pool, fetch_json.POOL)
+                self.assertIsInstance(asynchronous, async_http.Client)
+
+    def test_default(self):
+        used, blocking, asynchronous = self._use_transport(http2=True)
+        self.assertEqual(used, 'urllib')
+        self.assertIsInstance(blocking, transport.UrllibTransport)
+        self.assertIsInstance(asynchronous, async_http.Client)
+
+    def test_missing_backend(self):
+        self.assertRaises(
+            ImportError, self._use_transport, name='http2', http2=False)
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.transport.HTTP2', new=False):
+            self.assertRaises(ImportError, transport.AsyncHTTP2Client)
+
+    def test_unknown(self):
+        self.assertRaises(
+            ValueError, self._use_transport, name='gopher', http2=False)
+
+
+@unittest.skipIf(not transport.HTTP2, 'httpx[http2] is not installed')
+class TestHTTP2Transport(unittest.TestCase):
+    def setUp(self):
+        self.server = _H2Server()
+        self.addCleanup(self.server.close)
+
+    def _transport(self):
+        client = httpx.Client(http1=False, http2=True)
+        self.addCleanup(client.close)
+        return transport.HTTP2Transport(client=client)
+
+    def test_use_transport(self):
+        with unittest.mock.patch.multiple(
+                'oci_discovery.fetch_json',
+                TRANSPORT=fetch_json.TRANSPORT, CLIENT=fetch_json.CLIENT):
+            self.assertEqual(fetch_json.use_transport(name='auto'), 'http2')
+            self.assertIsInstance(
+                fetch_json.TRANSPORT, transport.HTTP2Transport)
+            self.assertIsInstance(
+                fetch_json.CLIENT, transport.AsyncHTTP2Client)
+            fetch_json.TRANSPORT.close()
+
+    def test_multiplexed(self):
+        http2 = self._transport()
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json.TRANSPORT', new=http2):
+            for path in ['/a', '/b', '/c']:
+                self.assertEqual(
+                    fetch_json.fetch(uri=self.server.uri + path),
+                    {'uri': self.server.uri + path, 'json': {'path': path}})
+        self.assertEqual(self.server.connections, 1)
+
+    def test_read(self):
+        with self._transport().open(uri=self.server.uri + '/a') as response:
+            self.assertEqual(response.http_version, 'HTTP/2')
+            self.assertEqual(response.read(2), b'{"')
+            self.assertEqual(json.loads(b'{"' + response.read()), {'path': '/a'})
+
+    def test_http_error(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._transport().open(uri=self.server.uri + '/missing')
+        self.assertEqual(context.exception.code, 404)
+
+    def test_connection_error(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            uri = 'http://127.0.0.1:{}/'.format(sock.getsockname()[1])
+        self.assertRaises(
+            urllib.error.URLError, self._transport().open, uri=uri)
+
+    def test_async(self):
+        client = transport.AsyncHTTP2Client(
+            client_factory=lambda: httpx.AsyncClient(http1=False, http2=True))
+
+        async def fetch_all():
+            with unittest.mock.patch(
+                    target='oci_discovery.fetch_json.CLIENT', new=client):
+                try:
+                    first = await fetch_json.fetch_async(
+                        uri=self.server.uri + '/a')
+                    return [first] + await asyncio.gather(*(
+                        fetch_json.fetch_async(uri=self.server.uri + path)
+                        for path in ['/b', '/c']))
+                finally:
+                    await client.aclose()
+
+        results = asyncio.run(fetch_all())
+        self.assertEqual(
+            [result['json'] for result in results],
+            [{'path': path} for path in ['/a', '/b', '/c']])
+        self.assertEqual(self.server.connections, 1)
@@ -0,0 +1,245 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""HTTP transports for fetch_json.
+
+fetch_json.TRANSPORT makes the blocking requests, and
+fetch_json.CLIENT the asyncio ones.  A transport has an
+
+  open(uri, headers=None, connect_timeout=None, read_timeout=None)
+
+method returning a response like urllib.request.urlopen's: a context
+manager with geturl(), read(amt=None), close() and an
+email.message.Message 'headers' attribute.  An asyncio client has an
+
+  async get(uri, headers=None, connect_timeout=None, read_timeout=None,
+            max_size=None)
+
+method returning an async_http.Response.  The response's whole body
+is read into memory, so bodies longer than max_size bytes (as sent)
+raise compression.TooLarge instead.  Both follow redirects, leave
+bodies encoded (fetch_json undoes any Content-Encoding), raise
+urllib.error.HTTPError for non-2xx responses (including 304, which
+cache.Cache relies on) and urllib.error.URLError for other failures,
+with a socket.timeout reason for timeouts.
+
+UrllibTransport and async_http.Client only need the standard
+library.  HTTP2Transport and AsyncHTTP2Client multiplex requests to
+the same origin over a single HTTP/2 connection, and need httpx with
+its http2 extra (https://www.python-httpx.org/http2/).  Use
+fetch_json.use_transport to switch between them.
+"""
+
+import asyncio as _asyncio
+import email.message as _email_message
+import io as _io
+import socket as _socket
+import urllib.error as _urllib_error
+import urllib.request as _urllib_request
+import weakref as _weakref
+
+try:
+    import httpx as _httpx
+    import h2 as _h2
+except ImportError:
+    _httpx = _h2 = None
+
+from . import async_http as _async_http
+from . import compression as _compression
+from . import pool as _pool
+
+
+HTTP2 = _httpx is not None and _h2 is not None
+
+
+class UrllibTransport(object):
+    """Blocking requests with urllib.request and a pool.ConnectionPool."""
+    def __init__(self, pool=None):
+        if pool is None:
+            pool = _pool.ConnectionPool()
+        self.pool = pool
+        self.opener = _pool.build_opener(pool=pool)
+
+    def open(self, uri, headers=None, connect_timeout=None,
+             read_timeout=None):
+        request = _urllib_request.Request(uri, headers=headers or {})
+        request.read_timeout = read_timeout  # see pool._PooledHandlerMixin
+        return self.opener.open(request, timeout=connect_timeout)
+
+    def close(self):
+        self.pool.clear()
+
+
+def _message(headers):
+    message = _email_message.Message()
+    for key, value in headers.items():
+        message[key] = value
+    return message
+
+
+def _timeout(connect_timeout, read_timeout):
+    return _httpx.Timeout(
+        connect=connect_timeout, read=read_timeout, write=read_timeout,
+        pool=connect_timeout)
+
+
+def _url_error(error):
+    if isinstance(error, _httpx.TimeoutException):
+        return _urllib_error.URLError(_socket.timeout(str(error)))
+    return _urllib_error.URLError(error)
+
+
+def _check_status(uri, response, body):
+    if not 200 <= response.status_code < 300:
+        raise _urllib_error.HTTPError(
+            uri, response.status_code, response.reason_phrase,
+            _message(headers=response.headers), _io.BytesIO(body))
+
+
+class _HTTP2Response(object):
+    """Adapt a streamed httpx.Response to the urllib response interface."""
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_raw()
+        self._buffer = b''
+        self.headers = _message(headers=response.headers)
+        self.status = self.code = response.status_code
+        self.reason = response.reason_phrase
+        self.http_version = response.http_version
+
+    def geturl(self):
+        return str(self._response.url)
+
+    def read(self, amt=None):
+        try:
+            if amt is None:
+                data = self._buffer + b''.join(self._chunks)
+                self._buffer = b''
+                return data
+            while len(self._buffer) < amt:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buffer += chunk
+        except _httpx.HTTPError as error:
+            raise _url_error(error=error) from error
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        self._response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class HTTP2Transport(object):
+    """Blocking requests with httpx, preferring HTTP/2.
+
+    Requests to the same origin share one connection, which HTTP/2
+    multiplexes.  Servers which only speak HTTP/1.1 still work.
+    client defaults to a new httpx.Client(http2=True).
+    """
+    def __init__(self, client=None):
+        if not HTTP2:
+            raise ImportError('HTTP2Transport needs httpx[http2]')
+        if client is None:
+            client = _httpx.Client(http2=True)
+        self.client = client
+
+    def open(self, uri, headers=None, connect_timeout=None,
+             read_timeout=None):
+        request = self.client.build_request(
+            'GET', uri, headers=headers,
+            timeout=_timeout(
+                connect_timeout=connect_timeout, read_timeout=read_timeout))
+        try:
+            response = self.client.send(
+                request, stream=True, follow_redirects=True)
+        except _httpx.HTTPError as error:
+            raise _url_error(error=error) from error
+        if not 200 <= response.status_code < 300:
+            try:
+                body = response.read()
+            finally:
+                response.close()
+            _check_status(uri=uri, response=response, body=body)
+        return _HTTP2Response(response=response)
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncHTTP2Client(object):
+    """The asyncio counterpart of HTTP2Transport, for fetch_json.CLIENT.
+
+    httpx.AsyncClient connections belong to an event loop, so a
+    client is made for each loop with client_factory, which defaults
+    to httpx.AsyncClient(http2=True).
+    """
+    def __init__(self, client_factory=None):
+        if not HTTP2:
+            raise ImportError('AsyncHTTP2Client needs httpx[http2]')
+        if client_factory is None:
+            client_factory = lambda: _httpx.AsyncClient(http2=True)
+        self.client_factory = client_factory
+        self._clients = _weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = _asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self.client_factory()
+        return client
+
+    async def get(self, uri, headers=None, connect_timeout=None,
+                  read_timeout=None, max_size=None):
+        client = self._client()
+        request = client.build_request(
+            'GET', uri, headers=headers,
+            timeout=_timeout(
+                connect_timeout=connect_timeout, read_timeout=read_timeout))
+        try:
+            response = await client.send(
+                request, stream=True, follow_redirects=True)
+            try:
+                chunks = []
+                length = 0
+                async for chunk in response.aiter_raw():
+                    length += len(chunk)
+                    if max_size is not None and length > max_size:
+                        raise _compression.TooLarge(
+                            '{} returned more than {} bytes'.format(
+                                uri, max_size))
+                    chunks.append(chunk)
+                body = b''.join(chunks)
+            finally:
+                await response.aclose()
+        except _httpx.HTTPError as error:
+            raise _url_error(error=error) from error
+        _check_status(uri=uri, response=response, body=body)
+        return _async_http.Response(
+            url=str(response.url), status=response.status_code,
+            reason=response.reason_phrase,
+            headers=_message(headers=response.headers), body=body)
+
+    async def aclose(self):
+        """Close the running event loop's client, if any."""
+        client = self._clients.pop(_asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections.abc as _collections_abc
+import functools as _functools
 import re as _re
 
 
@@ -43,24 +45,103 @@ _IPvFUTURE = (
     '([' + _UNRESERVED_NO_HYPHEN + _SUB_DELIMS + ':' + '-' + '])+')
 _IP_LITERAL = r'\[(' + _IPv6_ADDRESS + '|' + _IPvFUTURE + ')]'
 _REG_NAME = '[' + _UNRESERVED_NO_HYPHEN + '%' + _SUB_DELIMS + '-]*'
-_HOST_BASED_IMAGE_NAME_REGEX = _re.compile(
-    '^(?P<host>' + _IP_LITERAL + '|' + _IPv4_ADDRESS + '|' + _REG_NAME + ')'
+_PATH_AND_FRAGMENT = (
     '/'
     '(?P<path>[' + _PCHAR + ']+(/[' + _PCHAR + ']*)*)'
     '(#(?P<fragment>[/?' + _PCHAR + ']*))?$')
+_HOST_BASED_IMAGE_NAME_REGEX = _re.compile(
+    '^(?P<host>' + _IP_LITERAL + '|' + _IPv4_ADDRESS + '|' + _REG_NAME + ')' +
+    _PATH_AND_FRAGMENT)
+# Dotted-decimal IPv4 hosts are also valid reg-names (with the same
+# host capture), so only IP literals need the full regex.  The path
+# rule is rewritten without nested repetition, which is equivalent
+# and faster to match.
+_REG_NAME_IMAGE_NAME_REGEX = _re.compile(
+    '(?P<host>' + _REG_NAME + ')'
+    '/'
+    '(?P<path>[' + _PCHAR + '][/' + _PCHAR + ']*)'
+    '(?:#(?P<fragment>[/?' + _PCHAR + ']*))?')
 
 
-def parse(name):
-    """Parse a host-based image name.
+class Name(_collections_abc.Mapping):
+    """An immutable, hashable parsed host-based image name.
 
-    Following host-based-image-names.md.
+    The host, path, and fragment (which is '' when the name has no
+    fragment) are available as attributes, and also as a read-only
+    mapping, so a Name compares equal to the equivalent dict and can
+    be used for URI Template variables.
     """
-    match = _HOST_BASED_IMAGE_NAME_REGEX.match(name)
+    __slots__ = ('_values',)
+
+    _KEYS = ('host', 'path', 'fragment')
+    _INDEXES = {key: i for i, key in enumerate(_KEYS)}
+
+    @property
+    def host(self):
+        return self._values[0]
+
+    @property
+    def path(self):
+        return self._values[1]
+
+    @property
+    def fragment(self):
+        return self._values[2]
+
+    def __init__(self, host, path, fragment=''):
+        object.__setattr__(self, '_values', (host, path, fragment))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def __delattr__(self, key):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+    def __getitem__(self, key):
+        return self._values[self._INDEXES[key]]
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __eq__(self, other):
+        if isinstance(other, Name):
+            return self._values == other._values
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash(self._values)
+
+    def __repr__(self):
+        return '{}(host={!r}, path={!r}, fragment={!r})'.format(
+            type(self).__name__, *self._values)
+
+
+@_functools.lru_cache(maxsize=1024)
+def _parse(name):
+    if name.startswith('['):
+        regex = _HOST_BASED_IMAGE_NAME_REGEX
+    else:
+        regex = _REG_NAME_IMAGE_NAME_REGEX
+    match = regex.fullmatch(name)
     if match is None:
+        return None
+    host, path, fragment = match.group('host', 'path', 'fragment')
+    return Name(host, path, fragment or '')  # positional is faster
+
+
+def parse(name):
+    """Parse a host-based image name into a Name.
+
+    Following host-based-image-names.md.  Recent results are cached,
+    so parsing the same name again (e.g. in discovery and then in a
+    ref engine) is cheap.
+    """
+    parsed = _parse(name)
+    if parsed is None:
         raise ValueError(
             '{!r} does not match the host-based-image-name pattern'
             .format(name))
-    groups = match.groupdict()
-    if groups['fragment'] is None:
-        groups['fragment'] = ''
-    return groups
+    return parsed
@@ -15,7 +15,8 @@
 import re
 import unittest
 
-from . import parse, IPv4_ADDRESS, _IP_LITERAL #v6_ADDRESS
+from . import parse, Name, IPv4_ADDRESS, _IP_LITERAL #v6_ADDRESS
+from . import _HOST_BASED_IMAGE_NAME_REGEX
 
 
 class TestIPv4Detection(unittest.TestCase):
@@ -123,3 +124,42 @@ class TestImageNameParsing(unittest.TestCase):
                 ]:
             with self.subTest(name=name):
                 self.assertRaises(ValueError, parse, name)
+
+    def test_fast_path(self):
+        for name in [
+                    'example.com/a/b#c',
+                    '127.0.0.1/a',
+                    '256.0.0.1/a',
+                    '[::1]/a#b',
+                    '[v1.x]/a',
+                    '/a',
+                    'example.com:80/a',
+                    '[::1/a',
+                    'a[b]/c',
+                ]:
+            with self.subTest(name=name):
+                match = _HOST_BASED_IMAGE_NAME_REGEX.match(name)
+                if match is None:
+                    self.assertRaises(ValueError, parse, name)
+                else:
+                    expected = match.groupdict()
+                    expected['fragment'] = expected['fragment'] or ''
+                    self.assertEqual(parse(name=name), expected)
+
+
+class TestName(unittest.TestCase):
+    def test(self):
+        name = parse(name='example.com/a#b')
+        self.assertEqual(
+            (name.host, name.path, name.fragment), ('example.com', 'a', 'b'))
+        self.assertEqual(name['path'], 'a')
+        self.assertEqual(
+            dict(name), {'host': 'example.com', 'path': 'a', 'fragment': 'b'})
+        self.assertEqual(name, Name(host='example.com', path='a', fragment='b'))
+        self.assertEqual(
+            len({name, Name(host='example.com', path='a', fragment='b')}), 1)
+        self.assertIs(parse(name='example.com/a#b'), name)
+        self.assertRaises(KeyError, name.__getitem__, 'other')
+        self.assertRaises(AttributeError, setattr, name, 'host', 'x')
+        self.assertRaises(AttributeError, delattr, name, 'host')
+        self.assertRaises(AttributeError, setattr, name, 'other', 'x')
@@ -27,6 +27,9 @@ def new(protocol, **kwargs):
     takes an image name as a 'name' argument and returns an iterable
     of Merkle root objects.  Merkle root objects may be of any type,
     but JSON root objects SHOULD be represented as Python dicts.
+
+    Ref engines MAY also provide a 'resolve_async' method returning
+    an asynchronous iterable of the same Merkle root objects.
     """
     try:
         constructor = CONSTRUCTORS[protocol]
@@ -12,22 +12,59 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy as _copy
 import logging as _logging
 import pprint as _pprint
-import urllib.parse as _urllib_parse
-
-try:
-    import uritemplate as _uritemplate
-except ImportError as error:
-    from .. import uri_template as _uritemplate
 
 from .. import fetch_json as _fetch_json
+from ..fetch_json import stream as _fetch_json_stream
 from .. import host_based_image_names as _host_based_image_names
+from .. import uri_template as _uri_template
 
 
 _LOGGER = _logging.getLogger(__name__)
 
 
+_MEDIA_TYPE = 'application/vnd.oci.image.index.v1+json'
+
+
+def _invalid(uri, error):
+    return ValueError(
+        '{} claimed to return {}, but {}'.format(uri, _MEDIA_TYPE, error))
+
+
+def _entries(entries):
+    """Yield (ref name, entry) for each valid manifests entry."""
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise _fetch_json_stream.StructureError(
+                'manifests[{}] is not a JSON object: {!r}'.format(i, entry))
+        annotations = entry.get('annotations', {})
+        if not isinstance(annotations, dict):
+            raise _fetch_json_stream.StructureError(
+                'manifests[{}].annotations is not a JSON object: {!r}'
+                .format(i, annotations))
+        yield annotations.get('org.opencontainers.image.ref.name', None), entry
+
+
+def _tags(fetched):
+    """Index an OCI index's manifests by ref name.
+
+    This is a fetch_json.fetch_view() view, so it is built once per
+    cached (or batched) index and shared by later lookups.
+    """
+    if _LOGGER.isEnabledFor(_logging.DEBUG):
+        _LOGGER.debug('received OCI index object:\n{}'.format(
+            _pprint.pformat(fetched['json'])))
+    entries = []
+    tags = {}
+    for name, entry in _entries(entries=_fetch_json_stream.document_items(
+            document=fetched['json'], key='manifests')):
+        entries.append(entry)
+        tags.setdefault(name, []).append(entry)
+    return {'uri': fetched['uri'], 'entries': entries, 'tags': tags}
+
+
 class Engine(object):
     def __str__(self):
         return '<{}.{} uri={}>'.format(
@@ -36,45 +73,73 @@ class Engine(object):
             self.uri_template)
 
     def __init__(self, uri, base=None):
-        self.uri_template = _uritemplate.URITemplate(uri=uri)
+        self.uri_template = _uri_template.compile(uri=uri, base=base)
         self.base = base
 
+    def _uri(self, name_parts):
+        return self.uri_template.expand(**name_parts)
+
     def resolve(self, name):
+        """Yield the index's entries matching the name's fragment.
+
+        When fetch_json is caching (see fetch_json.caching()), the
+        index's entries are looked up by ref name in a table which is
+        built once per cached (or batched) index.  Otherwise matching
+        entries are yielded as soon as they have been read from the
+        response, so callers which stop iterating after the first
+        match leave the rest unread.  Streamed entries are yielded
+        before the rest of the index has been checked, so an index
+        which later turns out to be invalid or truncated may still
+        have yielded some roots before the ValueError.
+        """
         name_parts = _host_based_image_names.parse(name=name)
-        uri = self.uri_template.expand(**name_parts)
-        if self.base:
-            uri = _urllib_parse.urljoin(base=self.base, url=uri)
+        uri = self._uri(name_parts=name_parts)
         _LOGGER.debug('fetching an OCI index for {} from {}'.format(name, uri))
-        fetched = _fetch_json.fetch(
-            uri=uri,
-            media_type='application/vnd.oci.image.index.v1+json')
-        index = fetched['json']
-        _LOGGER.debug('received OCI index object:\n{}'.format(
-            _pprint.pformat(index)))
-        if not isinstance(index, dict):
-            raise ValueError(
-                '{} claimed to return application/vnd.oci.image.index.v1+json, but actually returned {}'
-                .format(uri, index))
-        if not isinstance(index.get('manifests', []), list):
-            raise ValueError(
-                '{} claimed to return application/vnd.oci.image.index.v1+json, but actually returned {}'
-                .format(uri, index))
-        for entry in index.get('manifests', []):
-            if not isinstance(entry, dict):
-                raise ValueError(
-                    '{} claimed to return application/vnd.oci.image.index.v1+json, but actually returned {}'
-                    .format(uri, index))
-            annotations = entry.get('annotations', {})
-            if not isinstance(annotations, dict):
-                raise ValueError(
-                    '{} claimed to return application/vnd.oci.image.index.v1+json, but actually returned {}'
-                    .format(uri, index))
-            entry_name = annotations.get(
-                'org.opencontainers.image.ref.name', None)
-            if (name_parts['fragment'] == '' or
-                    name_parts['fragment'] == entry_name):
-                yield {
-                    'mediaType': 'application/vnd.oci.descriptor.v1+json',
-                    'root': entry,
-                    'uri': fetched['uri'],
-                }
+        if _fetch_json.caching():
+            try:
+                tags = _fetch_json.fetch_view(
+                    uri=uri, view=_tags, media_type=_MEDIA_TYPE)
+            except _fetch_json_stream.StructureError as error:
+                raise _invalid(uri=uri, error=error) from error
+            yield from self._lookup(name_parts=name_parts, tags=tags)
+            return
+        fetched = _fetch_json.fetch_items(
+            uri=uri, key='manifests', media_type=_MEDIA_TYPE)
+        try:
+            for entry_name, entry in _entries(entries=fetched['items']):
+                if (name_parts.fragment == '' or
+                        name_parts.fragment == entry_name):
+                    yield self._root(entry=entry, uri=fetched['uri'])
+        except _fetch_json_stream.StructureError as error:
+            raise _invalid(uri=uri, error=error) from error
+        finally:
+            fetched['items'].close()
+
+    async def resolve_async(self, name):
+        """The asyncio counterpart of resolve()."""
+        name_parts = _host_based_image_names.parse(name=name)
+        uri = self._uri(name_parts=name_parts)
+        _LOGGER.debug('fetching an OCI index for {} from {}'.format(name, uri))
+        try:
+            tags = await _fetch_json.fetch_view_async(
+                uri=uri, view=_tags, media_type=_MEDIA_TYPE)
+        except _fetch_json_stream.StructureError as error:
+            raise _invalid(uri=uri, error=error) from error
+        for root in self._lookup(name_parts=name_parts, tags=tags):
+            yield root
+
+    def _lookup(self, name_parts, tags):
+        if name_parts.fragment == '':
+            entries = tags['entries']
+        else:
+            entries = tags['tags'].get(name_parts.fragment, [])
+        for entry in entries:
+            # tags is shared, so give callers their own copy
+            yield self._root(entry=_copy.deepcopy(entry), uri=tags['uri'])
+
+    def _root(self, entry, uri):
+        return {
+            'mediaType': 'application/vnd.oci.descriptor.v1+json',
+            'root': entry,
+            'uri': uri,
+        }
@@ -12,12 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import json
 import unittest
 import unittest.mock
 
+from .. import fetch_json
+from ..fetch_json import stream
 from . import oci_index_template
 
 
+def _fetch_items(final_uri, response, chunk_size=3):
+    """Mock fetch_json.fetch_items, streaming response in small chunks."""
+    def fetch_items(uri, key, media_type):
+        body = json.dumps(response)
+        chunks = (
+            body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+        return {
+            'uri': final_uri,
+            'items': stream.iter_items(chunks=chunks, key=key),
+        }
+
+    return unittest.mock.Mock(side_effect=fetch_items)
+
+
 class TestEngine(unittest.TestCase):
     def test_good(self):
         for label, name, response, expected in [
@@ -97,11 +115,8 @@ class TestEngine(unittest.TestCase):
             responseURI = 'https://x.example.com/y'
             with self.subTest(label=label):
                 with unittest.mock.patch(
-                        target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch',
-                        return_value={
-                            'uri': responseURI,
-                            'json': response,
-                        }):
+                        target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch_items',
+                        new=_fetch_items(final_uri=responseURI, response=response)):
                     resolved = list(engine.resolve(name=name))
                 self.assertEqual(
                     resolved,
@@ -121,35 +136,32 @@ class TestEngine(unittest.TestCase):
                         'index is not a JSON object',
                         [],
                         ValueError,
-                        'https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but actually returned \[]',
+                        'https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but the top-level value is not a JSON object: \[]',
                     ),
                     (
                         'manifests is not a JSON array',
                         {'manifests': {}},
                         ValueError,
-                        "https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but actually returned \{'manifests': \{}}",
+                        "https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but manifests is not a JSON array: \{}",
                     ),
                     (
                         'manifests contains a non-object',
                         {'manifests': [None]},
                         ValueError,
-                        "https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but actually returned \{'manifests': \[None]}",
+                        "https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but manifests\[0] is not a JSON object: None",
                     ),
                     (
                         'at least one manifests[].annotations is not a JSON object',
                         {'manifests': [{'annotations': None}]},
                         ValueError,
-                        "https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but actually returned \{'manifests': \[\{'annotations': None}]}",
+                        "https://example.com/index claimed to return application/vnd.oci.image.index.v1\+json, but manifests\[0].annotations is not a JSON object: None",
                     ),
                 ]:
             engine = oci_index_template.Engine(uri=uri)
             with self.subTest(label=label):
                 with unittest.mock.patch(
-                        target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch',
-                        return_value={
-                            'uri': uri,
-                            'json': response,
-                        }):
+                        target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch_items',
+                        new=_fetch_items(final_uri=uri, response=response)):
                     generator = engine.resolve(name='example.com/a')
                     self.assertRaisesRegex(error, regex, list, generator)
 
@@ -209,14 +221,12 @@ class TestEngine(unittest.TestCase):
             with self.subTest(label='{} from {}'.format(uri, base)):
                 engine = oci_index_template.Engine(uri=uri, base=base)
                 with unittest.mock.patch(
-                        target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch',
-                        return_value={
-                            'uri': expected,
-                            'json': response
-                        }) as mock:
+                        target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch_items',
+                        new=_fetch_items(final_uri=expected, response=response)) as mock:
                     resolved = list(engine.resolve(name='example.com/a#1.0'))
                     mock.assert_called_with(
                         uri=expected,
+                        key='manifests',
                         media_type='application/vnd.oci.image.index.v1+json')
                 self.assertEqual(
                     resolved,
@@ -228,3 +238,122 @@ class TestEngine(unittest.TestCase):
                         }
                         for root in response['manifests']
                     ])
+
+    def test_shared_template(self):
+        uri = 'https://{host}/index/{path}'
+        for _ in range(5):
+            engine = oci_index_template.Engine(uri=uri, base='https://a.test/')
+            self.assertEqual(
+                engine._uri(name_parts={'host': 'a.test', 'path': 'app'}),
+                'https://a.test/index/app')
+        info = engine.uri_template._cached.cache_info()
+        self.assertGreaterEqual(info.hits, 4)
+
+    def test_early_stop(self):
+        uri = 'https://example.com/index'
+        consumed = []
+
+        closed = []
+
+        def entries():
+            try:
+                for i in range(3):
+                    consumed.append(i)
+                    yield {
+                        'annotations': {
+                            'org.opencontainers.image.ref.name': str(i % 2),
+                        },
+                    }
+            finally:
+                closed.append(True)
+
+        engine = oci_index_template.Engine(uri=uri)
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch_items',
+                return_value={'uri': uri, 'items': entries()}):
+            roots = engine.resolve(name='example.com/a#1')
+            root = next(roots)
+            roots.close()
+        self.assertEqual(
+            root['root']['annotations']['org.opencontainers.image.ref.name'],
+            '1')
+        self.assertEqual(consumed, [0, 1])
+        self.assertEqual(closed, [True])
+
+    def test_tags(self):
+        uri = 'https://example.com/index'
+        response = {
+            'manifests': [
+                {
+                    'entry': i,
+                    'annotations': {
+                        'org.opencontainers.image.ref.name': str(i % 3),
+                    },
+                }
+                for i in range(6)
+            ] + [{'entry': 'untagged'}],
+        }
+        engine = oci_index_template.Engine(uri=uri)
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json._fetch',
+                return_value=({'uri': uri, 'json': response}, None)) as mock:
+            with fetch_json.batch():
+                resolved = {
+                    fragment: [
+                        root['root']['entry']
+                        for root in engine.resolve(
+                            name='example.com/a{}'.format(fragment))
+                    ]
+                    for fragment in ['#0', '#1', '#3', '']
+                }
+                next(engine.resolve(name='example.com/a#0'))['root']['entry'] = 'x'
+                again = [
+                    root['root']['entry']
+                    for root in engine.resolve(name='example.com/a#0')
+                ]
+        self.assertEqual(resolved, {
+            '#0': [0, 3],
+            '#1': [1, 4],
+            '#3': [],
+            '': [0, 1, 2, 3, 4, 5, 'untagged'],
+        })
+        self.assertEqual(again, [0, 3])
+        self.assertEqual(mock.call_count, 1)
+
+    def test_resolve_async(self):
+        uri = 'https://example.com/index'
+        response = {
+            'manifests': [
+                {
+                    'entry': 'a',
+                    'annotations': {
+                        'org.opencontainers.image.ref.name': '1.0',
+                    },
+                },
+                {
+                    'entry': 'b',
+                },
+            ],
+        }
+
+        async def fetch_view_async(uri, view, media_type):
+            return view({'uri': uri, 'json': response})
+
+        async def resolve(engine):
+            return [root async for root in engine.resolve_async(
+                name='example.com/a#1.0')]
+
+        engine = oci_index_template.Engine(uri=uri)
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine.oci_index_template._fetch_json.fetch_view_async',
+                new=fetch_view_async):
+            resolved = asyncio.run(resolve(engine=engine))
+        self.assertEqual(
+            resolved,
+            [
+                {
+                    'mediaType': 'application/vnd.oci.descriptor.v1+json',
+                    'root': response['manifests'][0],
+                    'uri': uri,
+                },
+            ])
@@ -12,9 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio as _asyncio
+import collections as _collections
+import contextvars as _contextvars
 import json as _json
 import logging as _logging
+import marshal as _marshal
+import threading as _threading
 
+from .. import fetch_json as _fetch_json
 from .. import ref_engine as _ref_engine
 
 
@@ -62,33 +68,350 @@ def yield_from_ref_engines_object(ref_engines_object, uri):
         )
 
 
-def resolve(engines, name):
-    roots = set()
+def _new_ref_engine(engine_reference):
+    try:
+        return _ref_engine.new(
+            base=engine_reference.uri, **engine_reference.config)
+    except KeyError as error:
+        _LOGGER.warning(error)
+        return None
+
+
+def _add_cas_engines(root, cas_engines, cas_engines_key):
+    """Append cas_engines to root's casEngines.
+
+    Returns the _Roots key for root's merged casEngines, which is
+    cas_engines_key (the key for cas_engines alone) unless root
+    carried CAS engines of its own.
+    """
+    own = 'casEngines' in root
+    if cas_engines:
+        if own:
+            root['casEngines'] = list(root['casEngines'])
+        else:
+            root['casEngines'] = []
+        root['casEngines'].extend(cas_engines)
+    if own:
+        return None
+    return cas_engines_key
+
+
+def _canonical(value):
+    return _json.dumps(value, sort_keys=True)
+
+
+def _snapshot(root):
+    """Return an immutable copy of root for _Roots, or None.
+
+    marshal is several times faster than _canonical(), and the copy
+    is unaffected by callers who modify the yielded root.
+    """
+    try:
+        return _marshal.dumps(root)
+    except ValueError:
+        return None  # not plain JSON data
+
+
+class _Roots(object):
+    """The roots yielded so far, for deduping.
+
+    Roots are duplicates when their JSON serializations match, but
+    serializing every root is expensive for large indexes.  Roots are
+    instead bucketed by a cheap key (source URI, descriptor digest
+    and media types, and a key for the CAS engines, which is computed
+    once per ref-engine reference), and only serialized when they
+    land in a bucket with an earlier root.  Until then, each bucket
+    holds a cheap snapshot (see _snapshot()) of its first root, not
+    the root itself.
+    """
+    def __init__(self):
+        self._buckets = {}
+
+    def add(self, root, cas_engines_key=None):
+        """Add a root, returning False if it was already present."""
+        try:
+            if cas_engines_key is None:
+                cas_engines_key = _canonical(root.get('casEngines', []))
+            descriptor = root['root']
+            key = (
+                root.get('uri'),
+                root.get('mediaType'),
+                descriptor.get('digest'),
+                descriptor.get('mediaType'),
+                cas_engines_key,
+            )
+            hash(key)
+        except (AttributeError, KeyError, TypeError):
+            key = canonical = _canonical(root)
+        else:
+            canonical = None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            snapshot = None
+            if canonical is None:
+                snapshot = _snapshot(root=root)
+                if snapshot is None:
+                    canonical = _canonical(root)
+            self._buckets[key] = [[snapshot, canonical]]
+            return True
+        if canonical is None:
+            canonical = _canonical(root)
+        for entry in bucket:
+            if entry[1] is None:
+                entry[1] = _canonical(_marshal.loads(entry[0]))
+                entry[0] = None
+            if entry[1] == canonical:
+                return False
+        bucket.append([None, canonical])
+        return True
+
+
+def resolve(engines, name, timeout=None, max_workers=1, limit=None):
+    """Resolve an image name, yielding each distinct Merkle root.
+
+    If timeout is set, resolution gives up on name after that many
+    seconds (see fetch_json.deadline).  Pending probes and fetches are
+    abandoned with a warning, and the roots already yielded are all
+    there is.  Only resolution counts against timeout, not the time
+    the caller spends between roots, and the caller's own fetches are
+    not limited by it (see fetch_json.isolated).
+
+    With max_workers greater than one, up to max_workers ref engines
+    resolve name in parallel, but their roots are buffered and
+    yielded in the same order (and with the same deduping) as with
+    one worker.  With limit as well, no more ref engines are started
+    than there are roots left to find.  If limit is set, resolution
+    stops after yielding that many roots, and ref engines which are
+    still running are cancelled: they give up at their next request
+    or read, and never delay the interpreter's exit.
+    """
+    return _fetch_json.isolated(iterator=_resolve_name(
+        engines=engines, name=name, timeout=timeout,
+        max_workers=max_workers, limit=limit))
+
+
+def _resolve_name(engines, name, timeout, max_workers, limit):
+    with _fetch_json.deadline(timeout=timeout):
+        if max_workers > 1:
+            roots = _resolve_parallel(
+                engines=engines, name=name, max_workers=max_workers,
+                limit=limit)
+        else:
+            roots = _resolve(engines=engines, name=name)
+        try:
+            yield from _first(roots=roots, limit=limit)
+        except _fetch_json.DeadlineExceeded as error:
+            _LOGGER.warning('gave up on {} ({})'.format(name, error))
+
+
+def _first(roots, limit):
+    """Yield the first limit roots (or all of them, if limit is None)."""
+    if limit is None:
+        yield from roots
+        return
+    try:
+        count = 0
+        while count < limit:
+            try:
+                root = next(roots)
+            except StopIteration:
+                return
+            yield root
+            count += 1
+    finally:
+        roots.close()
+
+
+def _ref_engines(engines, name):
+    """Yield (engine_reference, ref_engine) in resolution order."""
     for engine in engines:
         for engine_reference in engine.ref_engines(name=name):
             # deduping here might be useful, but similar ref-engine
             # configs retrieved from different URIs might be
             # equivalent or not depending on whether (template) URIs
             # in the config are absolute or relative.
-            try:
-                ref_engine = _ref_engine.new(
-                    base=engine_reference.uri, **engine_reference.config)
-            except KeyError as error:
+            _fetch_json.check_deadline()
+            ref_engine = _new_ref_engine(engine_reference=engine_reference)
+            if ref_engine is None:
+                continue
+            yield engine_reference, ref_engine
+
+
+def _new_roots(roots, resolved, engine_reference):
+    """Yield roots from engine_reference which were not yet in roots."""
+    cas_engines_key = _canonical(engine_reference.cas_engines)
+    for root in resolved:
+        root_cas_engines_key = _add_cas_engines(
+            root=root,
+            cas_engines=engine_reference.cas_engines,
+            cas_engines_key=cas_engines_key)
+        if roots.add(root=root, cas_engines_key=root_cas_engines_key):
+            yield root
+
+
+def _resolve(engines, name):
+    roots = _Roots()
+    for engine_reference, ref_engine in _ref_engines(
+            engines=engines, name=name):
+        try:
+            yield from _new_roots(
+                roots=roots, resolved=ref_engine.resolve(name=name),
+                engine_reference=engine_reference)
+        except _fetch_json.DeadlineExceeded:
+            raise
+        except Exception as error:
+            _LOGGER.warning(error)
+            continue
+
+
+def _drain(ref_engine, name):
+    """Resolve name, returning (roots, error).
+
+    roots are those resolved before any error, so the caller can
+    yield them just as _resolve() would have.
+    """
+    roots = []
+    try:
+        for root in ref_engine.resolve(name=name):
+            roots.append(root)
+    except Exception as error:
+        return roots, error
+    return roots, None
+
+
+def _resolve_parallel(engines, name, max_workers, limit=None):
+    roots = _Roots()
+    references = _ref_engines(engines=engines, name=name)
+    cancelled = _threading.Event()
+    pending = _collections.deque()
+    count = 0
+    try:
+        while True:
+            workers = max_workers
+            if limit is not None:
+                # ref engines beyond this would only be cancelled
+                workers = min(workers, limit - count)
+            while len(pending) < workers:
+                try:
+                    engine_reference, ref_engine = next(references)
+                except StopIteration:
+                    break
+                pending.append((engine_reference, _fetch_json.start(
+                    _drain, cancelled=cancelled, ref_engine=ref_engine,
+                    name=name)))
+            if not pending:
+                return
+            engine_reference, future = pending.popleft()
+            resolved, error = future.result()
+            for root in _new_roots(
+                    roots=roots, resolved=resolved,
+                    engine_reference=engine_reference):
+                count += 1
+                yield root
+            if isinstance(error, _fetch_json.DeadlineExceeded):
+                raise error
+            if error is not None:
                 _LOGGER.warning(error)
+    finally:
+        cancelled.set()
+        references.close()
+
+
+def resolve_many(engines, names, timeout=None, max_workers=1, limit=None):
+    """Resolve several names, sharing discovery and index fetches.
+
+    Yields (name, root) tuples, grouped by name in the order the
+    names were given (repeated names are only resolved once).  Each
+    distinct document, such as a host's oci-host-ref-engines or an
+    expanded index URI, is fetched at most once for the whole batch
+    and shared by every name that needs it.  timeout, max_workers and
+    limit apply to each name separately, as for resolve().  The batch
+    only covers resolution, not the caller's own fetches between
+    roots.
+    """
+    return _fetch_json.isolated(iterator=_resolve_names(
+        engines=engines, names=names, timeout=timeout,
+        max_workers=max_workers, limit=limit))
+
+
+def _resolve_names(engines, names, timeout, max_workers, limit):
+    with _fetch_json.batch():
+        for name in _collections.OrderedDict.fromkeys(names):
+            for root in _resolve_name(
+                    engines=engines, name=name, timeout=timeout,
+                    max_workers=max_workers, limit=limit):
+                yield (name, root)
+
+
+async def _ref_engines_async(engine, name):
+    if hasattr(engine, 'ref_engines_async'):
+        async for engine_reference in engine.ref_engines_async(name=name):
+            yield engine_reference
+    else:
+        for engine_reference in engine.ref_engines(name=name):
+            yield engine_reference
+
+
+async def _resolve_async(ref_engine, name):
+    if hasattr(ref_engine, 'resolve_async'):
+        async for root in ref_engine.resolve_async(name=name):
+            yield root
+    else:
+        # no native support, so fall back to a worker thread (in
+        # this context, so it sees the deadline)
+        loop = _asyncio.get_running_loop()
+        roots = await loop.run_in_executor(
+            None, _contextvars.copy_context().run,
+            lambda: list(ref_engine.resolve(name=name)))
+        for root in roots:
+            yield root
+
+
+def resolve_async(engines, name, timeout=None):
+    """The asyncio counterpart of resolve().
+
+    Discovery engines and ref engines are driven through their
+    ref_engines_async and resolve_async methods when they have them.
+    Roots are yielded in the same order and with the same deduping
+    as resolve(), and timeout works the same way (see
+    fetch_json.isolated_async).
+    """
+    return _fetch_json.isolated_async(iterator=_resolve_name_async(
+        engines=engines, name=name, timeout=timeout))
+
+
+async def _resolve_name_async(engines, name, timeout):
+    with _fetch_json.deadline(timeout=timeout):
+        try:
+            async for root in _resolve_async_roots(engines=engines, name=name):
+                yield root
+        except _fetch_json.DeadlineExceeded as error:
+            _LOGGER.warning('gave up on {} ({})'.format(name, error))
+
+
+async def _resolve_async_roots(engines, name):
+    roots = _Roots()
+    for engine in engines:
+        async for engine_reference in _ref_engines_async(
+                engine=engine, name=name):
+            _fetch_json.check_deadline()
+            ref_engine = _new_ref_engine(engine_reference=engine_reference)
+            if ref_engine is None:
                 continue
+            cas_engines_key = _canonical(engine_reference.cas_engines)
             try:
-                for root in ref_engine.resolve(name=name):
-                    if engine_reference.cas_engines:
-                        if 'casEngines' in root:
-                            root['casEngines'] = list(root['casEngines'])
-                        else:
-                            root['casEngines'] = []
-                        root['casEngines'].extend(engine_reference.cas_engines)
-                    root_hash = hash(_json.dumps(root, sort_keys=True))
-                    if root_hash in roots:
+                async for root in _resolve_async(
+                        ref_engine=ref_engine, name=name):
+                    root_cas_engines_key = _add_cas_engines(
+                        root=root,
+                        cas_engines=engine_reference.cas_engines,
+                        cas_engines_key=cas_engines_key)
+                    if not roots.add(
+                            root=root, cas_engines_key=root_cas_engines_key):
                         continue
-                    roots.add(root_hash)
                     yield root
+            except _fetch_json.DeadlineExceeded:
+                raise
             except Exception as error:
                 _LOGGER.warning(error)
                 continue
@@ -15,9 +15,13 @@
 import argparse
 import json
 import logging
+import os
 import sys
 
-from . import resolve
+from .. import fetch_json
+from ..fetch_json import cache
+from . import daemon
+from . import resolve_many
 from . import well_known_uri
 from . import xdg
 
@@ -34,8 +38,10 @@ parser.add_argument(
 parser.add_argument(
     '-l', '--log-level',
     choices=['critical', 'error', 'warning', 'info', 'debug'],
-    help='Log verbosity.  Defaults to {!r}.'.format(
-        logging.getLevelName(log.level).lower()))
+    help=(
+        "Log verbosity.  The resolver daemon's logs go to its own stderr, "
+        "so 'info' and 'debug' resolve names in this process instead.  "
+        'Defaults to {!r}.'.format(logging.getLevelName(log.level).lower())))
 parser.add_argument(
     '--protocol',
     action='append',
@@ -55,6 +61,102 @@ parser.add_argument(
         "running on their protocol's usual port.  This option should be "
         'combined with a single --protocol option to avoid trying multiple '
         'protocols against the same port.'))
+parser.add_argument(
+    '--discovery-workers',
+    type=int,
+    default=1,
+    help=(
+        'Number of well-known URI ref-engine discovery requests to run in '
+        'parallel.  Results are still processed in the order described '
+        'for --protocol.  Defaults to %(default)s.'))
+parser.add_argument(
+    '--ref-engine-workers',
+    type=int,
+    default=1,
+    help=(
+        'Number of ref engines to resolve each name with in parallel, e.g. '
+        'when the XDG configuration lists several mirrors.  Roots are still '
+        'written in the same order as with one worker.  Defaults to '
+        '%(default)s.'))
+parser.add_argument(
+    '--limit',
+    type=int,
+    help=(
+        'Stop resolving each name once this many roots have been found.  '
+        'Ref engines which are still running give up at their next '
+        'request or read.  Defaults to no limit.'))
+parser.add_argument(
+    '--hedge-delay',
+    type=float,
+    help=(
+        'Race the protocols for each host instead of trying every host '
+        'with one protocol before moving on to the next.  The next '
+        "protocol's request starts when the earlier ones have failed or "
+        'after this many seconds without an answer, and the first '
+        'successful answer is used.  Results are then ordered by host '
+        'instead of by protocol.  Defaults to no racing.'))
+parser.add_argument(
+    '--connect-timeout',
+    type=float,
+    default=fetch_json.CONNECT_TIMEOUT,
+    help=(
+        'Seconds to wait while connecting to a server.  When a resolver '
+        "daemon is running, the daemon's own setting applies instead.  "
+        'Defaults to %(default)s.'))
+parser.add_argument(
+    '--read-timeout',
+    type=float,
+    default=fetch_json.READ_TIMEOUT,
+    help=(
+        'Seconds to wait for each read from a server.  When a resolver '
+        "daemon is running, the daemon's own setting applies instead.  "
+        'Defaults to %(default)s.'))
+parser.add_argument(
+    '--transport',
+    choices=['auto', 'urllib', 'http2'],
+    default='urllib',
+    help=(
+        "HTTP client.  'urllib' only needs the standard library, and "
+        "races IPv6 and IPv4 connections.  'http2' multiplexes requests to "
+        "each server over a single connection, and needs httpx[http2].  "
+        "'auto' uses 'http2' if it is installed.  "
+        "When a resolver daemon is running, the daemon's own setting "
+        'applies instead.  Defaults to %(default)s.'))
+parser.add_argument(
+    '--timeout',
+    type=float,
+    help=(
+        'Seconds to spend resolving each name.  When they run out, pending '
+        'requests for that name are abandoned, and only the roots resolved '
+        'so far are written.  Defaults to no limit.'))
+parser.add_argument(
+    '--format',
+    choices=['json', 'jsonl'],
+    default='json',
+    help=(
+        "Output format.  'json' writes a single object mapping each name to "
+        "its list of roots once every name has been resolved.  'jsonl' "
+        "writes one {\"name\": ..., \"root\": ...} object per line as "
+        'soon as each root is resolved.  Defaults to %(default)s.'))
+parser.add_argument(
+    '--no-cache',
+    action='store_true',
+    help=(
+        'Do not read or write the on-disk cache of discovery documents and '
+        'indexes in $XDG_CACHE_HOME/oci-discovery.  This also skips the '
+        'daemon, whose cache may be warm.'))
+parser.add_argument(
+    '--daemon-socket',
+    help=(
+        'Unix socket of a running resolver daemon (see '
+        'oci_discovery.ref_engine_discovery.daemon).  Defaults to '
+        '{}.'.format(daemon.socket_path())))
+parser.add_argument(
+    '--no-daemon',
+    action='store_true',
+    help=(
+        'Resolve names in this process, even if a resolver daemon is '
+        'running.'))
 
 args = parser.parse_args()
 
@@ -65,17 +167,93 @@ if args.log_level:
 if args.protocol is None:
     args.protocol = ('https', 'http')
 
-engines = [
-    xdg.Engine(),
-    well_known_uri.Engine(protocols=args.protocol, port=args.port),
-]
-
-resolved = {}
-for name in args.names:
-    resolved[name] = list(resolve(engines=engines, name=name))
-json.dump(
-    resolved,
-    sys.stdout,
-    indent=2,
-    sort_keys=True)
-sys.stdout.write('\n')
+if args.discovery_workers < 1:
+    parser.error('--discovery-workers must be at least 1')
+
+if args.hedge_delay is not None and args.hedge_delay < 0:
+    parser.error('--hedge-delay must not be negative')
+
+if args.ref_engine_workers < 1:
+    parser.error('--ref-engine-workers must be at least 1')
+
+if args.limit is not None and args.limit < 1:
+    parser.error('--limit must be at least 1')
+
+if args.timeout is not None and args.timeout <= 0:
+    parser.error('--timeout must be positive')
+
+if args.connect_timeout <= 0:
+    parser.error('--connect-timeout must be positive')
+
+if args.read_timeout <= 0:
+    parser.error('--read-timeout must be positive')
+
+
+def daemon_results(results):
+    """Yield from the daemon's results, exiting on daemon errors."""
+    try:
+        yield from results
+    except RuntimeError as error:
+        parser.exit(
+            status=1, message='{}: error: {}\n'.format(parser.prog, error))
+
+
+results = None
+if not (args.no_daemon or args.no_cache or log.level < logging.WARNING):
+    try:
+        results = daemon.resolve_many(
+            names=args.names,
+            protocols=args.protocol,
+            port=args.port,
+            discovery_workers=args.discovery_workers,
+            hedge_delay=args.hedge_delay,
+            timeout=args.timeout,
+            ref_engine_workers=args.ref_engine_workers,
+            limit=args.limit,
+            path=args.daemon_socket)
+    except OSError:
+        pass  # no daemon is listening
+    else:
+        results = daemon_results(results=results)
+
+if results is None:
+    try:
+        fetch_json.use_transport(name=args.transport)
+    except ImportError as error:
+        parser.error(str(error))
+    fetch_json.CONNECT_TIMEOUT = args.connect_timeout
+    fetch_json.READ_TIMEOUT = args.read_timeout
+
+    if not args.no_cache:
+        fetch_json.CACHE = cache.Cache(
+            store=cache.DirectoryStore(
+                path=xdg.cache_path(
+                    path=os.path.join('oci-discovery', 'http'))))
+
+    engines = [
+        xdg.Engine(),
+        well_known_uri.Engine(
+            protocols=args.protocol,
+            port=args.port,
+            max_workers=args.discovery_workers,
+            hedge_delay=args.hedge_delay),
+    ]
+    results = resolve_many(
+        engines=engines, names=args.names, timeout=args.timeout,
+        max_workers=args.ref_engine_workers, limit=args.limit)
+
+if args.format == 'jsonl':
+    for name, root in results:
+        json.dump({'name': name, 'root': root}, sys.stdout, sort_keys=True)
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+else:
+    resolved = {name: [] for name in args.names}
+    for name, root in results:
+        resolved[name].append(root)
+    json.dump(
+        resolved,
+        sys.stdout,
+        indent=2,
+        sort_keys=True)
+    sys.stdout.write('\n')
@@ -0,0 +1,158 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmarks for ref-engine discovery.
+
+Run with:
+
+  $ python3 -m oci_discovery.ref_engine_discovery.benchmark
+"""
+
+import json
+import re
+import time
+
+from . import _Roots
+from . import _add_cas_engines
+from . import _canonical
+from . import regexp_set
+
+
+def _index_roots(count):
+    return [
+        {
+            'mediaType': 'application/vnd.oci.descriptor.v1+json',
+            'root': {
+                'annotations': {
+                    'org.opencontainers.image.ref.name': str(i),
+                },
+                'digest': 'sha256:{:064x}'.format(i),
+                'mediaType': 'application/vnd.oci.image.manifest.v1+json',
+                'platform': {'architecture': 'amd64', 'os': 'linux'},
+                'size': 799,
+            },
+            'uri': 'https://example.com/index',
+        }
+        for i in range(count)
+    ]
+
+
+def dedup(count=20000, repeat=5):
+    """Compare full serialization with _Roots for one large index."""
+    cas_engines = [
+        {
+            'config': {
+                'protocol': 'oci-cas-template-v1',
+                'uri': 'https://{}.example.com/cas/{{algorithm}}/{{encoded}}'
+                       .format(mirror),
+            },
+            'uri': 'https://example.com/.well-known/oci-host-ref-engines',
+        }
+        for mirror in ['a', 'b']
+    ]
+
+    def serialize(roots):
+        seen = set()
+        for root in roots:
+            _add_cas_engines(
+                root=root, cas_engines=cas_engines, cas_engines_key=None)
+            root_hash = hash(json.dumps(root, sort_keys=True))
+            if root_hash not in seen:
+                seen.add(root_hash)
+
+    def bucket(roots):
+        seen = _Roots()
+        cas_engines_key = _canonical(cas_engines)
+        for root in roots:
+            seen.add(
+                root=root,
+                cas_engines_key=_add_cas_engines(
+                    root=root, cas_engines=cas_engines,
+                    cas_engines_key=cas_engines_key))
+
+    def arguments():
+        return {'roots': _index_roots(count=count)}
+
+    return {
+        label: _best(function=function, repeat=repeat, arguments=arguments)
+        for label, function in [('serialize', serialize), ('bucket', bucket)]
+    }
+
+
+def xdg_match(count=10000, names=1000, repeat=5):
+    """Compare linear regexp search with RegexpSet for an XDG config.
+
+    The synthetic config has count patterns in the (-len(key), key)
+    order xdg.Engine uses: mostly host- or repository-anchored keys,
+    plus a few unanchored ones which always have to be tried.
+    """
+    keys = []
+    for i in range(count):
+        if i % 1000 == 0:
+            keys.append(r'^[^/]*\.internal{}\.example\.com/.*$'.format(i))
+        elif i % 2:
+            keys.append(r'^host{}\.example\.com/'.format(i))
+        else:
+            keys.append(r'^host{}\.example\.com/app{}(#.*)?$'.format(i - 1, i))
+    keys.sort(key=lambda key: (-len(key), key))
+    regexps = [(key, re.compile(key)) for key in keys]
+    regexps_set = regexp_set.RegexpSet(regexps=regexps)
+    image_names = [
+        'host{}.example.com/app{}#1.0'.format(2 * i + 1, 2 * i + 2)
+        for i in range(names)
+    ]
+
+    def linear():
+        for name in image_names:
+            [key for key, regexp in regexps if regexp.search(name)]
+
+    def indexed():
+        for name in image_names:
+            list(regexps_set.search(name=name))
+
+    return {
+        label: _best(function=function, repeat=repeat)
+        for label, function in [('linear', linear), ('indexed', indexed)]
+    }
+
+
+def _best(function, repeat, arguments=dict):
+    """Return the fastest of repeat runs.
+
+    arguments is called outside the timing before each run, and
+    returns function's keyword arguments, e.g. fresh roots.
+    """
+    times = []
+    for _ in range(repeat):
+        kwargs = arguments()
+        start = time.perf_counter()
+        function(**kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    results = dedup()
+    print('dedup 20000 roots: serialize {:.3f}s, bucket {:.3f}s ({:.1f}x)'
+          .format(results['serialize'], results['bucket'],
+                  results['serialize'] / results['bucket']))
+    results = xdg_match()
+    print('match 1000 names against 10000 XDG patterns: linear {:.3f}s, '
+          'indexed {:.3f}s ({:.1f}x)'
+          .format(results['linear'], results['indexed'],
+                  results['linear'] / results['indexed']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A long-running ref-engine discovery service on a Unix socket.
+
+The daemon keeps its engines, their parsed configuration and the
+fetch_json cache warm between requests.  Run it with:
+
+  $ python3 -m oci_discovery.ref_engine_discovery.daemon
+
+Each connection carries a single request, which is one line of JSON:
+
+  {"names": [...], "protocols": ["https", "http"], "port": null,
+   "discovery_workers": 1, "hedge_delay": null, "timeout": null,
+   "ref_engine_workers": 1, "limit": null}
+
+The daemon answers with one line of JSON per resolved root, in the
+same order as ref_engine_discovery.resolve_many:
+
+  {"name": ..., "root": ...}
+
+followed by {"done": true}, or by {"error": ...} if the request
+failed.  resolve_many() in this module is a client for that protocol.
+"""
+
+import argparse as _argparse
+import errno as _errno
+import json as _json
+import logging as _logging
+import os as _os
+import socket as _socket
+import socketserver as _socketserver
+import stat as _stat
+
+from .. import fetch_json as _fetch_json
+from ..fetch_json import cache as _cache
+from . import negative_cache as _negative_cache
+from . import resolve_many as _resolve_many
+from . import well_known_uri as _well_known_uri
+from . import xdg as _xdg
+
+
+_LOGGER = _logging.getLogger(__name__)
+
+SOCKET_PATH = _os.path.join('oci-discovery', 'resolver.sock')
+
+
+def socket_path():
+    """Return the default socket path, under $XDG_RUNTIME_DIR."""
+    return _xdg.runtime_path(path=SOCKET_PATH)
+
+
+def _encode(value):
+    return (_json.dumps(value, sort_keys=True) + '\n').encode('UTF-8')
+
+
+def _request(line):
+    """Parse and validate a request line."""
+    request = _json.loads(line.decode('UTF-8'))
+    if not isinstance(request, dict):
+        raise ValueError('request is not a JSON object: {!r}'.format(request))
+    names = request.get('names')
+    if not isinstance(names, list) or not all(
+            isinstance(name, str) for name in names):
+        raise ValueError('names is not a JSON array of strings: {!r}'.format(
+            names))
+    protocols = request.get('protocols', ['https', 'http'])
+    if not isinstance(protocols, list) or not all(
+            protocol in ('http', 'https') for protocol in protocols):
+        raise ValueError(
+            'protocols is not a JSON array of http and https: {!r}'.format(
+                protocols))
+    port = request.get('port')
+    if port is not None and not (
+            isinstance(port, int) and not isinstance(port, bool) and
+            0 < port < 65536):
+        raise ValueError(
+            'port is not an integer from 1 to 65535: {!r}'.format(port))
+    discovery_workers = request.get('discovery_workers', 1)
+    if (not isinstance(discovery_workers, int) or
+            isinstance(discovery_workers, bool) or discovery_workers < 1):
+        raise ValueError(
+            'discovery_workers is not a positive integer: {!r}'.format(
+                discovery_workers))
+    hedge_delay = request.get('hedge_delay')
+    if hedge_delay is not None and not _is_number(
+            value=hedge_delay, minimum=0):
+        raise ValueError(
+            'hedge_delay is not a non-negative number: {!r}'.format(
+                hedge_delay))
+    timeout = request.get('timeout')
+    if timeout is not None and not (
+            _is_number(value=timeout, minimum=0) and timeout > 0):
+        raise ValueError(
+            'timeout is not a positive number: {!r}'.format(timeout))
+    ref_engine_workers = request.get('ref_engine_workers', 1)
+    if (not isinstance(ref_engine_workers, int) or
+            isinstance(ref_engine_workers, bool) or ref_engine_workers < 1):
+        raise ValueError(
+            'ref_engine_workers is not a positive integer: {!r}'.format(
+                ref_engine_workers))
+    limit = request.get('limit')
+    if limit is not None and not (
+            isinstance(limit, int) and not isinstance(limit, bool) and
+            limit > 0):
+        raise ValueError('limit is not a positive integer: {!r}'.format(limit))
+    return {
+        'names': names,
+        'protocols': tuple(protocols),
+        'port': port,
+        'discovery_workers': discovery_workers,
+        'hedge_delay': hedge_delay,
+        'timeout': timeout,
+        'ref_engine_workers': ref_engine_workers,
+        'limit': limit,
+    }
+
+
+def _is_number(value, minimum):
+    return (
+        isinstance(value, (int, float)) and
+        not isinstance(value, bool) and
+        value >= minimum)
+
+
+class _Handler(_socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            self._handle()
+        except OSError as error:
+            # most likely the client went away, so there is nobody
+            # to report to.
+            _LOGGER.debug('request failed ({})'.format(error))
+
+    def _handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return  # e.g. a liveness check from _remove_stale
+        try:
+            request = _request(line=line)
+        except ValueError as error:
+            self._write({'error': 'invalid request: {}'.format(error)})
+            return
+        _LOGGER.debug('resolving {}'.format(request['names']))
+        try:
+            engines = self.server.engines(
+                protocols=request['protocols'],
+                port=request['port'],
+                discovery_workers=request['discovery_workers'],
+                hedge_delay=request['hedge_delay'])
+            for name, root in _resolve_many(
+                    engines=engines, names=request['names'],
+                    timeout=request['timeout'],
+                    max_workers=request['ref_engine_workers'],
+                    limit=request['limit']):
+                self._write({'name': name, 'root': root})
+        except OSError:
+            raise
+        except Exception as error:
+            _LOGGER.warning(error)
+            self._write({'error': str(error)})
+            return
+        self._write({'done': True})
+
+    def _write(self, value):
+        self.wfile.write(_encode(value=value))
+        self.wfile.flush()
+
+
+class Server(_socketserver.ThreadingMixIn, _socketserver.UnixStreamServer):
+    """Serve resolution requests on a Unix socket.
+
+    Every request shares the same xdg.Engine (which checks for
+    configuration changes at most every reload_interval seconds) and
+    one record of failed well-known URI probes.  Each request gets
+    its own well_known_uri.Engine for its protocols, port,
+    discovery_workers and hedge_delay, which holds nothing else.  If
+    engines is set, it is called with those request parameters
+    instead, and must return a list of discovery engines.
+
+    A socket left behind by a daemon which is no longer running is
+    replaced, but an OSError is raised if another daemon is still
+    listening on path.
+    """
+    daemon_threads = True
+
+    def __init__(self, path=None, engines=None, reload_interval=5):
+        if path is None:
+            path = socket_path()
+        if engines is None:
+            engines = self._engines
+        self.engines = engines
+        self._xdg = _xdg.Engine(reload_interval=reload_interval)
+        self._negative_cache = _negative_cache.NegativeCache()
+        directory = _os.path.dirname(path)
+        if directory:
+            _os.makedirs(directory, mode=0o700, exist_ok=True)
+        _remove_stale(path=path)
+        super(Server, self).__init__(path, _Handler)
+
+    def _engines(self, protocols, port, discovery_workers, hedge_delay):
+        return [self._xdg, _well_known_uri.Engine(
+            protocols=protocols,
+            port=port,
+            max_workers=discovery_workers,
+            negative_cache=self._negative_cache,
+            hedge_delay=hedge_delay)]
+
+    def server_close(self):
+        super(Server, self).server_close()
+        try:
+            _os.remove(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale(path):
+    try:
+        mode = _os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not _stat.S_ISSOCK(mode):
+        return  # not ours, so leave it for bind() to complain about
+    with _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            _LOGGER.debug('removing stale socket {}'.format(path))
+            _os.remove(path)
+            return
+    raise OSError(
+        _errno.EADDRINUSE,
+        'another daemon is already listening on {}'.format(path))
+
+
+def resolve_many(names, protocols=('https', 'http'), port=None,
+                 discovery_workers=1, hedge_delay=None, timeout=None,
+                 ref_engine_workers=1, limit=None, path=None):
+    """Resolve names with a running daemon.
+
+    The arguments mirror the command-line tool's options.  Connecting
+    happens before this function returns, so if no daemon is
+    listening on path (which defaults to socket_path()), the OSError
+    is raised here.  Returns an iterator over (name, root) tuples,
+    which raises RuntimeError if the daemon reports an error.
+    """
+    if path is None:
+        path = socket_path()
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(_encode(value={
+            'names': list(names),
+            'protocols': list(protocols),
+            'port': port,
+            'discovery_workers': discovery_workers,
+            'hedge_delay': hedge_delay,
+            'timeout': timeout,
+            'ref_engine_workers': ref_engine_workers,
+            'limit': limit,
+        }))
+    except OSError:
+        sock.close()
+        raise
+    return _responses(sock=sock, path=path)
+
+
+def _responses(sock, path):
+    with sock, sock.makefile('rb') as rfile:
+        for line in rfile:
+            response = _json.loads(line.decode('UTF-8'))
+            if 'error' in response:
+                raise RuntimeError('{}: {}'.format(path, response['error']))
+            if response.get('done'):
+                return
+            yield (response['name'], response['root'])
+    raise RuntimeError('{} closed the connection early'.format(path))
+
+
+def main():
+    _logging.basicConfig()
+    log = _logging.getLogger()
+    log.setLevel(_logging.ERROR)
+
+    parser = _argparse.ArgumentParser(
+        description='Serve OCI Ref-Engine Discovery on a Unix socket.')
+    parser.add_argument(
+        '--socket',
+        default=socket_path(),
+        help='Path for the Unix socket.  Defaults to %(default)s.')
+    parser.add_argument(
+        '-l', '--log-level',
+        choices=['critical', 'error', 'warning', 'info', 'debug'],
+        help='Log verbosity.  Defaults to {!r}.'.format(
+            _logging.getLevelName(log.level).lower()))
+    parser.add_argument(
+        '--reload-interval',
+        type=float,
+        default=5,
+        help=(
+            'Seconds between checks for changes to the XDG ref-engine '
+            'configuration.  Defaults to %(default)s.'))
+    parser.add_argument(
+        '--connect-timeout',
+        type=float,
+        default=_fetch_json.CONNECT_TIMEOUT,
+        help=(
+            'Seconds to wait while connecting to a server.  Defaults to '
+            '%(default)s.'))
+    parser.add_argument(
+        '--read-timeout',
+        type=float,
+        default=_fetch_json.READ_TIMEOUT,
+        help=(
+            'Seconds to wait for each read from a server.  Defaults to '
+            '%(default)s.'))
+    parser.add_argument(
+        '--transport',
+        choices=['auto', 'urllib', 'http2'],
+        default='urllib',
+        help=(
+            "HTTP client.  'urllib' only needs the standard library, and "
+            "races IPv6 and IPv4 connections.  'http2' multiplexes "
+            'requests to each server over a single connection, and needs '
+            "httpx[http2].  'auto' uses 'http2' if it is installed.  "
+            'Defaults to %(default)s.'))
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help=(
+            'Do not read or write the on-disk cache of discovery documents '
+            'and indexes in $XDG_CACHE_HOME/oci-discovery.  Responses are '
+            'still cached in memory following their HTTP caching headers.'))
+
+    args = parser.parse_args()
+
+    if args.log_level:
+        log.setLevel(getattr(_logging, args.log_level.upper()))
+
+    if args.connect_timeout <= 0:
+        parser.error('--connect-timeout must be positive')
+
+    if args.read_timeout <= 0:
+        parser.error('--read-timeout must be positive')
+
+    try:
+        _fetch_json.use_transport(name=args.transport)
+    except ImportError as error:
+        parser.error(str(error))
+    _fetch_json.CONNECT_TIMEOUT = args.connect_timeout
+    _fetch_json.READ_TIMEOUT = args.read_timeout
+
+    store = None
+    if not args.no_cache:
+        store = _cache.DirectoryStore(
+            path=_xdg.cache_path(path=_os.path.join('oci-discovery', 'http')))
+    _fetch_json.CACHE = _cache.Cache(store=store)
+
+    server = Server(path=args.socket, reload_interval=args.reload_interval)
+    _LOGGER.info('listening on {}'.format(args.socket))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
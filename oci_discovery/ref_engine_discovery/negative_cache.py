@@ -0,0 +1,143 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections as _collections
+import email.utils as _email_utils
+import socket as _socket
+import ssl as _ssl
+import threading as _threading
+import time as _time
+import urllib.error as _urllib_error
+
+
+# Seconds to remember each kind of failure.  Missing documents are
+# unlikely to appear soon, while timeouts and server errors are more
+# likely to be transient.
+TTLS = {
+    'not-found': 300,  # 404 and 410
+    'client-error': 60,  # other 4xx responses
+    'server-error': 10,  # 5xx responses (and 429)
+    'timeout': 5,
+    'connection': 30,  # DNS failures, refused or reset connections
+    'tls': 60,  # certificate and other SSL errors
+    'invalid': 300,  # wrong media type, invalid JSON, etc.
+}
+
+# Upper bound for Retry-After on server errors, in seconds.
+MAX_RETRY_AFTER = 300
+
+
+def _is_timeout(error):
+    if isinstance(error, _socket.timeout):
+        return True
+    return isinstance(error, _urllib_error.URLError) and isinstance(
+        getattr(error, 'reason', None), _socket.timeout)
+
+
+def classify(error):
+    """Return the TTLS key for a failed fetch."""
+    if isinstance(error, _urllib_error.HTTPError):
+        if error.code in (404, 410):
+            return 'not-found'
+        if error.code == 429 or error.code >= 500:
+            return 'server-error'
+        return 'client-error'
+    if _is_timeout(error=error):
+        return 'timeout'
+    if isinstance(error, (_ssl.CertificateError, _ssl.SSLError)) or (
+            isinstance(error, _urllib_error.URLError) and isinstance(
+                getattr(error, 'reason', None),
+                (_ssl.CertificateError, _ssl.SSLError))):
+        return 'tls'
+    if isinstance(error, (_urllib_error.URLError, OSError)):
+        return 'connection'
+    return 'invalid'
+
+
+def _retry_after(error):
+    """Return the seconds requested by an HTTPError's Retry-After."""
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        pass
+    try:
+        date = _email_utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - _time.time(), 0)
+
+
+class NegativeCache(object):
+    """Remember failed (protocol, host) probes for a while.
+
+    Each failure is classified (see classify) and remembered for the
+    matching TTLS entry, or for the server's Retry-After (capped at
+    MAX_RETRY_AFTER) when a server error sets one.  ttls overrides
+    entries in TTLS; set an entry to zero to stop remembering that
+    kind of failure.  At most max_entries failures are remembered,
+    dropping the oldest first.
+    """
+    def __init__(self, ttls=None, max_entries=1024):
+        self.ttls = dict(TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_entries = max_entries
+        self._lock = _threading.Lock()
+        self._entries = _collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, protocol, host):
+        """Return the reason a probe recently failed, or None."""
+        key = (protocol, host)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, reason = entry
+            if _time.monotonic() >= expires:
+                del self._entries[key]
+                return None
+        return reason
+
+    def add(self, protocol, host, error):
+        """Remember that a probe failed with error.
+
+        Returns the number of seconds the failure will be remembered.
+        """
+        kind = classify(error=error)
+        ttl = self.ttls.get(kind, 0)
+        if kind == 'server-error':
+            retry_after = _retry_after(error=error)
+            if retry_after is not None:
+                ttl = min(retry_after, MAX_RETRY_AFTER)
+        if ttl <= 0:
+            return 0
+        key = (protocol, host)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (
+                _time.monotonic() + ttl, '{}: {}'.format(kind, error))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return ttl
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
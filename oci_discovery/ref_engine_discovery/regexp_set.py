@@ -0,0 +1,87 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+_METACHARACTERS = set('.^$*+?{}[]\\|()')
+_OPTIONAL_QUANTIFIERS = set('*?{')
+
+
+def literal_prefix(pattern):
+    """Return the literal text every match of pattern must start with.
+
+    Only patterns anchored with a leading '^' (and without any '|',
+    which could escape the anchor) have a literal prefix.  Returns ''
+    for other patterns, and when the pattern starts with something
+    other than a literal (e.g. '^[ab]').
+    """
+    if not pattern.startswith('^') or '|' in pattern:
+        return ''
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        character = pattern[i]
+        if character == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if not escaped or escaped.isalnum():
+                break  # a character class (\d) or an anchor (\b)
+            character = escaped
+            i += 2
+        elif character in _METACHARACTERS:
+            if character in _OPTIONAL_QUANTIFIERS and prefix:
+                prefix.pop()  # the previous character may not match
+            break
+        else:
+            i += 1
+        prefix.append(character)
+    return ''.join(prefix)
+
+
+class RegexpSet(object):
+    """Ordered (key, compiled regexp) pairs with a literal-prefix index.
+
+    search(name) yields the same keys, in the same order, as trying
+    each regexp.search(name) in turn, but only regexps whose literal
+    prefix (see literal_prefix) starts the name, or which have no
+    literal prefix, are actually tried.
+    """
+    def __init__(self, regexps=()):
+        self._regexps = list(regexps)
+        self._unindexed = []
+        buckets = {}
+        for i, (_, regexp) in enumerate(self._regexps):
+            prefix = literal_prefix(pattern=regexp.pattern)
+            if prefix:
+                buckets.setdefault(len(prefix), {}).setdefault(
+                    prefix, []).append(i)
+            else:
+                self._unindexed.append(i)
+        self._buckets = sorted(buckets.items())
+
+    def __iter__(self):
+        return iter(self._regexps)
+
+    def __len__(self):
+        return len(self._regexps)
+
+    def search(self, name):
+        """Yield the keys of regexps which match name, in order."""
+        candidates = list(self._unindexed)
+        for length, bucket in self._buckets:
+            if length > len(name):
+                break
+            candidates.extend(bucket.get(name[:length], ()))
+        candidates.sort()
+        for i in candidates:
+            key, regexp = self._regexps[i]
+            if regexp.search(name):
+                yield key
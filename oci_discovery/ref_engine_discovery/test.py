@@ -12,9 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import email.message
+import json
 import os
+import threading
+import time
 import unittest
+import unittest.mock
 
+from .. import fetch_json
+from . import RefEngineReference
+from . import _Roots
+from . import _add_cas_engines
+from . import _canonical
+from . import resolve
+from . import resolve_async
+from . import resolve_many
+from . import well_known_uri
 from . import yield_from_ref_engines_object
 
 
@@ -97,3 +112,391 @@ class TestYieldFromRefEnginesObject(unittest.TestCase):
                     ref_engines_object=ref_engines_object,
                     uri='https://example.com')
                 self.assertRaisesRegex(ValueError, regex, list, generator)
+
+
+class _DiscoveryEngine(object):
+    def __init__(self, references):
+        self.references = references
+
+    def ref_engines(self, name):
+        return iter(self.references)
+
+
+class _RefEngine(object):
+    ROOTS = {
+        'a': [{'digest': '1'}, {'digest': '2'}],
+        'b': [{'digest': '2'}, {'digest': '3'}],
+        'broken': None,
+        'slow': [],
+    }
+
+    def __init__(self, protocol, base=None):
+        self.protocol = protocol
+
+    def resolve(self, name):
+        if self.protocol == 'slow':
+            time.sleep(0.1)
+            fetch_json.check_deadline()
+        roots = self.ROOTS[self.protocol]
+        if roots is None:
+            raise ValueError('broken')
+        for root in roots:
+            yield dict(root)
+
+
+class _AsyncRefEngine(_RefEngine):
+    async def resolve_async(self, name):
+        for root in self.resolve(name=name):
+            yield root
+
+
+class TestResolve(unittest.TestCase):
+    def test(self):
+        cas_engine = {'config': {'protocol': 'c'}, 'uri': 'https://example.com'}
+        engines = [
+            _DiscoveryEngine(references=[
+                RefEngineReference(config={'protocol': 'a'}),
+                RefEngineReference(config={'protocol': 'broken'}),
+            ]),
+            _DiscoveryEngine(references=[
+                RefEngineReference(config={'protocol': 'b'}),
+                RefEngineReference(
+                    config={'protocol': 'a'}, cas_engines=[cas_engine]),
+            ]),
+        ]
+        expected = [
+            {'digest': '1'},
+            {'digest': '2'},
+            {'digest': '3'},
+            {'digest': '1', 'casEngines': [cas_engine]},
+            {'digest': '2', 'casEngines': [cas_engine]},
+        ]
+
+        async def collect(engines, name):
+            return [root async for root in resolve_async(
+                engines=engines, name=name)]
+
+        for label, constructor in [
+                    ('sync ref engines', _RefEngine),
+                    ('async ref engines', _AsyncRefEngine),
+                ]:
+            with unittest.mock.patch(
+                    target='oci_discovery.ref_engine_discovery._ref_engine.new',
+                    new=constructor):
+                for mode, max_workers in [('sync', 1), ('parallel', 3)]:
+                    with self.subTest(label=label, mode=mode):
+                        with self.assertLogs(level='WARNING'):
+                            roots = list(resolve(
+                                engines=engines, name='example.com/a',
+                                max_workers=max_workers))
+                        self.assertEqual(roots, expected)
+                with self.subTest(label=label, mode='async'):
+                    with self.assertLogs(level='WARNING'):
+                        roots = asyncio.run(collect(
+                            engines=engines, name='example.com/a'))
+                    self.assertEqual(roots, expected)
+
+    def test_timeout(self):
+        engines = [
+            _DiscoveryEngine(references=[
+                RefEngineReference(config={'protocol': 'a'}),
+                RefEngineReference(config={'protocol': 'slow'}),
+                RefEngineReference(config={'protocol': 'b'}),
+            ]),
+        ]
+
+        def new(protocol, base=None):
+            constructed.append(protocol)
+            return constructor(protocol=protocol, base=base)
+
+        async def collect(engines, name, timeout):
+            return [root async for root in resolve_async(
+                engines=engines, name=name, timeout=timeout)]
+
+        for label, constructor in [
+                    ('sync ref engines', _RefEngine),
+                    ('async ref engines', _AsyncRefEngine),
+                ]:
+            for mode in ['sync', 'parallel', 'async']:
+                for timeout, expected in [
+                            (
+                                None,
+                                [{'digest': '1'}, {'digest': '2'}, {'digest': '3'}],
+                            ),
+                            (0.05, [{'digest': '1'}, {'digest': '2'}]),
+                        ]:
+                    with self.subTest(
+                            label=label, mode=mode, timeout=timeout):
+                        constructed = []
+                        if mode in ['sync', 'parallel']:
+                            run = lambda: list(resolve(
+                                engines=engines, name='example.com/a',
+                                timeout=timeout,
+                                max_workers=3 if mode == 'parallel' else 1))
+                        else:
+                            run = lambda: asyncio.run(collect(
+                                engines=engines, name='example.com/a',
+                                timeout=timeout))
+                        with unittest.mock.patch(
+                                target='oci_discovery.ref_engine_discovery._ref_engine.new',
+                                new=new):
+                            if timeout is None:
+                                roots = run()
+                            else:
+                                with self.assertLogs(level='WARNING') as logs:
+                                    roots = run()
+                                self.assertRegex(
+                                    logs.output[0], 'gave up on example.com/a')
+                        self.assertEqual(roots, expected)
+                        if timeout is None or mode == 'parallel':
+                            # parallel mode starts every ref engine at once
+                            self.assertEqual(constructed, ['a', 'slow', 'b'])
+                        else:
+                            self.assertEqual(constructed, ['a', 'slow'])
+
+    def test_timeout_excludes_caller(self):
+        engines = [
+            _DiscoveryEngine(references=[
+                RefEngineReference(config={'protocol': 'a'}),
+                RefEngineReference(config={'protocol': 'b'}),
+            ]),
+        ]
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery._ref_engine.new',
+                new=_RefEngine):
+            roots = []
+            for root in resolve(
+                    engines=engines, name='example.com/a', timeout=0.05):
+                self.assertIsNone(fetch_json.remaining())
+                time.sleep(0.1)  # does not count against the timeout
+                roots.append(root)
+        self.assertEqual(
+            roots, [{'digest': '1'}, {'digest': '2'}, {'digest': '3'}])
+
+    def test_parallel(self):
+        barrier = threading.Barrier(parties=3, timeout=5)
+
+        class RefEngine(_RefEngine):
+            def resolve(self, name):
+                # only returns once all three are resolving at once
+                barrier.wait()
+                return super(RefEngine, self).resolve(name=name)
+
+        engines = [
+            _DiscoveryEngine(references=[
+                RefEngineReference(config={'protocol': 'b'}),
+                RefEngineReference(config={'protocol': 'slow'}),
+                RefEngineReference(config={'protocol': 'a'}),
+            ]),
+        ]
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery._ref_engine.new',
+                new=RefEngine):
+            roots = list(resolve(
+                engines=engines, name='example.com/a', max_workers=3))
+        self.assertEqual(
+            roots, [{'digest': '2'}, {'digest': '3'}, {'digest': '1'}])
+
+    def test_limit(self):
+        engines = [
+            _DiscoveryEngine(references=[
+                RefEngineReference(config={'protocol': 'a'}),
+                RefEngineReference(config={'protocol': 'broken'}),
+                RefEngineReference(config={'protocol': 'b'}),
+                RefEngineReference(config={'protocol': 'slow'}),
+            ]),
+        ]
+
+        def new(protocol, base=None):
+            constructed.append(protocol)
+            return _RefEngine(protocol=protocol, base=base)
+
+        for max_workers, limit, expected, expected_constructed in [
+                    (1, 0, [], []),
+                    (1, 2, ['1', '2'], ['a']),
+                    (1, 3, ['1', '2', '3'], ['a', 'broken', 'b']),
+                    (1, 5, ['1', '2', '3'], ['a', 'broken', 'b', 'slow']),
+                    (2, 2, ['1', '2'], ['a', 'broken']),
+                    # only one root is left to find after 'a'
+                    (2, 3, ['1', '2', '3'], ['a', 'broken', 'b']),
+                ]:
+            with self.subTest(max_workers=max_workers, limit=limit):
+                constructed = []
+                with unittest.mock.patch(
+                        target='oci_discovery.ref_engine_discovery._ref_engine.new',
+                        new=new), unittest.mock.patch(
+                        target='oci_discovery.ref_engine_discovery._LOGGER'):
+                    roots = list(resolve(
+                        engines=engines, name='example.com/a',
+                        max_workers=max_workers, limit=limit))
+                self.assertEqual([root['digest'] for root in roots], expected)
+                self.assertEqual(constructed, expected_constructed)
+
+    def test_limit_cancels(self):
+        started = threading.Event()
+        cancelled = threading.Event()
+        daemon = []
+
+        class RefEngine(_RefEngine):
+            def resolve(self, name):
+                if self.protocol == 'a':
+                    started.wait(timeout=5)
+                    return super(RefEngine, self).resolve(name=name)
+                daemon.append(threading.current_thread().daemon)
+                started.set()
+                while fetch_json.remaining() > 0:
+                    time.sleep(0.01)
+                cancelled.set()
+                fetch_json.check_deadline()
+
+        engines = [
+            _DiscoveryEngine(references=[
+                RefEngineReference(config={'protocol': 'a'}),
+                RefEngineReference(config={'protocol': 'slow'}),
+            ]),
+        ]
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery._ref_engine.new',
+                new=RefEngine):
+            roots = list(resolve(
+                engines=engines, name='example.com/a', max_workers=2,
+                limit=2))
+        self.assertEqual(roots, [{'digest': '1'}, {'digest': '2'}])
+        self.assertTrue(cancelled.wait(timeout=5))
+        self.assertEqual(daemon, [True])
+
+
+class TestResolveMany(unittest.TestCase):
+    def test(self):
+        requests = []
+        headers = email.message.Message()
+
+        def fetch(uri, media_type, headers=None):
+            requests.append(uri)
+            if uri.startswith('https://example.com/.well-known/'):
+                return {
+                    'uri': uri,
+                    'json': {
+                        'refEngines': [
+                            {
+                                'protocol': 'oci-index-template-v1',
+                                'uri': '/index/{path}',
+                            },
+                        ],
+                    },
+                }, headers
+            if uri.startswith('https://example.com/index/'):
+                return {
+                    'uri': uri,
+                    'json': {
+                        'manifests': [
+                            {
+                                'digest': uri[-1] + tag,
+                                'annotations': {
+                                    'org.opencontainers.image.ref.name': tag,
+                                },
+                            }
+                            for tag in ['1', '2']
+                        ],
+                    },
+                }, headers
+            raise ValueError('unexpected URI {}'.format(uri))
+
+        names = [
+            'example.com/a#1',
+            'example.com/a#2',
+            'example.com/b#1',
+            'example.com/a#1',
+        ]
+        engine = well_known_uri.Engine(protocols=['https'])
+        with unittest.mock.patch(
+                target='oci_discovery.fetch_json._fetch', new=fetch):
+            resolved = []
+            for name, root in resolve_many(engines=[engine], names=names):
+                # the batch does not leak into the caller's context
+                self.assertIsNone(fetch_json._BATCH.get())
+                resolved.append((name, root['root']['digest']))
+        self.assertEqual(
+            resolved,
+            [
+                ('example.com/a#1', 'a1'),
+                ('example.com/a#2', 'a2'),
+                ('example.com/b#1', 'b1'),
+            ])
+        self.assertEqual(
+            requests,
+            [
+                'https://example.com/.well-known/oci-host-ref-engines',
+                'https://example.com/index/a',
+                'https://example.com/index/b',
+            ])
+
+
+class TestRoots(unittest.TestCase):
+    def test_matches_serialization(self):
+        cas_a = [{'config': {'protocol': 'a'}}]
+        cas_b = [{'config': {'protocol': 'b'}}]
+
+        def root(digest='sha256:1', **kwargs):
+            descriptor = {'digest': digest, 'mediaType': 'm'}
+            descriptor.update(kwargs)
+            return {'mediaType': 'd', 'root': descriptor, 'uri': 'u'}
+
+        own = root()
+        own['casEngines'] = cas_b
+        candidates = [
+            (root(), []),
+            (root(), []),
+            (root(), cas_a),
+            (root(), cas_a),
+            (root(size=1), cas_a),
+            (root(digest='sha256:2'), cas_a),
+            (own, []),
+            (dict(own), []),
+            (own, cas_a),
+            (root(), cas_b),
+            (['not', 'a', 'dict'], []),
+            (['not', 'a', 'dict'], []),
+            ({'root': 'not a dict'}, []),
+            ({'root': {'digest': ['unhashable']}}, []),
+            ({'root': {'digest': ['unhashable']}}, []),
+        ]
+        expected = []
+        hashes = set()
+        for candidate, cas_engines in candidates:
+            candidate = json.loads(json.dumps(candidate))
+            if isinstance(candidate, dict):
+                _add_cas_engines(
+                    root=candidate, cas_engines=cas_engines,
+                    cas_engines_key=None)
+            root_hash = hash(json.dumps(candidate, sort_keys=True))
+            expected.append(root_hash not in hashes)
+            hashes.add(root_hash)
+        roots = _Roots()
+        added = []
+        for candidate, cas_engines in candidates:
+            candidate = json.loads(json.dumps(candidate))
+            key = None
+            if isinstance(candidate, dict):
+                key = _add_cas_engines(
+                    root=candidate, cas_engines=cas_engines,
+                    cas_engines_key=_canonical(cas_engines))
+            added.append(roots.add(root=candidate, cas_engines_key=key))
+        self.assertEqual(added, expected)
+
+    def test_caller_modifies_root(self):
+        def root(name):
+            return {
+                'root': {
+                    'digest': 'sha256:1',
+                    'annotations': {'org.opencontainers.image.ref.name': name},
+                },
+            }
+
+        roots = _Roots()
+        first = root(name='1.0')
+        self.assertTrue(roots.add(root=first))
+        # yielded roots belong to the caller
+        first['root']['annotations']['org.opencontainers.image.ref.name'] = '2.0'
+        self.assertFalse(roots.add(root=root(name='1.0')))
+        self.assertTrue(roots.add(root=root(name='2.0')))
@@ -0,0 +1,182 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from . import RefEngineReference
+from . import daemon
+
+
+class _Engine(object):
+    def ref_engines(self, name):
+        yield RefEngineReference(config={'protocol': 'dummy', 'name': name})
+
+
+class _RefEngine(object):
+    def __init__(self, name, base=None):
+        self.name = name
+
+    def resolve(self, name):
+        if name == 'bad':
+            raise ValueError('bad name')
+        yield {'root': {'name': name}}
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'run', 'resolver.sock')
+        self.requests = []
+        patch = unittest.mock.patch.dict(
+            'oci_discovery.ref_engine.CONSTRUCTORS', {'dummy': _RefEngine})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _engines(self, **kwargs):
+        self.requests.append(kwargs)
+        return [_Engine()]
+
+    def _serve(self):
+        server = daemon.Server(path=self.path, engines=self._engines)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+        self.addCleanup(stop)
+        return server
+
+    def test_resolve_many(self):
+        self._serve()
+        self.assertEqual(
+            os.stat(os.path.dirname(self.path)).st_mode & 0o777, 0o700)
+        results = daemon.resolve_many(
+            names=['a', 'b', 'a'], protocols=['https'], port=8080,
+            discovery_workers=2, hedge_delay=0.1, ref_engine_workers=2,
+            limit=1, path=self.path)
+        self.assertEqual(list(results), [
+            ('a', {'root': {'name': 'a'}}),
+            ('b', {'root': {'name': 'b'}}),
+        ])
+        self.assertEqual(self.requests, [
+            {
+                'protocols': ('https',),
+                'port': 8080,
+                'discovery_workers': 2,
+                'hedge_delay': 0.1,
+            },
+        ])
+
+    def test_engines(self):
+        server = daemon.Server(path=self.path)
+        self.addCleanup(server.server_close)
+        engines = [
+            server.engines(
+                protocols=('https',), port=port, discovery_workers=1,
+                hedge_delay=None)
+            for port in range(8000, 8010)
+        ]
+        self.assertEqual(
+            [well_known.port for _, well_known in engines], list(range(8000, 8010)))
+        self.assertEqual(len({id(xdg) for xdg, _ in engines}), 1)
+        self.assertEqual(
+            len({id(well_known.negative_cache) for _, well_known in engines}), 1)
+
+    def test_failing_ref_engine(self):
+        self._serve()
+        with self.assertLogs(
+                'oci_discovery.ref_engine_discovery', level='WARNING') as logs:
+            results = list(daemon.resolve_many(
+                names=['bad', 'a'], path=self.path))
+        self.assertEqual(results, [('a', {'root': {'name': 'a'}})])
+        self.assertIn('bad name', logs.output[0])
+
+    def test_invalid_request(self):
+        self._serve()
+        for label, request in [
+                    ('not json', b'names\n'),
+                    ('not an object', b'[]\n'),
+                    ('no names', b'{}\n'),
+                    ('bad protocol', b'{"names": [], "protocols": ["ftp"]}\n'),
+                    ('bad port', b'{"names": [], "port": "80"}\n'),
+                    ('boolean port', b'{"names": [], "port": true}\n'),
+                    ('zero port', b'{"names": [], "port": 0}\n'),
+                    ('large port', b'{"names": [], "port": 65536}\n'),
+                    ('bad workers', b'{"names": [], "discovery_workers": 0}\n'),
+                    ('boolean workers', b'{"names": [], "discovery_workers": true}\n'),
+                    ('bad timeout', b'{"names": [], "timeout": 0}\n'),
+                    ('bad ref-engine workers', b'{"names": [], "ref_engine_workers": 0}\n'),
+                    ('bad limit', b'{"names": [], "limit": 0}\n'),
+                    ('bad hedge delay', b'{"names": [], "hedge_delay": true}\n'),
+                ]:
+            with self.subTest(label=label):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.path)
+                sock.sendall(request)
+                self.assertRaisesRegex(
+                    RuntimeError, 'invalid request', list,
+                    daemon._responses(sock=sock, path=self.path))
+
+    def test_error(self):
+        def engines(**kwargs):
+            raise ValueError('no engines')
+
+        server = self._serve()
+        server.engines = engines
+        with self.assertLogs(
+                'oci_discovery.ref_engine_discovery', level='WARNING'):
+            self.assertRaisesRegex(
+                RuntimeError, 'no engines', list,
+                daemon.resolve_many(names=['a'], path=self.path))
+
+    def test_not_running(self):
+        self.assertRaises(
+            FileNotFoundError,
+            daemon.resolve_many, names=['a'], path=self.path)
+
+    def test_stale_socket(self):
+        os.makedirs(os.path.dirname(self.path))
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(self.path)
+        self.assertRaises(
+            ConnectionRefusedError,
+            daemon.resolve_many, names=['a'], path=self.path)
+        self._serve()
+        self.assertEqual(
+            list(daemon.resolve_many(names=['a'], path=self.path)),
+            [('a', {'root': {'name': 'a'}})])
+
+    def test_already_running(self):
+        self._serve()
+        with self.assertRaisesRegex(OSError, 'already listening'):
+            daemon.Server(path=self.path, engines=self._engines)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_socket_path(self):
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery.xdg._os.environ',
+                new={'XDG_RUNTIME_DIR': os.path.join(os.sep, 'run', 'user')}):
+            self.assertEqual(
+                daemon.socket_path(),
+                os.path.join(
+                    os.sep, 'run', 'user', 'oci-discovery', 'resolver.sock'))
@@ -0,0 +1,128 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import email.message
+import socket
+import ssl
+import unittest
+import unittest.mock
+import urllib.error
+
+from . import negative_cache
+
+
+def _http_error(code, headers=None):
+    message = email.message.Message()
+    for key, value in (headers or {}).items():
+        message[key] = value
+    return urllib.error.HTTPError(
+        url='https://example.com', code=code, msg='error', hdrs=message,
+        fp=None)
+
+
+class TestClassify(unittest.TestCase):
+    def test(self):
+        for label, error, expected in [
+                    ('404', _http_error(code=404), 'not-found'),
+                    ('410', _http_error(code=410), 'not-found'),
+                    ('403', _http_error(code=403), 'client-error'),
+                    ('429', _http_error(code=429), 'server-error'),
+                    ('503', _http_error(code=503), 'server-error'),
+                    ('read timeout', socket.timeout('timed out'), 'timeout'),
+                    (
+                        'connect timeout',
+                        urllib.error.URLError(socket.timeout('timed out')),
+                        'timeout',
+                    ),
+                    (
+                        'wrapped SSL error',
+                        urllib.error.URLError(ssl.SSLError('bad')),
+                        'tls',
+                    ),
+                    ('SSL error', ssl.SSLError('bad'), 'tls'),
+                    (
+                        'refused',
+                        urllib.error.URLError(ConnectionRefusedError()),
+                        'connection',
+                    ),
+                    ('DNS', urllib.error.URLError('unknown host'), 'connection'),
+                    ('invalid', ValueError('invalid JSON'), 'invalid'),
+                ]:
+            with self.subTest(label=label):
+                self.assertEqual(negative_cache.classify(error=error), expected)
+
+
+class TestNegativeCache(unittest.TestCase):
+    def _add(self, cache, error, now=0):
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery.negative_cache._time.monotonic',
+                return_value=now):
+            return cache.add(protocol='https', host='example.com', error=error)
+
+    def _get(self, cache, now):
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery.negative_cache._time.monotonic',
+                return_value=now):
+            return cache.get(protocol='https', host='example.com')
+
+    def test_ttl(self):
+        for label, error, ttl in [
+                    ('not found', _http_error(code=404), 300),
+                    ('timeout', socket.timeout('timed out'), 5),
+                    ('server error', _http_error(code=500), 10),
+                    (
+                        'Retry-After seconds',
+                        _http_error(code=503, headers={'Retry-After': '120'}),
+                        120,
+                    ),
+                    (
+                        'Retry-After too long',
+                        _http_error(code=503, headers={'Retry-After': '86400'}),
+                        negative_cache.MAX_RETRY_AFTER,
+                    ),
+                    (
+                        'invalid Retry-After',
+                        _http_error(code=503, headers={'Retry-After': 'soon'}),
+                        10,
+                    ),
+                ]:
+            with self.subTest(label=label):
+                cache = negative_cache.NegativeCache()
+                self.assertEqual(self._add(cache=cache, error=error), ttl)
+                self.assertRegex(
+                    self._get(cache=cache, now=ttl - 1), '^[a-z-]+: ')
+                self.assertIsNone(self._get(cache=cache, now=ttl))
+                self.assertEqual(len(cache), 0)
+
+    def test_other_hosts(self):
+        cache = negative_cache.NegativeCache()
+        self._add(cache=cache, error=_http_error(code=404))
+        self.assertIsNone(cache.get(protocol='http', host='example.com'))
+        self.assertIsNone(cache.get(protocol='https', host='a.example.com'))
+
+    def test_disabled_kind(self):
+        cache = negative_cache.NegativeCache(ttls={'timeout': 0})
+        self.assertEqual(
+            self._add(cache=cache, error=socket.timeout('timed out')), 0)
+        self.assertIsNone(self._get(cache=cache, now=0))
+
+    def test_max_entries(self):
+        cache = negative_cache.NegativeCache(max_entries=2)
+        for host in ['a', 'b', 'c']:
+            cache.add(protocol='https', host=host, error=_http_error(code=404))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(protocol='https', host='a'))
+        self.assertIsNotNone(cache.get(protocol='https', host='c'))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,76 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import unittest
+
+from . import regexp_set
+
+
+class TestLiteralPrefix(unittest.TestCase):
+    def test(self):
+        for pattern, expected in [
+                    (r'^a\.example\.com/app#.*$', 'a.example.com/app#'),
+                    (r'^example\.com/', 'example.com/'),
+                    (r'^example\.com', 'example.com'),
+                    (r'example\.com/', ''),
+                    (r'^[^/]*example\.com/.*$', ''),
+                    (r'^a\.example\.com|^b', ''),
+                    (r'^ab?c', 'a'),
+                    (r'^ab*c', 'a'),
+                    (r'^ab{0,2}c', 'a'),
+                    (r'^ab+c', 'ab'),
+                    (r'^a\.?b', 'a'),
+                    (r'^ab(c)', 'ab'),
+                    (r'^a\db', 'a'),
+                    (r'^a\bb', 'a'),
+                    (r'^a\\b', 'a\\b'),
+                    ('^a\\', 'a'),
+                ]:
+            with self.subTest(pattern=pattern):
+                self.assertEqual(
+                    regexp_set.literal_prefix(pattern=pattern), expected)
+
+
+class TestRegexpSet(unittest.TestCase):
+    def test_search(self):
+        patterns = [
+            r'^a\.example\.com/app#.*$',
+            r'^[^/]*example\.com/.*$',
+            r'^a\.example\.com/',
+            r'^a\.example\.com/apps?',
+            r'^b\.example\.com/',
+            r'example\.com/app',
+            r'^a',
+            r'^a\.example\.org/',
+        ]
+        keys = sorted(patterns, key=lambda key: (-len(key), key))
+        regexps = [(key, re.compile(key)) for key in keys]
+        regexps_set = regexp_set.RegexpSet(regexps=regexps)
+        self.assertEqual([key for key, _ in regexps_set], keys)
+        self.assertEqual(len(regexps_set), len(keys))
+        for name in [
+                    'a.example.com/app#1.0',
+                    'a.example.com/ap',
+                    'a.example.com/other',
+                    'b.example.com/app',
+                    'c.example.com/app',
+                    'a.example.org/app',
+                    'a',
+                    '',
+                ]:
+            with self.subTest(name=name):
+                self.assertEqual(
+                    list(regexps_set.search(name=name)),
+                    [key for key, regexp in regexps if regexp.search(name)])
@@ -12,11 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import logging
 import os
+import threading
+import time
 import unittest
 import unittest.mock
+import urllib.error
 
+from .. import fetch_json
 from . import well_known_uri
 
 
@@ -156,3 +161,233 @@ class TestResolve(unittest.TestCase):
                         resolved = list(engine.ref_engines(name=name))
                     self.assertEqual(resolved, [])
                     self.assertRegex(logs.output[0], regex)
+
+    def test_order(self):
+        delays = {
+            'https://a.b.example.com': 0.3,
+            'https://b.example.com': 0.2,
+            'https://example.com': 0.1,
+        }
+        failures = {'https://a.b.example.com', 'http://example.com'}
+
+        def origin(uri):
+            return uri[:-len('/.well-known/oci-host-ref-engines')]
+
+        def response(uri):
+            if origin(uri) in failures:
+                raise urllib.error.URLError('refused')
+            return {
+                'uri': uri,
+                'json': {'refEngines': [{'protocol': origin(uri)}]},
+            }
+
+        def fetch(uri, media_type):
+            time.sleep(delays.get(origin(uri), 0))
+            return response(uri=uri)
+
+        async def fetch_async(uri, media_type):
+            await asyncio.sleep(delays.get(origin(uri), 0))
+            return response(uri=uri)
+
+        async def ref_engines_async(engine, name):
+            return [ref async for ref in engine.ref_engines_async(name=name)]
+
+        for max_workers in [1, 8]:
+            for mode in ['sync', 'async']:
+                with self.subTest(max_workers=max_workers, mode=mode):
+                    engine = well_known_uri.Engine(max_workers=max_workers)
+                    with unittest.mock.patch(
+                            target='oci_discovery.ref_engine_discovery.well_known_uri._fetch_json.fetch',
+                            new=fetch):
+                        with unittest.mock.patch(
+                                target='oci_discovery.ref_engine_discovery.well_known_uri._fetch_json.fetch_async',
+                                new=fetch_async):
+                            with self.assertLogs(well_known_uri._LOGGER, level=logging.WARNING):
+                                if mode == 'sync':
+                                    refs = list(engine.ref_engines(
+                                        name='a.b.example.com/app'))
+                                else:
+                                    refs = asyncio.run(ref_engines_async(
+                                        engine=engine,
+                                        name='a.b.example.com/app'))
+                    self.assertEqual(
+                        [ref.config['protocol'] for ref in refs],
+                        [
+                            'https://b.example.com',
+                            'https://example.com',
+                            'http://a.b.example.com',
+                        ])
+
+    def test_close(self):
+        cancelled = threading.Event()
+
+        def fetch(uri, media_type):
+            if uri.startswith('https://example.com/'):
+                for _ in range(500):
+                    if fetch_json.remaining() == 0:
+                        cancelled.set()
+                        fetch_json.check_deadline()
+                    time.sleep(0.01)
+            return {'uri': uri, 'json': {'refEngines': [{'protocol': uri}]}}
+
+        engine = well_known_uri.Engine(max_workers=8, negative_cache=False)
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery.well_known_uri._fetch_json.fetch',
+                new=fetch):
+            refs = engine.ref_engines(name='a.example.com/app')
+            self.assertEqual(
+                next(refs).config['protocol'],
+                'https://a.example.com/.well-known/oci-host-ref-engines')
+            refs.close()
+            self.assertTrue(cancelled.wait(timeout=5))
+
+    def test_hedged_cancels_loser(self):
+        cancelled = threading.Event()
+
+        def fetch(uri, media_type):
+            if uri.startswith('https://'):
+                for _ in range(500):
+                    if fetch_json.remaining() == 0:
+                        cancelled.set()
+                        fetch_json.check_deadline()
+                    time.sleep(0.01)
+            return {'uri': uri, 'json': {'refEngines': [{'protocol': uri}]}}
+
+        engine = well_known_uri.Engine(hedge_delay=0.05, negative_cache=False)
+        with unittest.mock.patch(
+                target='oci_discovery.ref_engine_discovery.well_known_uri._fetch_json.fetch',
+                new=fetch):
+            refs = list(engine.ref_engines(name='example.com/app'))
+            self.assertTrue(cancelled.wait(timeout=5))
+        self.assertEqual(
+            [ref.config['protocol'] for ref in refs],
+            ['http://example.com/.well-known/oci-host-ref-engines'])
+
+    def test_negative_cache(self):
+        fetched = []
+
+        def fetch(uri, media_type):
+            fetched.append(uri)
+            if uri.startswith('https://example.com/'):
+                return {'uri': uri, 'json': {'refEngines': [{'protocol': 'a'}]}}
+            raise urllib.error.URLError('refused')
+
+        for negative_cache, expected in [
+                    (
+                        None,
+                        [
+                            'https://a.example.com/.well-known/oci-host-ref-engines',
+                            'https://example.com/.well-known/oci-host-ref-engines',
+                            'https://example.com/.well-known/oci-host-ref-engines',
+                        ],
+                    ),
+                    (
+                        False,
+                        [
+                            'https://a.example.com/.well-known/oci-host-ref-engines',
+                            'https://example.com/.well-known/oci-host-ref-engines',
+                            'https://a.example.com/.well-known/oci-host-ref-engines',
+                            'https://example.com/.well-known/oci-host-ref-engines',
+                        ],
+                    ),
+                ]:
+            with self.subTest(negative_cache=negative_cache):
+                fetched.clear()
+                engine = well_known_uri.Engine(
+                    protocols=('https',), negative_cache=negative_cache)
+                with unittest.mock.patch(
+                        target='oci_discovery.ref_engine_discovery.well_known_uri._fetch_json.fetch',
+                        new=fetch):
+                    for _ in range(2):
+                        with self.assertLogs(well_known_uri._LOGGER, level=logging.DEBUG):
+                            refs = list(engine.ref_engines(
+                                name='a.example.com/app'))
+                        self.assertEqual(
+                            [ref.config['protocol'] for ref in refs], ['a'])
+                self.assertEqual(fetched, expected)
+
+    def test_hedged(self):
+        # https://a.example.com hangs before failing, while
+        # https://example.com answers quickly.
+        delays = {
+            'https://a.example.com': 0.2,
+            'http://a.example.com': 0,
+            'https://example.com': 0,
+            'http://example.com': 0,
+        }
+        failures = {'https://a.example.com'}
+
+        def origin(uri):
+            return uri[:-len('/.well-known/oci-host-ref-engines')]
+
+        def response(uri):
+            fetched.append(origin(uri))
+            if origin(uri) in failures:
+                raise urllib.error.URLError('refused')
+            return {
+                'uri': uri,
+                'json': {'refEngines': [{'protocol': origin(uri)}]},
+            }
+
+        def fetch(uri, media_type):
+            time.sleep(delays[origin(uri)])
+            return response(uri=uri)
+
+        async def fetch_async(uri, media_type):
+            await asyncio.sleep(delays[origin(uri)])
+            return response(uri=uri)
+
+        async def ref_engines_async(engine, name):
+            return [ref async for ref in engine.ref_engines_async(name=name)]
+
+        for hedge_delay, expected, expected_fetched in [
+                    (
+                        None,
+                        ['https://example.com', 'http://a.example.com'],
+                        [
+                            'https://a.example.com',
+                            'https://example.com',
+                            'http://a.example.com',
+                        ],
+                    ),
+                    (
+                        0.05,
+                        ['http://a.example.com', 'https://example.com'],
+                        # the losing https://a.example.com probe may
+                        # finish later, or be cancelled
+                        ['http://a.example.com', 'https://example.com'],
+                    ),
+                ]:
+            for max_workers in [1, 8]:
+                for mode in ['sync', 'async']:
+                    with self.subTest(
+                            hedge_delay=hedge_delay, max_workers=max_workers,
+                            mode=mode):
+                        fetched = []
+                        engine = well_known_uri.Engine(
+                            max_workers=max_workers, hedge_delay=hedge_delay,
+                            negative_cache=False)
+                        with unittest.mock.patch(
+                                target='oci_discovery.ref_engine_discovery.well_known_uri._fetch_json.fetch',
+                                new=fetch):
+                            with unittest.mock.patch(
+                                    target='oci_discovery.ref_engine_discovery.well_known_uri._fetch_json.fetch_async',
+                                    new=fetch_async):
+                                with self.assertLogs(well_known_uri._LOGGER, level=logging.DEBUG):
+                                    if mode == 'sync':
+                                        refs = list(engine.ref_engines(
+                                            name='a.example.com/app'))
+                                    else:
+                                        refs = asyncio.run(ref_engines_async(
+                                            engine=engine,
+                                            name='a.example.com/app'))
+                                    if hedge_delay is not None:
+                                        # let abandoned probes finish
+                                        time.sleep(0.25)
+                        self.assertEqual(
+                            [ref.config['protocol'] for ref in refs],
+                            expected)
+                        if max_workers == 1:
+                            self.assertEqual(
+                                fetched[:len(expected_fetched)],
+                                expected_fetched)
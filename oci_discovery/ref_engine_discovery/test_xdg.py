@@ -13,9 +13,12 @@
 # limitations under the License.
 
 import io
+import json
 import logging
 import os
 import pathlib
+import tempfile
+import threading
 import unittest
 import unittest.mock
 
@@ -88,6 +91,26 @@ class TestConfigPaths(unittest.TestCase):
                 self.assertEqual(paths, expected)
 
 
+class TestCachePath(unittest.TestCase):
+    def test(self):
+        home = os.path.expanduser('~')
+        path = os.path.join('a', 'b')
+        for environ, expected in [
+                    ({}, os.path.join(home, '.cache', path)),
+                    (
+                        {
+                            'XDG_CACHE_HOME': os.path.join(xdg.ROOT, 'c', 'd'),
+                        },
+                        os.path.join(xdg.ROOT, 'c', 'd', path),
+                    ),
+                ]:
+            with self.subTest(environ=environ):
+                with unittest.mock.patch(
+                        target='oci_discovery.ref_engine_discovery.xdg._os.environ',
+                        new=environ):
+                    self.assertEqual(xdg.cache_path(path=path), expected)
+
+
 class TestEngine(unittest.TestCase):
     @staticmethod
     def _mock_open(path):
@@ -277,3 +300,98 @@ class TestEngine(unittest.TestCase):
         self.assertRegex(
             logs.output[0],
             '^WARNING:oci_discovery\.ref_engine_discovery\.xdg:file:///non-dict-value claimed to return application/vnd\.oci\.ref-engines\.v1\+json but actually returned non-dict$')
+
+
+class TestReload(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.home, self.system = [
+            os.path.join(self.directory.name, name, 'oci-discovery')
+            for name in ['home', 'system']
+        ]
+        for path in [self.home, self.system]:
+            os.makedirs(path)
+        self.environ = unittest.mock.patch.dict(os.environ, {
+            'XDG_CONFIG_HOME': os.path.dirname(self.home),
+            'XDG_CONFIG_DIRS': os.path.dirname(self.system),
+        })
+        self.environ.start()
+        self.mtime = 1000000000
+
+    def tearDown(self):
+        self.environ.stop()
+        self.directory.cleanup()
+
+    def _write(self, directory, config):
+        path = os.path.join(directory, 'ref-engine-discovery.json')
+        with open(path, 'w') as f:
+            json.dump(config, f)
+        self.mtime += 1  # file systems may have coarse timestamps
+        os.utime(path, (self.mtime, self.mtime))
+
+    def _keys(self, engine):
+        return {
+            key: config['ref_engines_object']
+            for key, config in engine._config.items()
+        }
+
+    def test_reload(self):
+        self._write(directory=self.home, config={'^a': 'home'})
+        self._write(directory=self.system, config={'^a': 'system', '^b': 'system'})
+        engine = xdg.Engine()
+        self.assertEqual(self._keys(engine), {'^a': 'home', '^b': 'system'})
+        regexp_b = engine._compiled['^b']
+        self.assertFalse(engine.reload())
+
+        reads = []
+        read = engine._read
+
+        def record(path):
+            reads.append(path)
+            return read(path=path)
+
+        engine._read = record
+        self._write(directory=self.home, config={'^a': 'home', '^c': 'home'})
+        state = engine._state
+        self.assertTrue(engine.reload())
+        self.assertEqual(reads, [os.path.join(self.home, 'ref-engine-discovery.json')])
+        self.assertEqual(
+            self._keys(engine), {'^a': 'home', '^b': 'system', '^c': 'home'})
+        self.assertIs(engine._compiled['^b'], regexp_b)
+        self.assertEqual(set(state.config), {'^a', '^b'})  # old snapshot intact
+
+        os.unlink(os.path.join(self.home, 'ref-engine-discovery.json'))
+        self.assertTrue(engine.reload())
+        self.assertEqual(self._keys(engine), {'^a': 'system', '^b': 'system'})
+
+    def test_reload_interval(self):
+        self._write(directory=self.home, config={'^a': 'home'})
+        for interval, expected in [(None, ['^a']), (0, ['^b'])]:
+            with self.subTest(interval=interval):
+                engine = xdg.Engine(reload_interval=interval)
+                self._write(directory=self.home, config={'^b': {'refEngines': []}})
+                release = threading.Event()
+                update = engine._update
+
+                def blocked_update():
+                    release.wait(timeout=5)
+                    return update()
+
+                engine._update = blocked_update
+                references = list(engine.ref_engines(name='b.example.com/a'))
+                self.assertEqual(references, [])
+                # the lookup did not wait for the reload
+                self.assertEqual(list(engine._config), ['^a'])
+                release.set()
+                if engine._reloader is not None:
+                    engine._reloader.join()
+                self.assertEqual(list(engine._config), expected)
+                self._write(directory=self.home, config={'^a': 'home'})
+
+    def test_concurrent_reload(self):
+        self._write(directory=self.home, config={'^a': 'home'})
+        engine = xdg.Engine()
+        self._write(directory=self.home, config={'^b': 'home'})
+        with engine._lock:  # another thread is reloading
+            self.assertFalse(engine.reload())
+        self.assertTrue(engine.reload())
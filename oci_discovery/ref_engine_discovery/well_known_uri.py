@@ -12,66 +12,339 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio as _asyncio
+import collections as _collections
+import concurrent.futures as _futures
+import functools as _functools
 import logging as _logging
 import pprint as _pprint
+import socket as _socket
 import ssl as _ssl
+import threading as _threading
+import time as _time
 import urllib.error as _urllib_error
 
 from .. import fetch_json as _fetch_json
 from .. import host_based_image_names as _host_based_image_names
 from . import ancestor_hosts as _ancestor_hosts
+from . import negative_cache as _negative_cache
 from . import yield_from_ref_engines_object as _yield_from_ref_engines_object
 
 
 _LOGGER = _logging.getLogger(__name__)
 
+_MEDIA_TYPE = 'application/vnd.oci.ref-engines.v1+json'
+
+_FETCH_ERRORS = (
+    _ssl.CertificateError,
+    _ssl.SSLError,
+    _urllib_error.URLError,
+    _urllib_error.HTTPError,
+    _socket.timeout,
+)
+
 
 class Engine(object):
-    def __init__(self, protocols=('https', 'http'), port=None):
+    """Well-known URI ref-engine discovery.
+
+    Failed probes are remembered in negative_cache (a
+    negative_cache.NegativeCache, which defaults to a new one for
+    each engine), and skipped until their failure expires.  Set
+    negative_cache to False to probe every host every time.
+
+    By default, every host is probed with the first protocol before
+    any host is probed with the next one.  If hedge_delay is set,
+    hosts are instead handled one at a time (or max_workers at a
+    time), racing the protocols against each other: the next
+    protocol's probe starts once the earlier ones have failed or
+    hedge_delay seconds have passed without an answer, and the first
+    successful probe wins (the earlier protocol wins ties).  So a
+    host which only serves HTTP costs at most hedge_delay extra,
+    instead of a full HTTPS failure, but references are yielded in
+    host order instead of protocol order.
+    """
+    def __init__(self, protocols=('https', 'http'), port=None, max_workers=1,
+                 negative_cache=None, hedge_delay=None):
         self.protocols = protocols
         self.port = port
+        self.max_workers = max_workers
+        self.hedge_delay = hedge_delay
+        if negative_cache is None:
+            negative_cache = _negative_cache.NegativeCache()
+        elif negative_cache is False:
+            negative_cache = None
+        self.negative_cache = negative_cache
 
-    def ref_engines(self, name):
-        """Resolve an image name to a Merkle root.
-
-        Implementing well-known-uri-ref-engine-discovery.md
-        """
+    def _candidates(self, name):
+        """Yield (protocol, host) pairs in the order they are attempted."""
         name_parts = _host_based_image_names.parse(name=name)
-        hosts = set()
         for protocol in self.protocols:
             for host in _ancestor_hosts.ancestor_hosts(
-                    host=name_parts['host']):
+                    host=name_parts.host):
                 if self.port:
                     host = '{}:{}'.format(host, self.port)
+                yield (protocol, host)
+
+    def _uri(self, protocol, host):
+        uri = '{}://{}/.well-known/oci-host-ref-engines'.format(
+            protocol, host)
+        if self.negative_cache is not None:
+            reason = self.negative_cache.get(protocol=protocol, host=host)
+            if reason is not None:
+                _LOGGER.debug('skipping {} ({})'.format(uri, reason))
+                return None
+        _LOGGER.debug('discovering ref engines via {}'.format(uri))
+        return uri
+
+    def _failed(self, protocol, host, uri, error, message):
+        _LOGGER.warning('{} {} ({})'.format(message, uri, error))
+        if self.negative_cache is not None:
+            self.negative_cache.add(protocol=protocol, host=host, error=error)
+
+    def _fetch(self, protocol, host):
+        """Fetch a host's ref-engines object, returning None on failure."""
+        uri = self._uri(protocol=protocol, host=host)
+        if uri is None:
+            return None
+        try:
+            return _fetch_json.fetch(uri=uri, media_type=_MEDIA_TYPE)
+        except _FETCH_ERRORS as error:
+            self._failed(
+                protocol=protocol, host=host, uri=uri, error=error,
+                message='failed to fetch')
+        except ValueError as error:
+            self._failed(
+                protocol=protocol, host=host, uri=uri, error=error,
+                message='invalid response from')
+        return None
+
+    async def _fetch_async(self, protocol, host):
+        """The asyncio counterpart of _fetch()."""
+        uri = self._uri(protocol=protocol, host=host)
+        if uri is None:
+            return None
+        try:
+            return await _fetch_json.fetch_async(uri=uri, media_type=_MEDIA_TYPE)
+        except _FETCH_ERRORS as error:
+            self._failed(
+                protocol=protocol, host=host, uri=uri, error=error,
+                message='failed to fetch')
+        except ValueError as error:
+            self._failed(
+                protocol=protocol, host=host, uri=uri, error=error,
+                message='invalid response from')
+        return None
+
+    def ref_engines(self, name):
+        """Resolve an image name to a Merkle root.
+
+        Implementing well-known-uri-ref-engine-discovery.md
+
+        With max_workers greater than one, every candidate host is
+        probed in parallel, but results are still yielded in the
+        order required by the specification (or in host order, with
+        hedge_delay).  Probes still running when the caller stops are
+        cancelled: they give up at their next request or read.
+        """
+        candidates = list(self._candidates(name=name))
+        if self.hedge_delay is not None:
+            hosts = list(_collections.OrderedDict.fromkeys(
+                host for _, host in candidates))
+            calls = [
+                (host, _functools.partial(self._race, host))
+                for host in hosts
+            ]
+        else:
+            calls = [
+                (host, _functools.partial(self._fetch, protocol, host))
+                for protocol, host in candidates
+            ]
+        futures = []
+        cancelled = _threading.Event()
+        if self.max_workers > 1 and len(calls) > 1:
+            semaphore = _threading.Semaphore(self.max_workers)
+
+            def limited(call):
+                with semaphore:
+                    return call()
+
+            futures = [
+                _fetch_json.start(limited, cancelled=cancelled, call=call)
+                for _, call in calls
+            ]
+        try:
+            hosts = set()
+            for i, (host, call) in enumerate(calls):
                 if host in hosts:
                     continue  # already resolved via another protocol
-                uri = '{}://{}/.well-known/oci-host-ref-engines'.format(
-                    protocol, host)
-                media_type = 'application/vnd.oci.ref-engines.v1+json'
-                _LOGGER.debug('discovering ref engines via {}'.format(uri))
-                try:
-                    fetched = _fetch_json.fetch(uri=uri, media_type=media_type)
-                except (_ssl.CertificateError,
-                        _ssl.SSLError,
-                        _urllib_error.URLError,
-                        _urllib_error.HTTPError) as error:
-                    _LOGGER.warning(
-                        'failed to fetch {} ({})'.format(uri, error))
-                    continue
-                except ValueError as error:
-                    _LOGGER.warning(
-                        'invalid response from {} ({})'.format(uri, error))
+                if futures:
+                    fetched = futures[i].result()
+                else:
+                    fetched = call()
+                if fetched is None:
                     continue
-                ref_engines_object = fetched['json']
-                _LOGGER.debug(
-                    'received ref-engine discovery object:\n{}'.format(
-                        _pprint.pformat(ref_engines_object)))
                 hosts.add(host)
-                try:
-                    yield from _yield_from_ref_engines_object(
-                        ref_engines_object=ref_engines_object,
-                        uri=fetched['uri'],
-                    )
-                except ValueError as error:
-                    _LOGGER.warning(error)
+                yield from self._references(fetched=fetched)
+        finally:
+            cancelled.set()
+
+    def _race(self, host):
+        """Probe host with each protocol, hedged by hedge_delay.
+
+        Returns the first successful fetch, or None if they all fail.
+        The losers are cancelled, so they give up at their next request
+        or read.
+        """
+        cancelled = _threading.Event()
+        order = {}
+        pending = set()
+        try:
+            for i, protocol in enumerate(self.protocols):
+                future = _fetch_json.start(
+                    self._fetch, cancelled=cancelled, protocol=protocol,
+                    host=host)
+                order[future] = i
+                pending.add(future)
+                if i + 1 < len(self.protocols):
+                    timeout = self.hedge_delay
+                else:
+                    timeout = None
+                fetched = _first_success(
+                    pending=pending, order=order, timeout=timeout)
+                if fetched is not None:
+                    return fetched
+            return None
+        finally:
+            cancelled.set()
+
+    async def ref_engines_async(self, name):
+        """The asyncio counterpart of ref_engines().
+
+        With max_workers greater than one, up to max_workers probes
+        (or hedged races) run concurrently as tasks on the running
+        event loop.
+        """
+        candidates = list(self._candidates(name=name))
+        if self.hedge_delay is not None:
+            hosts = list(_collections.OrderedDict.fromkeys(
+                host for _, host in candidates))
+            calls = [
+                (host, _functools.partial(self._race_async, host))
+                for host in hosts
+            ]
+        else:
+            calls = [
+                (host, _functools.partial(self._fetch_async, protocol, host))
+                for protocol, host in candidates
+            ]
+        tasks = []
+        if self.max_workers > 1 and len(calls) > 1:
+            semaphore = _asyncio.Semaphore(self.max_workers)
+
+            async def limited(call):
+                async with semaphore:
+                    return await call()
+
+            tasks = [
+                _asyncio.ensure_future(limited(call=call))
+                for _, call in calls
+            ]
+        try:
+            hosts = set()
+            for i, (host, call) in enumerate(calls):
+                if host in hosts:
+                    continue  # already resolved via another protocol
+                if tasks:
+                    fetched = await tasks[i]
+                else:
+                    fetched = await call()
+                if fetched is None:
                     continue
+                hosts.add(host)
+                for reference in self._references(fetched=fetched):
+                    yield reference
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _race_async(self, host):
+        """The asyncio counterpart of _race()."""
+        order = {}
+        pending = set()
+        try:
+            for i, protocol in enumerate(self.protocols):
+                task = _asyncio.ensure_future(
+                    self._fetch_async(protocol=protocol, host=host))
+                order[task] = i
+                pending.add(task)
+                if i + 1 < len(self.protocols):
+                    timeout = self.hedge_delay
+                else:
+                    timeout = None
+                fetched = await _first_success_async(
+                    pending=pending, order=order, timeout=timeout)
+                if fetched is not None:
+                    return fetched
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _references(self, fetched):
+        ref_engines_object = fetched['json']
+        _LOGGER.debug(
+            'received ref-engine discovery object:\n{}'.format(
+                _pprint.pformat(ref_engines_object)))
+        try:
+            yield from _yield_from_ref_engines_object(
+                ref_engines_object=ref_engines_object,
+                uri=fetched['uri'],
+            )
+        except ValueError as error:
+            _LOGGER.warning(error)
+
+
+def _first_success(pending, order, timeout):
+    """Wait for the first successful fetch among pending futures.
+
+    Returns None if they all fail, or if timeout passes first.
+    Finished futures are removed from pending, and when several
+    finish together, the one with the lowest order wins.
+    """
+    if timeout is not None:
+        expires = _time.monotonic() + timeout
+    while pending:
+        wait = None
+        if timeout is not None:
+            wait = max(expires - _time.monotonic(), 0)
+        done, _ = _futures.wait(
+            pending, timeout=wait, return_when=_futures.FIRST_COMPLETED)
+        if not done:
+            return None
+        pending.difference_update(done)
+        for future in sorted(done, key=order.get):
+            fetched = future.result()
+            if fetched is not None:
+                return fetched
+    return None
+
+
+async def _first_success_async(pending, order, timeout):
+    """The asyncio counterpart of _first_success()."""
+    loop = _asyncio.get_running_loop()
+    if timeout is not None:
+        expires = loop.time() + timeout
+    while pending:
+        wait = None
+        if timeout is not None:
+            wait = max(expires - loop.time(), 0)
+        done, _ = await _asyncio.wait(
+            pending, timeout=wait, return_when=_asyncio.FIRST_COMPLETED)
+        if not done:
+            return None
+        pending.difference_update(done)
+        for task in sorted(done, key=order.get):
+            fetched = task.result()
+            if fetched is not None:
+                return fetched
+    return None
@@ -18,7 +18,10 @@ import os as _os
 import pathlib as _pathlib
 import pprint as _pprint
 import re as _re
+import threading as _threading
+import time as _time
 
+from . import regexp_set as _regexp_set
 from . import yield_from_ref_engines_object as _yield_from_ref_engines_object
 
 
@@ -44,32 +47,105 @@ def config_paths(path):
         yield _os.path.join(dirname, path)
 
 
+def cache_path(path):
+    """Return $XDG_CACHE_HOME/path.
+
+    The path will be returned regardless of whether it exists on the
+    filesystem.
+    """
+    default_home = _os.path.join(_os.path.expanduser('~'), '.cache')
+    home = _os.environ.get('XDG_CACHE_HOME', default_home)
+    return _os.path.join(home, path)
+
+
+def runtime_path(path):
+    """Return $XDG_RUNTIME_DIR/path.
+
+    Falls back to cache_path(path) when $XDG_RUNTIME_DIR is not set.
+    The path will be returned regardless of whether it exists on the
+    filesystem.
+    """
+    runtime_dir = _os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir:
+        return cache_path(path=path)
+    return _os.path.join(runtime_dir, path)
+
+
+def _signature(path):
+    """Return a value which changes when the file at path changes."""
+    try:
+        stat = _os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class _State(object):
+    """A consistent snapshot of the merged config and its regexps."""
+    def __init__(self, config, regexps):
+        self.config = config
+        self.regexps = regexps
+
+
 class Engine(object):
-    def __init__(self, subdir='oci-discovery'):
+    """Ref-engine discovery from $XDG_CONFIG_DIRS configuration.
+
+    If reload_interval is set, lookups check for configuration
+    changes (see reload()) when more than that many seconds have
+    passed since the last check.  The check runs in a background
+    thread, so lookups never wait for the file system: they use the
+    configuration they find, and later lookups see any changes.
+    """
+    def __init__(self, subdir='oci-discovery', reload_interval=None):
         self.subdir = subdir
+        self.reload_interval = reload_interval
+        self._lock = _threading.Lock()
+        self._files = {}  # path -> (signature, parsed config or None)
+        self._compiled = {}  # key -> compiled regexp, or None if invalid
+        self._checked = None
+        self._state = None
+        self._reloader = None  # the latest background reload thread
         self.load_config()
 
-    def merged_config(self):
-        config = {}
+    @property
+    def _config(self):
+        return self._state.config
+
+    @property
+    def _regexps(self):
+        return self._state.regexps
+
+    def _paths(self):
         tail = _os.path.join(self.subdir, 'ref-engine-discovery.json')
-        for path in config_paths(path=tail):
-            uri = _pathlib.PurePath(path).as_uri()
-            path = _os.path.abspath(path)
-            try:
-                with open(path) as f:
-                    this_config = _json.load(f)
-            except FileNotFoundError:
-                continue
-            except ValueError as error:
-                _LOGGER.warning('{} returned invalid JSON: {}'.format(uri, error))
-                continue
-            if not isinstance(this_config, dict):
-                media_type = 'application/vnd.oci.regexp-ref-engines.v1+json'
-                _LOGGER.warning(
-                    '{} claimed to return {} but actually returned {}'
-                    .format(uri, media_type, this_config),
-                )
+        return list(config_paths(path=tail))
+
+    def _read(self, path):
+        """Return the config object from path, or None."""
+        uri = _pathlib.PurePath(path).as_uri()
+        path = _os.path.abspath(path)
+        try:
+            with open(path) as f:
+                this_config = _json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as error:
+            _LOGGER.warning('{} returned invalid JSON: {}'.format(uri, error))
+            return None
+        if not isinstance(this_config, dict):
+            media_type = 'application/vnd.oci.regexp-ref-engines.v1+json'
+            _LOGGER.warning(
+                '{} claimed to return {} but actually returned {}'
+                .format(uri, media_type, this_config),
+            )
+            return None
+        return this_config
+
+    def _merge(self, files):
+        config = {}
+        for path, this_config in files:
+            if this_config is None:
                 continue
+            uri = _pathlib.PurePath(path).as_uri()
             for key, value in sorted(this_config.items()):
                 if key in config:
                     continue
@@ -80,36 +156,124 @@ class Engine(object):
                 }
         return config
 
+    def merged_config(self):
+        return self._merge(files=[
+            (path, self._read(path=path)) for path in self._paths()
+        ])
+
     def load_config(self):
-        self._config = self.merged_config()
-        keys = sorted(
-            self._config.keys(),
-            key=lambda key: (-len(key), key),
-        )
-        self._regexps = []
+        """Read every configuration file and compile every key."""
+        with self._lock:
+            self._files = {}
+            self._compiled = {}
+            self._update()
+
+    def reload(self):
+        """Pick up configuration changes, returning True if there were any.
+
+        Only files whose inode, size, or mtime changed are read again,
+        and only new keys are compiled.  The new configuration replaces
+        the old one in a single assignment, so concurrent lookups see
+        either the old or the new configuration, never a mix.  If
+        another thread is already reloading, this returns False
+        immediately instead of waiting for it.
+        """
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            return self._update()
+        finally:
+            self._lock.release()
+
+    def _reload_in_background(self):
+        """Start a reload() thread, unless one is already running."""
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = _time.monotonic()
+            thread = _threading.Thread(
+                target=self._background_reload, daemon=True)
+            thread.start()
+        except BaseException:
+            self._lock.release()
+            raise
+        self._reloader = thread
+
+    def _background_reload(self):
+        try:
+            self._update()
+        except Exception as error:
+            _LOGGER.warning('failed to reload configuration ({})'.format(
+                error))
+        finally:
+            self._lock.release()
+
+    def _update(self):
+        self._checked = _time.monotonic()
+        files = {}
+        for path in self._paths():
+            signature = _signature(path=path)
+            previous = self._files.get(path)
+            if previous is not None and previous[0] == signature:
+                files[path] = previous
+            else:
+                files[path] = (signature, self._read(path=path))
+        changed = (
+            self._state is None or
+            list(files.items()) != list(self._files.items()))
+        self._files = files
+        if not changed:
+            return False
+        config = self._merge(files=[
+            (path, this_config) for path, (_, this_config) in files.items()
+        ])
+        keys = sorted(config.keys(), key=lambda key: (-len(key), key))
+        compiled = {}
+        regexps = []
         for key in keys:
-            try:
-                regexp = _re.compile(key)
-            except Exception as error:
-                _LOGGER.warning('invalid regular expression {!r}'.format(key))
-                continue
-            self._regexps.append((key, regexp))
+            if key in self._compiled:
+                regexp = self._compiled[key]
+            else:
+                try:
+                    regexp = _re.compile(key)
+                except Exception as error:
+                    _LOGGER.warning(
+                        'invalid regular expression {!r}'.format(key))
+                    regexp = None
+            compiled[key] = regexp
+            if regexp is not None:
+                regexps.append((key, regexp))
+        self._compiled = compiled
+        self._state = _State(
+            config=config, regexps=_regexp_set.RegexpSet(regexps=regexps))
+        return True
 
     def ref_engines(self, name):
         """Resolve an image name to a Merkle root.
 
         Implementing xdg-ref-engine-discovery.md
         """
-        for key, regexp in self._regexps:
-            if regexp.search(name):
-                config = self._config[key]
-                _LOGGER.debug('{!r} matched {!r} from {}'.format(
-                    name, key, config['uri']))
-                _LOGGER.debug(
-                    'matched ref-engine discovery object:\n{}'.format(
-                        _pprint.pformat(config['ref_engines_object'])))
-                try:
-                    yield from _yield_from_ref_engines_object(**config)
-                except ValueError as error:
-                    _LOGGER.warning(error)
-                    continue
+        if (self.reload_interval is not None and
+                _time.monotonic() - self._checked >= self.reload_interval):
+            self._reload_in_background()
+        state = self._state
+        for key in state.regexps.search(name=name):
+            config = state.config[key]
+            _LOGGER.debug('{!r} matched {!r} from {}'.format(
+                name, key, config['uri']))
+            _LOGGER.debug(
+                'matched ref-engine discovery object:\n{}'.format(
+                    _pprint.pformat(config['ref_engines_object'])))
+            try:
+                yield from _yield_from_ref_engines_object(**config)
+            except ValueError as error:
+                _LOGGER.warning(error)
+                continue
+
+    async def ref_engines_async(self, name):
+        """The asyncio counterpart of ref_engines().
+
+        The configuration is already in memory, so this never blocks.
+        """
+        for reference in self.ref_engines(name=name):
+            yield reference
@@ -12,23 +12,223 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""RFC 6570 URI Templates, up to level 4.
+
+https://tools.ietf.org/html/rfc6570
+"""
+
+import collections.abc as _collections_abc
+import functools as _functools
+import re as _re
+import urllib.parse as _urllib_parse
+
+
+_EXPRESSION = _re.compile(r'{([^{}]*)}')
+_VARSPEC = _re.compile(
+    r'^((?:[A-Za-z0-9_]|%[0-9A-Fa-f]{2})(?:\.?(?:[A-Za-z0-9_]|%[0-9A-Fa-f]{2}))*)'
+    r'(?::([1-9][0-9]{0,3})|(\*))?$')
+_PCT_ENCODED = _re.compile(r'(%[0-9A-Fa-f]{2})')
+_SCHEME = _re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+
+_RESERVED = ":/?#[]@!$&'()*+,;="
+
+# Templates kept by compile().
+MAX_COMPILED = 256
+
+# operator: (first, separator, named, if_empty, allow_reserved), from
+# https://tools.ietf.org/html/rfc6570#appendix-A
+_OPERATORS = {
+    '': ('', ',', False, '', False),
+    '+': ('', ',', False, '', True),
+    '#': ('#', ',', False, '', True),
+    '.': ('.', '.', False, '', False),
+    '/': ('/', '/', False, '', False),
+    ';': (';', ';', True, '', False),
+    '?': ('?', '&', True, '=', False),
+    '&': ('&', '&', True, '=', False),
+}
+
+
+class _Items(tuple):
+    """Frozen (key, value) pairs of an associative array value."""
+
+
+def _freeze(value):
+    """Return a hashable version of a variable value.
+
+    Lists become tuples and mappings become _Items, preserving their
+    order.  Undefined values (None and empty lists or mappings)
+    become None.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, _collections_abc.Mapping):
+        return _Items(
+            (str(key), _freeze_scalar(item)) for key, item in value.items()
+        ) or None
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_scalar(item) for item in value) or None
+    return str(value)
+
+
+def _freeze_scalar(value):
+    if value is None:
+        return ''
+    return str(value)
+
+
+def _quote_unreserved(value):
+    return _urllib_parse.quote(value, safe='')
+
+
+def _quote_reserved(value):
+    # keep existing pct-encoded triplets, but encode other '%'s
+    return ''.join(
+        part if i % 2 else _urllib_parse.quote(part, safe=_RESERVED)
+        for i, part in enumerate(_PCT_ENCODED.split(value)))
+
+
+class _Expression(object):
+    def __init__(self, expression):
+        operator = expression[:1]
+        if operator in _OPERATORS:
+            expression = expression[1:]
+        elif operator in '=,!@|':
+            raise ValueError(
+                'reserved operator {!r} in {{{}}}'.format(operator, expression))
+        else:
+            operator = ''
+        (self.first, self.separator, self.named, self.if_empty,
+         allow_reserved) = _OPERATORS[operator]
+        if allow_reserved:
+            self.quote = _quote_reserved
+        else:
+            self.quote = _quote_unreserved
+        self.varspecs = []
+        for varspec in expression.split(','):
+            match = _VARSPEC.match(varspec)
+            if not match:
+                raise ValueError('invalid variable {!r} in {{{}}}'.format(
+                    varspec, operator + expression))
+            name, prefix, explode = match.groups()
+            self.varspecs.append(
+                (name, int(prefix) if prefix else None, bool(explode)))
+
+    def expand(self, variables):
+        quote = self.quote
+        named = self.named
+        parts = []
+        for name, prefix, explode in self.varspecs:
+            value = variables.get(name)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                if prefix is not None:
+                    value = value[:prefix]
+                if named:
+                    if value:
+                        parts.append('{}={}'.format(name, quote(value)))
+                    else:
+                        parts.append(name + self.if_empty)
+                else:
+                    parts.append(quote(value))
+                continue
+            # prefixes are not applicable to composite values, so they
+            # are ignored.
+            if isinstance(value, _Items):
+                pairs = [(quote(key), quote(item)) for key, item in value]
+                if explode:
+                    parts.append(self.separator.join(
+                        '{}={}'.format(key, item) if item or not named
+                        else key + self.if_empty
+                        for key, item in pairs))
+                    continue
+                joined = ','.join(
+                    '{},{}'.format(key, item) for key, item in pairs)
+            else:
+                items = [quote(item) for item in value]
+                if explode:
+                    if named:
+                        parts.append(self.separator.join(
+                            '{}={}'.format(name, item) if item
+                            else name + self.if_empty
+                            for item in items))
+                    else:
+                        parts.append(self.separator.join(items))
+                    continue
+                joined = ','.join(items)
+            if named:
+                parts.append('{}={}'.format(name, joined))
+            else:
+                parts.append(joined)
+        if not parts:
+            return ''
+        return self.first + self.separator.join(parts)
+
+
 class URITemplate(object):
-    """Stub implementation of uritemplate's URITemplate.
+    """A compiled RFC 6570 URI Template.
 
-    https://pypi.python.org/pypi/uritemplate
+    The template is parsed once, and the most recent max_cached
+    expansions are memoized.  If base is set, expansions are resolved
+    against it (as urllib.parse.urljoin does), unless the template
+    is already absolute.  Aside from base, this mirrors uritemplate's
+    URITemplate (https://pypi.python.org/pypi/uritemplate).
     """
-    def __init__(self, uri):
+    def __init__(self, uri, base=None, max_cached=256):
         self.uri = uri
+        self._parts = []
+        position = 0
+        for match in _EXPRESSION.finditer(uri):
+            self._literal(uri[position:match.start()])
+            self._parts.append(_Expression(expression=match.group(1)))
+            position = match.end()
+        self._literal(uri[position:])
+        self.variable_names = tuple(sorted({
+            name
+            for part in self._parts
+            if isinstance(part, _Expression)
+            for name, _, _ in part.varspecs
+        }))
+        if base and _SCHEME.match(uri):
+            base = None  # urljoin would return the expansion unchanged
+        self.base = base
+        self._cached = _functools.lru_cache(maxsize=max_cached)(self._expand)
+
+    def _literal(self, literal):
+        if '{' in literal or '}' in literal:
+            raise ValueError('unbalanced braces in {}'.format(self.uri))
+        if literal:
+            self._parts.append(literal)
 
     def __str__(self):
         return self.uri
 
-    def expand(self, **kwargs):
-        # Basic URI Templates match Python's str.format() syntax, just
-        # try that.
-        try:
-            return self.uri.format(**kwargs)
-        except KeyError as error:
-            raise ValueError(
-                'failed to format {}'.format(self.uri)
-            ) from error
+    def expand(self, var_dict=None, **kwargs):
+        variables = {}
+        if var_dict:
+            variables.update(var_dict)
+        variables.update(kwargs)
+        return self._cached(tuple(
+            _freeze(variables.get(name)) for name in self.variable_names))
+
+    def _expand(self, key):
+        variables = dict(zip(self.variable_names, key))
+        uri = ''.join(
+            part if isinstance(part, str) else part.expand(variables)
+            for part in self._parts)
+        if self.base:
+            uri = _urllib_parse.urljoin(base=self.base, url=uri)
+        return uri
+
+
+@_functools.lru_cache(maxsize=MAX_COMPILED)
+def compile(uri, base=None):
+    """Return a shared URITemplate for uri and base.
+
+    Ref and CAS engines are constructed for every resolution, so
+    their templates come from here.  Each distinct template is then
+    parsed once, and its memoized expansions are shared by every
+    engine which uses it.
+    """
+    return URITemplate(uri=uri, base=base)
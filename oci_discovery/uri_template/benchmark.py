@@ -0,0 +1,91 @@
+# Copyright 2017 oci-discovery contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Micro-benchmarks for URI Template expansion.
+
+Run with:
+
+  $ python3 -m oci_discovery.uri_template.benchmark
+
+The uritemplate package is included in the comparison when it is
+installed.
+"""
+
+import time
+import urllib.parse
+
+try:
+    import uritemplate
+except ImportError:
+    uritemplate = None
+
+from . import URITemplate
+
+
+_TEMPLATE = 'oci-index/{path}{?fragment}'
+_BASE = 'https://example.com/.well-known/oci-host-ref-engines'
+
+
+def _names(count):
+    return [
+        {'host': 'example.com', 'path': 'app{}'.format(i % 50), 'fragment': '1.0'}
+        for i in range(count)
+    ]
+
+
+def expand(count=100000, repeat=5):
+    """Compare expanding and joining _TEMPLATE for count names.
+
+    The names repeat every 50, like a batch of tags for a few
+    repositories.
+    """
+    builtin = URITemplate(uri=_TEMPLATE, base=_BASE)
+    uncached = URITemplate(uri=_TEMPLATE, base=_BASE, max_cached=0)
+    functions = [
+        ('builtin', lambda name: builtin.expand(**name)),
+        ('builtin uncached', lambda name: uncached.expand(**name)),
+    ]
+    if uritemplate is not None:
+        external = uritemplate.URITemplate(_TEMPLATE)
+        functions.append((
+            'uritemplate',
+            lambda name: urllib.parse.urljoin(
+                base=_BASE, url=external.expand(**name))))
+    names = _names(count=count)
+    return {
+        label: _best(function=function, names=names, repeat=repeat)
+        for label, function in functions
+    }
+
+
+def _best(function, names, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name in names:
+            function(name)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    results = expand()
+    if uritemplate is None:
+        print('uritemplate is not installed, skipping it')
+    for label, seconds in sorted(results.items(), key=lambda item: item[1]):
+        print('expand 100000 names: {} {:.3f}s'.format(label, seconds))
+
+
+if __name__ == '__main__':
+    main()
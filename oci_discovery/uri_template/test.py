@@ -22,6 +22,7 @@ except ImportError:
 
 
 from . import URITemplate
+from . import compile
 
 
 class TestURITemplate(unittest.TestCase):
@@ -189,86 +190,59 @@ class TestURITemplate(unittest.TestCase):
                         else:
                             self.assertEqual(expanded, expected)
 
-    def test_stub(self):
+    def test_builtin(self):
         self._run(
             cls=URITemplate,
-            exceptions={
-                '?fixed=yes{&x}',
-                '?{undef,y}',
-                '?{x,empty}',
-                '?{x,undef}',
-                'O{undef}X',
-                'X{.keys*}',
-                'X{.keys}',
-                'X{.list*}',
-                'X{.list}',
-                'X{.var:3}',
-                'X{.var}',
-                'X{.x,y}',
-                'here?ref={+path}',
-                'map?{x,y}',
-                '{#keys*}',
-                '{#keys}',
-                '{#list*}',
-                '{#list}',
-                '{#path,x}/here',
-                '{#path:6}/here',
-                '{#x,hello,y}',
-                '{&keys*}',
-                '{&keys}',
-                '{&list*}',
-                '{&list}',
-                '{&var:3}',
-                '{&x,y,empty}',
-                '{+hello}',
-                '{+keys*}',
-                '{+keys}',
-                '{+list*}',
-                '{+list}',
-                '{+path,x}/here',
-                '{+path:6}/here',
-                '{+path}/here',
-                '{+var}',
-                '{+x,hello,y}',
-                '{/keys*}',
-                '{/keys}',
-                '{/list*,path:4}',
-                '{/list*}',
-                '{/list}',
-                '{/var,x}/here',
-                '{/var:1,var}',
-                '{/var}',
-                '{;hello:5}',
-                '{;keys*}',
-                '{;keys}',
-                '{;list*}',
-                '{;list}',
-                '{;x,y,empty}',
-                '{;x,y}',
-                '{?keys*}',
-                '{?keys}',
-                '{?list*}',
-                '{?list}',
-                '{?var:3}',
-                '{?x,y,empty}',
-                '{?x,y}',
-                '{keys*}',
-                '{list*}',
-                '{undef,y}',
-                '{x,hello,y}',
-                '{x,y}',
-            },
             wrong_values={
-                'X#{hello}',
-                '{half}',
-                '{hello}',
-                '{keys}',
-                '{list}',
-                '{var:30}',
-                '{var:3}',
+                'X#{hello}',  # RFC 6570 has X{#hello}
             },
         )
 
+    def test_base(self):
+        for template, base, expected in [
+                    ('index.json', 'https://example.com/a/', 'https://example.com/a/index.json'),
+                    ('/{path}', 'https://example.com/a/', 'https://example.com/b%2Fc'),
+                    ('{+path}', 'https://example.com/a/', 'https://example.com/a/b/c'),
+                    ('https://{host}/', 'https://example.com/a/', 'https://b.example.com/'),
+                ]:
+            with self.subTest(template=template, base=base):
+                obj = URITemplate(uri=template, base=base)
+                self.assertEqual(
+                    obj.expand(path='b/c', host='b.example.com'), expected)
+
+    def test_variable_names(self):
+        self.assertEqual(
+            URITemplate(uri='{a}{+b,a}x{?c*,d:3}').variable_names,
+            ('a', 'b', 'c', 'd'))
+
+    def test_cache(self):
+        obj = URITemplate(uri='{var}{/list*}', max_cached=1)
+        for variables, expected in [
+                    ({'var': 'a', 'list': ['b', 'c']}, 'a/b/c'),
+                    ({'var': 'a', 'list': ['b', 'c'], 'unused': 1}, 'a/b/c'),
+                    ({'var': 'a', 'list': ['c']}, 'a/c'),
+                    ({'var': 1}, '1'),
+                ]:
+            with self.subTest(variables=variables):
+                self.assertEqual(obj.expand(**variables), expected)
+                self.assertEqual(obj.expand(variables), expected)
+        info = obj._cached.cache_info()
+        self.assertEqual((info.hits, info.misses), (5, 3))
+
+    def test_compile(self):
+        template = compile(uri='/a/{name}', base='https://example.com/')
+        self.assertIs(
+            compile(uri='/a/{name}', base='https://example.com/'), template)
+        self.assertIsNot(
+            compile(uri='/a/{name}', base='https://example.net/'), template)
+        self.assertEqual(
+            template.expand(name='b'), 'https://example.com/a/b')
+
+    def test_invalid(self):
+        for template in ['{', '}', '{a', '{=a}', '{a b}', '{a:0}', '{a,}', '{.a.}']:
+            with self.subTest(template=template):
+                self.assertRaises(ValueError, URITemplate, uri=template)
+
     @unittest.skipIf(uritemplate is None, 'failed to import uritemplate')
     def test_external(self):
         self._run(